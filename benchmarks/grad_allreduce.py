@@ -0,0 +1,136 @@
+"""
+    Benchmark gradient all-reduce options of `agent_gradient_update`.
+
+    python benchmarks/grad_allreduce.py --num-devices 2 4 8
+
+    Each device count runs in a subprocess, since the number of (virtual CPU)
+    devices is fixed at jax initialization.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+VARIANTS = {
+    "pmean": dict(bucket_size=None, comm_dtype=None),
+    "bucketed": dict(bucket_size=4096, comm_dtype=None),
+    "bf16": dict(bucket_size=None, comm_dtype="bfloat16"),
+    "bucketed_bf16": dict(bucket_size=4096, comm_dtype="bfloat16"),
+}
+
+
+def run_benchmark(num_minibatches: int, minibatch_size: int, obs_size: int,
+                  action_size: int, repeats: int) -> dict:
+    import jax
+    import jax.numpy as jnp
+    import jax.tree_util as jtu
+    import optax
+
+    from evorl.distributed import PMAP_AXIS_NAME
+    from evorl.distributed.gradients import gradient_update
+    from evorl.networks import make_policy_network, make_value_network
+
+    num_devices = jax.device_count()
+    actor, actor_init = make_policy_network(action_size*2, obs_size)
+    critic, critic_init = make_value_network(obs_size)
+    params = dict(actor=actor_init(jax.random.PRNGKey(0)),
+                  critic=critic_init(jax.random.PRNGKey(1)))
+    optimizer = optax.adam(3e-4)
+    opt_state = optimizer.init(params)
+
+    def loss_fn(params, obs):
+        a = actor.apply(params['actor'], obs)
+        v = critic.apply(params['critic'], obs)
+        return jnp.mean(a**2) + jnp.mean(v**2)
+
+    obs = jax.random.normal(
+        jax.random.PRNGKey(2),
+        (num_devices, num_minibatches, minibatch_size, obs_size))
+    params, opt_state = jax.device_put_replicated(
+        (params, opt_state), jax.devices())
+
+    num_leaves = len(jtu.tree_leaves(params))
+    results = {}
+    for name, options in VARIANTS.items():
+        comm_dtype = options['comm_dtype']
+        update_fn = gradient_update(
+            loss_fn, optimizer, pmap_axis_name=PMAP_AXIS_NAME,
+            bucket_size=options['bucket_size'],
+            comm_dtype=None if comm_dtype is None else jnp.dtype(comm_dtype))
+
+        def _step(opt_state, params, obs):
+            def _minibatch_step(carry, obs):
+                opt_state, params = carry
+                loss, params, opt_state = update_fn(
+                    opt_state, params, params, obs)
+                return (opt_state, params), loss
+            (opt_state, params), losses = jax.lax.scan(
+                _minibatch_step, (opt_state, params), obs)
+            return opt_state, params, losses.mean()
+
+        step = jax.pmap(_step, axis_name=PMAP_AXIS_NAME)
+
+        # compile
+        jax.block_until_ready(step(opt_state, params, obs))
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            out = step(opt_state, params, obs)
+        jax.block_until_ready(out)
+        elapsed = (time.perf_counter() - start) / repeats
+
+        results[name] = dict(
+            step_time_ms=elapsed*1e3,
+            minibatch_updates_per_sec=num_minibatches/elapsed,
+            loss=float(out[2][0]),
+        )
+
+    return dict(num_devices=num_devices, num_param_leaves=num_leaves,
+                results=results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-devices", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--num-minibatches", type=int, default=32)
+    parser.add_argument("--minibatch-size", type=int, default=256)
+    parser.add_argument("--obs-size", type=int, default=27)
+    parser.add_argument("--action-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--worker", action="store_true",
+                        help="internal: run in the current process")
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_benchmark(args.num_minibatches, args.minibatch_size,
+                               args.obs_size, args.action_size, args.repeats)
+        print(json.dumps(result))
+        return
+
+    for num_devices in args.num_devices:
+        env = dict(os.environ)
+        env["XLA_FLAGS"] = env.get("XLA_FLAGS", "") + \
+            f" --xla_force_host_platform_device_count={num_devices}"
+        cmd = [sys.executable, __file__, "--worker",
+               "--num-minibatches", str(args.num_minibatches),
+               "--minibatch-size", str(args.minibatch_size),
+               "--obs-size", str(args.obs_size),
+               "--action-size", str(args.action_size),
+               "--repeats", str(args.repeats)]
+        output = subprocess.run(cmd, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        print(f"#devices={result['num_devices']}, "
+              f"#param_leaves={result['num_param_leaves']}")
+        for name, r in result['results'].items():
+            print(f"  {name:>14s}: {r['step_time_ms']:8.2f} ms/iter, "
+                  f"{r['minibatch_updates_per_sec']:8.1f} updates/s, "
+                  f"loss={r['loss']:.5f}")
+
+
+if __name__ == "__main__":
+    main()
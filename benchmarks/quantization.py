@@ -0,0 +1,170 @@
+"""
+    Return degradation and evaluation speed of the quantized policy networks
+    against the float32 policy, on the Brax envs in configs/env/brax.
+
+    python benchmarks/quantization.py --output quantization_report.json
+    python benchmarks/quantization.py --runs outputs/ppo-ant outputs/ppo-hopper
+
+    Without `--runs`, each env is evaluated with a freshly initialized A2C
+    policy (only the numerical error is meaningful). With `--runs`, the
+    `agent_state` of the latest checkpoint of each training run is restored
+    and evaluated with the evaluator of the run's config.
+
+    All modes of a policy are evaluated on the same episodes (same keys).
+    We report the mean return, its relative change to float32, the max
+    absolute action error on standard normal observations, the bytes of the
+    policy params and the latency of a jitted `evaluate` call.
+"""
+import os
+os.environ.setdefault('JAX_PLATFORMS', 'cpu')  # noqa
+
+import argparse
+import dataclasses
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+from omegaconf import OmegaConf
+
+
+SEED = 42
+CONFIG_DIR = Path(__file__).resolve().parent.parent/'configs'
+MODES = ('float32', 'int8', 'bfloat16')
+
+
+def _params_nbytes(params) -> int:
+    return sum(x.size * x.dtype.itemsize for x in jax.tree_util.tree_leaves(params))
+
+
+def _env_configs(env_names: Optional[Sequence[str]]) -> Iterator[Tuple[str, int]]:
+    for path in sorted((CONFIG_DIR/'env'/'brax').glob('*.yaml')):
+        env_config = OmegaConf.load(path)
+        if env_names and env_config.env_name not in env_names:
+            continue
+        yield env_config.env_name, env_config.max_episode_steps
+
+
+def _init_policies(args) -> Iterator[Tuple[str, str, Any, Any]]:
+    from evorl.agents.a2c import A2CAgent
+    from evorl.envs import create_env
+    from evorl.evaluator import Evaluator
+
+    for env_name, max_episode_steps in _env_configs(args.envs):
+        max_episode_steps = min(max_episode_steps, args.max_episode_steps)
+        env = create_env(
+            env_name, 'brax', episode_length=max_episode_steps,
+            parallel=args.num_episodes, autoreset=False)
+        agent = A2CAgent(
+            action_space=env.action_space, obs_space=env.obs_space,
+            actor_hidden_layer_sizes=(256, 256),
+            critic_hidden_layer_sizes=(256, 256),
+            continuous_action=True)
+        agent_state = agent.init(jax.random.PRNGKey(SEED))
+        evaluator = Evaluator(
+            env=env, agent=agent, max_episode_steps=max_episode_steps)
+        yield env_name, 'init', evaluator, agent_state
+
+
+def _restored_policies(args) -> Iterator[Tuple[str, str, Any, Any]]:
+    import hydra
+    from evorl.utils.checkpoint import restore_checkpoint
+
+    for run in args.runs:
+        config = OmegaConf.load(Path(run)/'.hydra'/'config.yaml')
+        workflow_cls = hydra.utils.get_class(config.workflow_cls)
+        workflow = workflow_cls.build_from_config(config, enable_jit=False)
+        state = workflow.init(jax.random.PRNGKey(SEED))
+        restored, step = restore_checkpoint(
+            run, dict(agent_state=state.agent_state))
+        yield (config.env.env_name, f'{run}@{step}',
+               workflow.evaluator, restored['agent_state'])
+        workflow.close()
+
+
+def evaluate_modes(evaluator, agent_state, num_episodes: int, repeats: int) -> Dict[str, Dict[str, Any]]:
+    from evorl.networks import quantize_policy_network, quantize_policy_params
+    from evorl.sample_batch import SampleBatch
+
+    agent = evaluator.agent
+    eval_key, obs_key = jax.random.split(jax.random.PRNGKey(SEED))
+    obs = jax.random.normal(obs_key, (1024, *agent.obs_space.shape))
+
+    results = {}
+    actions = {}
+    for mode in MODES:
+        if mode == 'float32':
+            qagent, qagent_state = agent, agent_state
+        else:
+            qagent = quantize_policy_network(agent, mode)
+            qagent_state = quantize_policy_params(agent_state, mode)
+        qevaluator = dataclasses.replace(evaluator, agent=qagent)
+
+        evaluate_fn = jax.jit(
+            lambda agent_state, key: qevaluator.evaluate(agent_state, num_episodes, key))
+        returns = evaluate_fn(qagent_state, eval_key).discount_returns
+        returns.block_until_ready()
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            jax.block_until_ready(evaluate_fn(qagent_state, eval_key))
+            latencies.append(time.perf_counter() - start)
+
+        actions[mode], _ = jax.jit(qagent.evaluate_actions)(
+            qagent_state, SampleBatch(obs=obs), eval_key)
+
+        results[mode] = dict(
+            return_mean=float(returns.mean()),
+            return_std=float(returns.std()),
+            params_bytes=_params_nbytes(qagent_state.params.policy_params),
+            eval_latency=float(np.median(latencies)),
+        )
+
+    fp32 = results['float32']
+    for mode, r in results.items():
+        r['return_change'] = (r['return_mean'] - fp32['return_mean']) / \
+            max(abs(fp32['return_mean']), 1e-8)
+        r['max_action_error'] = float(
+            jnp.abs(actions[mode] - actions['float32']).max())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=str, nargs='+', default=None,
+                        help='output dirs of training runs, default: freshly initialized policies')
+    parser.add_argument('--envs', type=str, nargs='+', default=None,
+                        help='only these envs of configs/env/brax (without --runs)')
+    parser.add_argument('--num-episodes', type=int, default=16)
+    parser.add_argument('--max-episode-steps', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args()
+
+    policies = _restored_policies(args) if args.runs else _init_policies(args)
+
+    report = {}
+    for env_name, source, evaluator, agent_state in policies:
+        results = evaluate_modes(
+            evaluator, agent_state, args.num_episodes, args.repeats)
+        report[f'{env_name}[{source}]'] = results
+        for mode, r in results.items():
+            print(f"{env_name:>24s} {mode:>8s}: return {r['return_mean']:10.2f} "
+                  f"± {r['return_std']:8.2f} ({r['return_change']:+7.2%}), "
+                  f"max action err {r['max_action_error']:.2e}, "
+                  f"params {r['params_bytes']/1024:8.1f} KiB, "
+                  f"eval {r['eval_latency']*1e3:9.1f} ms", flush=True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(jax_version=jax.__version__,
+                           devices=[str(d) for d in jax.devices()],
+                           report=report), f, indent=4)
+        print(f"saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
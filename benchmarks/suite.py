@@ -0,0 +1,380 @@
+"""
+    Throughput regression benchmarks on CPU with fixed seeds.
+
+    python benchmarks/suite.py run --output baselines/cpu.json
+    python benchmarks/suite.py run --filter gae rollout --output current.json
+    python benchmarks/suite.py compare baselines/cpu.json current.json --threshold 0.1
+
+    Each case is compiled ahead-of-time, then the compiled function is called
+    `--repeats` times. We report the median latency, the compile time
+    (trace + lower + compile) and the memory from `memory_analysis()`.
+    `compare` exits with 1 when the median latency of any case is slower than
+    the baseline by more than the threshold.
+"""
+import os
+os.environ.setdefault('JAX_PLATFORMS', 'cpu')  # noqa
+
+import argparse
+import functools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import jax
+import jax.numpy as jnp
+
+
+SEED = 42
+CONFIG_DIR = str(Path(__file__).resolve().parent.parent/'configs')
+
+BENCHMARKS = {}
+
+
+def benchmark(sizes: Sequence[Dict[str, int]]):
+    """
+        Register `setup(**size) -> (lower_fn, args)` as a benchmark case,
+        where `lower_fn() -> jax.stages.Lowered` and its compiled function
+        is called with `args`.
+    """
+    def decorator(setup: Callable[..., Tuple[Callable, Tuple]]):
+        BENCHMARKS[setup.__name__] = (setup, sizes)
+        return setup
+    return decorator
+
+
+def _jit_case(fn: Callable, *args):
+    fn = jax.jit(fn)
+    return (lambda: fn.lower(*args)), args
+
+
+def _method_case(obj: Any, name: str, *args):
+    # the jitted method with static `self`, its compiled function only takes args
+    from evorl.cost_analysis import lower_method
+    return (lambda: lower_method(obj, name, *args)), args
+
+
+def _create_env(num_envs: int, autoreset: bool, env_name: str = 'ant'):
+    from evorl.envs import create_env
+    return create_env(env_name, 'brax', parallel=num_envs, autoreset=autoreset)
+
+
+def _random_agent(env):
+    from evorl.agents.random_agent import RandomAgent
+    return RandomAgent(action_space=env.action_space, obs_space=env.obs_space)
+
+
+def _rollout_setup(rollout_fn: Callable, num_envs: int, rollout_length: int, autoreset: bool):
+    env = _create_env(num_envs, autoreset)
+    agent = _random_agent(env)
+    env_key, agent_key, rollout_key = jax.random.split(
+        jax.random.PRNGKey(SEED), 3)
+    return _jit_case(
+        functools.partial(rollout_fn, env, agent, rollout_length=rollout_length),
+        env.reset(env_key), agent.init(agent_key), rollout_key)
+
+
+@benchmark(sizes=[dict(num_envs=16, rollout_length=64), dict(num_envs=128, rollout_length=64)])
+def rollout(num_envs: int, rollout_length: int):
+    from evorl.rollout import rollout
+    return _rollout_setup(rollout, num_envs, rollout_length, autoreset=True)
+
+
+@benchmark(sizes=[dict(num_envs=16, rollout_length=256), dict(num_envs=128, rollout_length=256)])
+def rollout_episode(num_envs: int, rollout_length: int):
+    from evorl.rollout import rollout_episode
+    return _rollout_setup(rollout_episode, num_envs, rollout_length, autoreset=False)
+
+
+@benchmark(sizes=[dict(num_envs=16, rollout_length=256), dict(num_envs=128, rollout_length=256)])
+def rollout_episode_mod(num_envs: int, rollout_length: int):
+    from evorl.rollout import rollout_episode_mod
+    return _rollout_setup(rollout_episode_mod, num_envs, rollout_length, autoreset=False)
+
+
+@benchmark(sizes=[dict(rollout_length=128, num_envs=64), dict(rollout_length=1024, num_envs=256)])
+def compute_gae(rollout_length: int, num_envs: int):
+    from evorl.utils.toolkits import compute_gae
+    k1, k2, k3 = jax.random.split(jax.random.PRNGKey(SEED), 3)
+    rewards = jax.random.normal(k1, (rollout_length, num_envs))
+    values = jax.random.normal(k2, (rollout_length+1, num_envs))
+    dones = (jax.random.uniform(k3, (rollout_length, num_envs))
+             < 0.01).astype(jnp.float32)
+    return _jit_case(
+        functools.partial(compute_gae, gae_lambda=0.95, discount=0.99),
+        rewards, values, dones)
+
+
+@benchmark(sizes=[
+    dict(length=T, batch_size=B, associative=associative)
+    for T in (32, 512, 2048) for B in (64, 2048) for associative in (0, 1)
+])
+def reverse_discounted_cumsum(length: int, batch_size: int, associative: int):
+    # sequential vs. associative scan of GAE / discounted returns
+    from evorl.utils.toolkits import reverse_discounted_cumsum
+    k1, k2 = jax.random.split(jax.random.PRNGKey(SEED))
+    x = jax.random.normal(k1, (length, batch_size))
+    factors = 0.99 * (jax.random.uniform(k2, (length, batch_size)) > 0.01)
+    return _jit_case(
+        functools.partial(reverse_discounted_cumsum,
+                          associative=bool(associative)),
+        x, factors)
+
+
+@benchmark(sizes=[dict(num_envs=8, max_episode_steps=256), dict(num_envs=64, max_episode_steps=256)])
+def evaluator_evaluate(num_envs: int, max_episode_steps: int):
+    from evorl.agents.a2c import A2CAgent
+    from evorl.evaluator import Evaluator
+    env = _create_env(num_envs, autoreset=False)
+    agent = A2CAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        actor_hidden_layer_sizes=(256, 256), critic_hidden_layer_sizes=(256, 256),
+        continuous_action=True)
+    evaluator = Evaluator(
+        env=env, agent=agent, max_episode_steps=max_episode_steps)
+    agent_key, eval_key = jax.random.split(jax.random.PRNGKey(SEED))
+    return _jit_case(
+        lambda agent_state, key: evaluator.evaluate(agent_state, num_envs, key),
+        agent.init(agent_key), eval_key)
+
+
+def _workflow_step_setup(agent_name: str, num_envs: int, rollout_length: int,
+                         overrides: Sequence[str] = ()):
+    import hydra
+    from hydra import compose, initialize_config_dir
+    with initialize_config_dir(config_dir=CONFIG_DIR, version_base=None):
+        config = compose(config_name="config", overrides=[
+            f"agent={agent_name}", "env=brax/ant",
+            f"num_envs={num_envs}", f"rollout_length={rollout_length}",
+            "checkpoint.save_interval_steps=1000000000",
+            *overrides,
+        ])
+    if agent_name == 'ppo':
+        config.minibatch_size = num_envs * rollout_length // 4
+
+    workflow_cls = hydra.utils.get_class(config.workflow_cls)
+    workflow = workflow_cls.build_from_config(config, enable_jit=True)
+    state = workflow.init(jax.random.PRNGKey(SEED))
+
+    return _method_case(workflow, 'step', state)
+
+
+@benchmark(sizes=[dict(num_envs=16, rollout_length=32), dict(num_envs=128, rollout_length=32)])
+def a2c_step(num_envs: int, rollout_length: int):
+    return _workflow_step_setup('a2c', num_envs, rollout_length)
+
+
+@benchmark(sizes=[
+    dict(num_envs=16, rollout_length=32), dict(num_envs=128, rollout_length=32),
+    dict(num_envs=128, rollout_length=32, num_epochs=4),
+])
+def ppo_step(num_envs: int, rollout_length: int, num_epochs: int = 1):
+    return _workflow_step_setup(
+        'ppo', num_envs, rollout_length, overrides=[f"num_epochs={num_epochs}"])
+
+
+@benchmark(sizes=[
+    dict(batch_size=B, quantization=q)
+    for B in (1, 256) for q in ('float32', 'int8', 'bfloat16')
+])
+def policy_inference(batch_size: int, quantization: str):
+    # evaluate_actions of a 256x256 ant policy with quantized weights
+    from evorl.agents.a2c import A2CAgent
+    from evorl.networks import quantize_policy_network, quantize_policy_params
+    from evorl.sample_batch import SampleBatch
+    env = _create_env(1, autoreset=False)
+    agent = A2CAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        actor_hidden_layer_sizes=(256, 256), critic_hidden_layer_sizes=(256, 256),
+        continuous_action=True)
+    agent_key, obs_key, key = jax.random.split(jax.random.PRNGKey(SEED), 3)
+    agent_state = agent.init(agent_key)
+    if quantization != 'float32':
+        agent = quantize_policy_network(agent, quantization)
+        agent_state = quantize_policy_params(agent_state, quantization)
+    obs = jax.random.normal(obs_key, (batch_size, *env.obs_space.shape))
+    return _jit_case(
+        lambda agent_state, obs, key: agent.evaluate_actions(
+            agent_state, SampleBatch(obs=obs), key)[0],
+        agent_state, obs, key)
+
+
+@benchmark(sizes=[
+    dict(pop_size=32, max_episode_steps=64),
+    dict(pop_size=32, max_episode_steps=64, quantization='int8'),
+])
+def ec_step(pop_size: int, max_episode_steps: int, quantization: Optional[str] = None):
+    from evox import algorithms
+    from evorl.agents.ec import DeterministicECAgent
+    from evorl.ec import MOAlgorithmWrapper, MultiObjectiveBraxProblem
+    from evorl.envs import create_wrapped_brax_env
+    from evorl.utils.ec_utils import ParamVectorSpec
+    from evorl.workflows import ECWorkflow
+
+    metric_names = ('reward_forward', 'reward_ctrl')
+    env = create_wrapped_brax_env(
+        'ant', episode_length=max_episode_steps, parallel=2, autoreset=False)
+    agent = DeterministicECAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        actor_hidden_layer_sizes=(32, 32), normalize_obs=False)
+    problem = MultiObjectiveBraxProblem(
+        agent=agent, env=env, num_episodes=2,
+        max_episode_steps=max_episode_steps, discount=1.0,
+        metric_names=metric_names, flatten_objectives=True,
+        quantization=quantization)
+
+    agent_key, workflow_key = jax.random.split(jax.random.PRNGKey(SEED))
+    agent_state = agent.init(agent_key)
+    param_vec_spec = ParamVectorSpec(agent_state.params.policy_params)
+    nsga2 = algorithms.NSGA2(
+        lb=jnp.full(shape=(param_vec_spec.vec_size,), fill_value=-10),
+        ub=jnp.full(shape=(param_vec_spec.vec_size,), fill_value=10),
+        n_objs=len(metric_names),
+        pop_size=pop_size,
+    )
+
+    def _sol_transform(cand):
+        params = agent_state.params.replace(policy_params=cand)
+        return agent_state.replace(params=params)
+
+    workflow = ECWorkflow(
+        algorithm=MOAlgorithmWrapper(algo=nsga2, param_vec_spec=param_vec_spec),
+        problem=problem,
+        opt_direction='max',
+        sol_transforms=[jax.vmap(_sol_transform)],
+    )
+    state = workflow.init(workflow_key)
+
+    return _method_case(workflow, '_step', state)
+
+
+def run_case(setup: Callable, size: Dict[str, int], repeats: int) -> Dict[str, Any]:
+    from evorl.cost_analysis import compiled_cost
+
+    lower_fn, args = setup(**size)
+    start = time.perf_counter()
+    compiled = lower_fn().compile()
+    compile_time = time.perf_counter() - start
+
+    jax.block_until_ready(compiled(*args))  # warmup
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        jax.block_until_ready(compiled(*args))
+        latencies.append(time.perf_counter() - start)
+
+    cost = compiled_cost(compiled)
+    return dict(
+        size=size,
+        median_latency=statistics.median(latencies),
+        min_latency=min(latencies),
+        compile_time=compile_time,
+        argument_size=cost.get('argument_size'),
+        output_size=cost.get('output_size'),
+        temp_size=cost.get('temp_size'),
+    )
+
+
+def case_id(name: str, size: Dict[str, int]) -> str:
+    return name + '[' + ','.join(f"{k}={v}" for k, v in size.items()) + ']'
+
+
+def _metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    return dict(
+        jax_version=jax.__version__,
+        devices=[str(d) for d in jax.devices()],
+        python=platform.python_version(),
+        processor=platform.processor(),
+        cpu_count=os.cpu_count(),
+        git_commit=commit,
+        time=time.strftime('%Y-%m-%d %H:%M:%S'),
+    )
+
+
+def _format_mib(nbytes: Optional[int]) -> str:
+    # None without the XLA memory analysis
+    return f"{'n/a':>8s} MiB" if nbytes is None else f"{nbytes/2**20:8.2f} MiB"
+
+
+def run(args) -> None:
+    results = {}
+    for name, (setup, sizes) in BENCHMARKS.items():
+        if args.filter and not any(f in name for f in args.filter):
+            continue
+        for size in sizes:
+            cid = case_id(name, size)
+            results[cid] = run_case(setup, size, args.repeats)
+            r = results[cid]
+            print(f"{cid:>60s}: {r['median_latency']*1e3:10.3f} ms, "
+                  f"compile {r['compile_time']:7.2f} s, "
+                  f"temp {_format_mib(r['temp_size'])}", flush=True)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open('w') as f:
+        json.dump(dict(meta=_metadata(), results=results), f, indent=4)
+    print(f"saved to {output}")
+
+
+def compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+
+    regressions = []
+    for cid in sorted(baseline.keys() & current.keys()):
+        b, c = baseline[cid], current[cid]
+        ratio = c['median_latency'] / b['median_latency']
+        compile_ratio = c['compile_time'] / b['compile_time']
+        flag = ''
+        if ratio > 1 + args.threshold:
+            flag = '  <-- SLOWER'
+            regressions.append(cid)
+        print(f"{cid:>60s}: {b['median_latency']*1e3:10.3f} -> {c['median_latency']*1e3:10.3f} ms "
+              f"(x{ratio:.2f}), compile x{compile_ratio:.2f}{flag}")
+
+    for cid in sorted(baseline.keys() - current.keys()):
+        print(f"{cid:>60s}: missing in {args.current}")
+
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--output', type=str, default='benchmark_results.json')
+    run_parser.add_argument('--repeats', type=int, default=10)
+    run_parser.add_argument('--filter', type=str, nargs='+', default=None,
+                            help='only run cases whose names contain any of these')
+
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline', type=str)
+    compare_parser.add_argument('current', type=str)
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='flag slowdowns of the median latency beyond this ratio')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+    Python-side trace time of `PPOWorkflow.step`, and the flatten/unflatten
+    time of the `PyTreeDict`-heavy pytrees it traces over.
+
+    python benchmarks/trace_time.py --output trace_time.json
+
+    The step is traced with `jax.make_jaxpr` (no lowering nor compilation),
+    so the time is dominated by the Python code of the workflow, the agent,
+    the env and the pytree (un)flattening. We report the median over
+    `--repeats` traces after a warmup trace.
+"""
+import os
+os.environ.setdefault('JAX_PLATFORMS', 'cpu')  # noqa
+
+import argparse
+import functools
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import jax
+import jax.tree_util as jtu
+
+
+SEED = 42
+CONFIG_DIR = str(Path(__file__).resolve().parent.parent/'configs')
+
+
+def _median_time(fn: Callable, repeats: int) -> float:
+    fn()  # warmup
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _ppo_workflow(env_name: str):
+    import hydra
+    from hydra import compose, initialize_config_dir
+    with initialize_config_dir(config_dir=CONFIG_DIR, version_base=None):
+        config = compose(config_name="config", overrides=[
+            "agent=ppo", f"env=brax/{env_name}",
+            "num_envs=16", "rollout_length=32", "minibatch_size=128",
+            "checkpoint.save_interval_steps=1000000000",
+        ])
+    workflow_cls = hydra.utils.get_class(config.workflow_cls)
+    workflow = workflow_cls.build_from_config(config, enable_jit=False)
+    state = workflow.init(jax.random.PRNGKey(SEED))
+    return workflow, state
+
+
+def trace_time(env_name: str, repeats: int) -> Dict[str, Any]:
+    from evorl.sample_batch import SampleBatch
+    from evorl.types import PyTreeDict
+
+    workflow, state = _ppo_workflow(env_name)
+
+    def trace_step():
+        # a new function each time, to skip the trace cache of jax
+        return jax.make_jaxpr(
+            functools.partial(type(workflow).step, workflow))(state)
+
+    # a one-step transition of the rollout, with nested PyTreeDict extras
+    transition = SampleBatch(
+        obs=state.env_state.obs,
+        rewards=state.env_state.reward,
+        dones=state.env_state.done,
+        extras=PyTreeDict(
+            policy_extras=PyTreeDict(logp=state.env_state.reward),
+            env_extras=PyTreeDict(
+                last_obs=state.env_state.obs,
+                episode_return=state.env_state.reward)
+        )
+    )
+    leaves, treedef = jtu.tree_flatten(state)
+    num_leaves = len(leaves)
+
+    report = dict(
+        num_state_leaves=num_leaves,
+        trace_step=_median_time(trace_step, repeats),
+        flatten_state=_median_time(
+            lambda: jtu.tree_flatten(state), repeats * 100),
+        unflatten_state=_median_time(
+            lambda: jtu.tree_unflatten(treedef, leaves), repeats * 100),
+        tree_map_transition=_median_time(
+            lambda: jtu.tree_map(lambda x: x, transition), repeats * 100),
+        construct_extras=_median_time(
+            lambda: PyTreeDict(
+                policy_extras=dict(logp=1),
+                env_extras=dict(last_obs=2, episode_return=3)),
+            repeats * 100),
+    )
+    workflow.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env', type=str, default='ant')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args()
+
+    report = trace_time(args.env, args.repeats)
+    print(f"PPOWorkflow.step trace: {report['trace_step']*1e3:.1f} ms")
+    for k in ('flatten_state', 'unflatten_state', 'tree_map_transition', 'construct_extras'):
+        print(f"{k}: {report[k]*1e6:.2f} us")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(jax_version=jax.__version__, report=report), f, indent=4)
+        print(f"saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
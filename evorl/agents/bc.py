@@ -0,0 +1,257 @@
+import jax
+import jax.numpy as jnp
+from flax import struct
+import flax.linen as nn
+
+from omegaconf import DictConfig
+
+from evorl.sample_batch import SampleBatch
+from evorl.networks import make_policy_network
+from evorl.utils import running_statistics
+from evorl.distribution import get_categorical_dist
+from evorl.workflows import OfflineRLWorkflow
+from evorl.distributed import agent_gradient_update, psum, get_sharded_size
+from evorl.envs import create_env
+from evorl.evaluator import Evaluator
+from evorl.trajectory_dataset import TrajectoryDataset
+from .agent import Agent, AgentState
+
+from evox import State
+
+import chex
+import optax
+from evorl.types import (
+    LossDict, Action, Params, PolicyExtraInfo, PyTreeDict, pytree_field
+)
+from evorl.metrics import TrainMetric, WorkflowMetric
+from typing import Tuple, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@struct.dataclass
+class BCNetworkParams:
+    """Contains training state for the learner."""
+    policy_params: Params
+
+
+class BCAgent(Agent):
+    """
+        Behaviour cloning: regress the dataset actions (continuous, MSE
+        on tanh actions) or classify them (discrete, cross-entropy).
+    """
+    actor_hidden_layer_sizes: Tuple[int] = (256, 256)
+    normalize_obs: bool = False
+    continuous_action: bool = True
+    policy_network: nn.Module = pytree_field(lazy_init=True)
+    obs_preprocessor: Any = pytree_field(lazy_init=True, pytree_node=False)
+
+    def init(self, key: chex.PRNGKey) -> AgentState:
+        obs_size = self.obs_space.shape[0]
+
+        if self.continuous_action:
+            action_size = self.action_space.shape[0]
+        else:
+            action_size = self.action_space.n
+
+        policy_key, obs_preprocessor_key = jax.random.split(key, 2)
+        policy_network, policy_init_fn = make_policy_network(
+            action_size=action_size,
+            obs_size=obs_size,
+            hidden_layer_sizes=self.actor_hidden_layer_sizes
+        )
+        policy_params = policy_init_fn(policy_key)
+
+        self.set_frozen_attr('policy_network', policy_network)
+
+        if self.normalize_obs:
+            obs_preprocessor = running_statistics.normalize
+            self.set_frozen_attr('obs_preprocessor', obs_preprocessor)
+            dummy_obs = self.obs_space.sample(obs_preprocessor_key)
+            obs_preprocessor_state = running_statistics.init_state(dummy_obs)
+        else:
+            obs_preprocessor_state = None
+
+        return AgentState(
+            params=BCNetworkParams(policy_params=policy_params),
+            obs_preprocessor_state=obs_preprocessor_state
+        )
+
+    def _policy_outputs(self, agent_state: AgentState, obs: chex.Array) -> chex.Array:
+        if self.normalize_obs:
+            obs = self.obs_preprocessor(
+                obs, agent_state.obs_preprocessor_state)
+
+        return self.policy_network.apply(
+            agent_state.params.policy_params, obs)
+
+    def compute_actions(self, agent_state: AgentState, sample_batch: SampleBatch, key: chex.PRNGKey) -> Tuple[Action, PolicyExtraInfo]:
+        """
+            Args:
+                sample_barch: [#env, ...]
+        """
+        raw_actions = self._policy_outputs(agent_state, sample_batch.obs)
+
+        if self.continuous_action:
+            actions = jnp.tanh(raw_actions)
+        else:
+            actions = get_categorical_dist(raw_actions).sample(seed=key)
+
+        return jax.lax.stop_gradient(actions), PyTreeDict()
+
+    def evaluate_actions(self, agent_state: AgentState, sample_batch: SampleBatch, key: chex.PRNGKey) -> Tuple[Action, PolicyExtraInfo]:
+        """
+            Args:
+                sample_barch: [#env, ...]
+        """
+        raw_actions = self._policy_outputs(agent_state, sample_batch.obs)
+
+        if self.continuous_action:
+            actions = jnp.tanh(raw_actions)
+        else:
+            actions = jnp.argmax(raw_actions, axis=-1)
+
+        return jax.lax.stop_gradient(actions), PyTreeDict()
+
+    def loss(self, agent_state: AgentState, sample_batch: SampleBatch, key: chex.PRNGKey) -> LossDict:
+        """
+            Args:
+                sample_barch: [B, ...]
+        """
+        raw_actions = self._policy_outputs(agent_state, sample_batch.obs)
+
+        if self.continuous_action:
+            actions = jnp.clip(sample_batch.actions, -1.0, 1.0)
+            bc_loss = jnp.square(jnp.tanh(raw_actions) - actions).sum(-1).mean()
+        else:
+            actions_dist = get_categorical_dist(raw_actions)
+            bc_loss = -actions_dist.log_prob(sample_batch.actions).mean()
+
+        return PyTreeDict(bc_loss=bc_loss)
+
+
+class BCWorkflow(OfflineRLWorkflow):
+    @classmethod
+    def name(cls):
+        return "BC"
+
+    @staticmethod
+    def _rescale_config(config, devices) -> None:
+        num_devices = len(devices)
+        # the global batch is split over devices by the data loader
+        get_sharded_size(config.batch_size, num_devices, "batch_size")
+        config.num_eval_envs = get_sharded_size(
+            config.num_eval_envs, num_devices, "num_eval_envs")
+
+    @classmethod
+    def _build_from_config(cls, config: DictConfig):
+        max_episode_steps = config.env.max_episode_steps
+
+        dataset = TrajectoryDataset(config.dataset_path)
+
+        eval_env = create_env(
+            config.env.env_name,
+            config.env.env_type,
+            episode_length=max_episode_steps,
+            parallel=config.num_eval_envs,
+            autoreset=False
+        )
+
+        agent = BCAgent(
+            action_space=eval_env.action_space,
+            obs_space=eval_env.obs_space,
+            actor_hidden_layer_sizes=config.agent_network.actor_hidden_layer_sizes,
+            normalize_obs=config.normalize_obs,
+            continuous_action=config.agent_network.continuous_action
+        )
+
+        if (config.optimizer.grad_clip_norm is not None and
+                config.optimizer.grad_clip_norm > 0):
+            optimizer = optax.chain(
+                optax.clip_by_global_norm(config.optimizer.grad_clip_norm),
+                optax.adam(config.optimizer.lr)
+            )
+        else:
+            optimizer = optax.adam(config.optimizer.lr)
+
+        evaluator = Evaluator(
+            env=eval_env, agent=agent, max_episode_steps=max_episode_steps)
+
+        return cls(agent, optimizer, evaluator, dataset, config)
+
+    def step(self, state: State) -> Tuple[TrainMetric, State]:
+        key, learn_key = jax.random.split(state.key)
+        sample_batch = state.batch
+
+        agent_state = state.agent_state
+        if agent_state.obs_preprocessor_state is not None:
+            with jax.named_scope("normalizer_update"):
+                agent_state = agent_state.replace(
+                    obs_preprocessor_state=running_statistics.update(
+                        agent_state.obs_preprocessor_state, sample_batch.obs,
+                        pmap_axis_name=self.pmap_axis_name,
+                        bucket_size=self.grad_comm_options['bucket_size']
+                    )
+                )
+
+        def loss_fn(agent_state, sample_batch, key):
+            loss_dict = self.agent.loss(agent_state, sample_batch, key)
+            return loss_dict.bc_loss, loss_dict
+
+        update_fn = agent_gradient_update(
+            loss_fn,
+            self.optimizer,
+            pmap_axis_name=self.pmap_axis_name,
+            has_aux=True,
+            **self.grad_comm_options)
+
+        with jax.named_scope("gradient_update"):
+            (loss, loss_dict), opt_state, agent_state = update_fn(
+                state.opt_state,
+                agent_state,
+                sample_batch,
+                learn_key
+            )
+
+        with jax.named_scope("metric_reduction"):
+            # #transitions consumed from the dataset
+            sampled_timesteps = psum(sample_batch.obs.shape[0],
+                                     axis_name=self.pmap_axis_name)
+
+            workflow_metrics = WorkflowMetric(
+                sampled_timesteps=state.metrics.sampled_timesteps+sampled_timesteps,
+                iterations=state.metrics.iterations + 1,
+            ).all_reduce(pmap_axis_name=self.pmap_axis_name)
+
+            train_metrics = TrainMetric(
+                loss=loss,
+                raw_loss_dict=loss_dict
+            ).all_reduce(pmap_axis_name=self.pmap_axis_name)
+
+        return train_metrics, state.update(
+            key=key,
+            metrics=workflow_metrics,
+            agent_state=agent_state,
+            opt_state=opt_state
+        )
+
+    def learn(self, state: State) -> State:
+        num_iters = self.config.num_iters
+
+        start_iteration = self._get_iteration(state)
+
+        for i in range(start_iteration, num_iters):
+            self._on_iteration_begin(i)
+            with self.trace_window.step(i):
+                if i > start_iteration:
+                    state = self.next_batch(state)
+                train_metrics, state = self.perf_timer.time(
+                    'step', self.step, state)
+                state = self._on_iteration_end(i, state, train_metrics)
+
+            self.trace_window.maybe_stop(i, state)
+
+        self.metric_aggregator.flush()
+
+        return state
@@ -0,0 +1,606 @@
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import math
+import copy
+import queue
+import threading
+import time
+from functools import partial
+
+from omegaconf import DictConfig, OmegaConf
+
+from evorl.sample_batch import SampleBatch
+from evorl.utils import running_statistics
+from evorl.distribution import get_categorical_dist, get_tanh_norm_dist
+from evorl.utils.jax_utils import tree_stop_gradient
+from evorl.utils.recompilation import track_traces
+from evorl.utils.toolkits import (
+    compute_vtrace, flatten_rollout_trajectory,
+    average_episode_discount_return
+)
+from evorl.workflows import OnPolicyRLWorkflow
+from evorl.distributed import (
+    PMAP_AXIS_NAME, agent_gradient_update, get_sharded_size,
+    split_key_to_devices
+)
+from evorl.envs import create_env
+from evorl.evaluator import Evaluator
+from .agent import AgentState
+from .a2c import A2CAgent, rollout
+
+from evox import State
+
+import orbax.checkpoint as ocp
+import chex
+import optax
+from evorl.types import Action, PolicyExtraInfo, PyTreeDict
+from evorl.metrics import TrainMetric, WorkflowMetric, EvaluateMetric
+from typing import Tuple, Sequence, Optional, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IMPALAAgent(A2CAgent):
+    """
+        A2C-style actor-critic, which records the behaviour policy's logp
+        for the V-trace correction.
+    """
+
+    def _get_actions_dist(self, agent_state: AgentState, obs: chex.Array):
+        if self.normalize_obs:
+            obs = self.obs_preprocessor(
+                obs, agent_state.obs_preprocessor_state)
+
+        raw_actions = self.policy_network.apply(
+            agent_state.params.policy_params, obs)
+
+        if self.continuous_action:
+            return get_tanh_norm_dist(*jnp.split(raw_actions, 2, axis=-1))
+        else:
+            return get_categorical_dist(raw_actions)
+
+    def compute_actions(self, agent_state: AgentState, sample_batch: SampleBatch, key: chex.PRNGKey) -> Tuple[Action, PolicyExtraInfo]:
+        """
+            Args:
+                sample_barch: [#env, ...]
+        """
+        actions_dist = self._get_actions_dist(agent_state, sample_batch.obs)
+        actions = actions_dist.sample(seed=key)
+
+        policy_extras = PyTreeDict(
+            logp=actions_dist.log_prob(actions)
+        )
+
+        return jax.lax.stop_gradient(actions), policy_extras
+
+    def compute_logp(self, agent_state: AgentState, sample_batch: SampleBatch) -> chex.Array:
+        """
+            logp of sample_batch.actions under the current (target) policy.
+        """
+        actions_dist = self._get_actions_dist(agent_state, sample_batch.obs)
+        return actions_dist.log_prob(sample_batch.actions)
+
+
+class UtilizationMeter:
+    """
+        Track the busy time fraction of a worker (actor or learner)
+        between two reports.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._busy = 0.0
+        self._busy_since = None
+        self._start = time.perf_counter()
+
+    def start(self) -> None:
+        with self._lock:
+            self._busy_since = time.perf_counter()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._busy += time.perf_counter() - self._busy_since
+            self._busy_since = None
+
+    def report(self) -> float:
+        with self._lock:
+            now = time.perf_counter()
+            busy = self._busy
+            if self._busy_since is not None:
+                # split the ongoing busy period at the report boundary
+                busy += now - self._busy_since
+                self._busy_since = now
+            utilization = busy / max(now - self._start, 1e-8)
+            self._busy = 0.0
+            self._start = now
+        return utilization
+
+
+class ParamsServer:
+    """
+        Hold the latest learner params. Actors pull a copy on their own device.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agent_state = None
+        self._version = 0
+        self._device_cache = {}
+
+    def publish(self, agent_state: AgentState, version: int) -> None:
+        with self._lock:
+            self._agent_state = agent_state
+            self._version = version
+            self._device_cache = {}
+
+    def pull(self, device: jax.Device) -> Tuple[AgentState, int]:
+        with self._lock:
+            agent_state = self._device_cache.get(device, None)
+            if agent_state is None:
+                agent_state = jax.device_put(self._agent_state, device)
+                self._device_cache[device] = agent_state
+            return agent_state, self._version
+
+
+class IMPALAWorkflow(OnPolicyRLWorkflow):
+    """
+        Decoupled actor/learner workflow (Sebulba-style IMPALA):
+
+        - Actor threads run `rollout` on actor devices with slightly stale
+          params, and push trajectories to a bounded queue.
+        - The learner consumes trajectories on learner devices (pmap over
+          learner devices), and applies the V-trace off-policy correction.
+
+        When only one device is available, actors and the learner share it.
+    """
+
+    @classmethod
+    def name(cls):
+        return "IMPALA"
+
+    @staticmethod
+    def _rescale_config(config, devices) -> None:
+        num_devices = len(devices)
+        # num_envs stays global, it is only split over the learner devices
+        get_sharded_size(config.num_envs, num_devices, "num_envs")
+        config.num_eval_envs = get_sharded_size(
+            config.num_eval_envs, num_devices, "num_eval_envs")
+
+    @classmethod
+    def build_from_config(cls, config: DictConfig, enable_multi_devices: bool = False, devices: Optional[Sequence[jax.Device]] = None, enable_jit: bool = True, enable_multi_seeds: bool = False):
+        """
+            The actor/learner split always uses all given devices.
+            `enable_multi_devices` and `enable_jit` are ignored.
+        """
+        if enable_multi_seeds:
+            raise ValueError(f'{cls.name()} does not support multi seeds')
+        config = copy.deepcopy(config)  # avoid in-place modification
+        if devices is None:
+            devices = jax.local_devices()
+
+        actor_devices, learner_devices = split_actor_learner_devices(
+            devices, config.num_actor_devices)
+
+        OmegaConf.set_readonly(config, False)
+        cls._rescale_config(config, learner_devices)
+        OmegaConf.set_readonly(config, True)
+
+        workflow = cls._build_from_config(config)
+        workflow._setup_devices(actor_devices, learner_devices)
+
+        return workflow
+
+    @classmethod
+    def _build_from_config(cls, config: DictConfig):
+        max_episode_steps = config.env.max_episode_steps
+
+        env = create_env(
+            config.env.env_name,
+            config.env.env_type,
+            episode_length=max_episode_steps,
+            parallel=config.num_envs,
+            autoreset=True,
+            fast_reset=True
+        )
+
+        agent = IMPALAAgent(
+            action_space=env.action_space,
+            obs_space=env.obs_space,
+            actor_hidden_layer_sizes=config.agent_network.actor_hidden_layer_sizes,
+            critic_hidden_layer_sizes=config.agent_network.critic_hidden_layer_sizes,
+            normalize_obs=config.normalize_obs,
+            continuous_action=config.agent_network.continuous_action
+        )
+
+        if (config.optimizer.grad_clip_norm is not None and
+                config.optimizer.grad_clip_norm > 0):
+            optimizer = optax.chain(
+                optax.clip_by_global_norm(config.optimizer.grad_clip_norm),
+                optax.adam(config.optimizer.lr)
+            )
+        else:
+            optimizer = optax.adam(config.optimizer.lr)
+
+        eval_env = create_env(
+            config.env.env_name,
+            config.env.env_type,
+            episode_length=max_episode_steps,
+            parallel=config.num_eval_envs,
+            autoreset=False
+        )
+
+        evaluator = Evaluator(
+            env=eval_env, agent=agent, max_episode_steps=max_episode_steps)
+
+        return cls(env, agent, optimizer, evaluator, config)
+
+    def _setup_devices(self, actor_devices: List[jax.Device], learner_devices: List[jax.Device]) -> None:
+        self.actor_devices = actor_devices
+        self.devices = learner_devices
+        # the learner always runs in pmap, even with one learner device
+        self.pmap_axis_name = PMAP_AXIS_NAME
+
+        self._rollout_fn = jax.jit(partial(
+            rollout, self.env, self.agent,
+            rollout_length=self.config.rollout_length,
+            discount=self.config.discount,
+            env_extra_fields=self._rollout_env_extra_fields
+        ))
+        self._env_reset_fn = jax.jit(self.env.reset)
+        self._learn_fn = jax.pmap(
+            self._learn, axis_name=self.pmap_axis_name, devices=learner_devices)
+        self._evaluate_fn = jax.pmap(
+            self._evaluate, axis_name=self.pmap_axis_name, devices=learner_devices)
+
+    def setup(self, key: chex.PRNGKey) -> State:
+        key, agent_key, env_key = jax.random.split(key, 3)
+
+        agent_state = self.agent.init(agent_key)
+        opt_state = self.optimizer.init(agent_state.params)
+
+        # learner state: replicated over learner devices
+        agent_state, opt_state = jax.device_put_replicated(
+            (agent_state, opt_state), self.devices)
+
+        # actor state: one env_state per actor, on its actor device
+        env_keys = jax.random.split(env_key, self.config.num_actors)
+        env_state = tuple(
+            self._env_reset_fn(jax.device_put(env_keys[i], self._actor_device(i)))
+            for i in range(self.config.num_actors)
+        )
+
+        return State(
+            key=key,
+            metrics=self._setup_workflow_metrics(),
+            agent_state=agent_state,
+            env_state=env_state,
+            opt_state=opt_state
+        )
+
+    def _actor_device(self, actor_id: int) -> jax.Device:
+        return self.actor_devices[actor_id % len(self.actor_devices)]
+
+    def _shard_to_learners(self, trajectory: SampleBatch) -> SampleBatch:
+        """
+            [T, B, ...] -> [#learner_devices, T, B//#learner_devices, ...]
+        """
+        num_devices = len(self.devices)
+        return jtu.tree_map(
+            lambda x: jax.device_put_sharded(
+                jnp.split(x, num_devices, axis=1), self.devices),
+            trajectory
+        )
+
+    @track_traces
+    def _learn(self, agent_state: AgentState, opt_state: optax.OptState,
+               trajectories: Tuple[SampleBatch], key: chex.PRNGKey):
+        """
+            One learner update on a batch of trajectories (per learner device).
+        """
+        # [T, B*k, ...]
+        trajectory = jtu.tree_map(
+            lambda *x: jnp.concatenate(x, axis=1), *trajectories)
+
+        if agent_state.obs_preprocessor_state is not None:
+            with jax.named_scope("normalizer_update"):
+                agent_state = agent_state.replace(
+                    obs_preprocessor_state=running_statistics.update(
+                        agent_state.obs_preprocessor_state, trajectory.obs,
+                        pmap_axis_name=self.pmap_axis_name,
+                        bucket_size=self.grad_comm_options['bucket_size']
+                    )
+                )
+
+        # ======== compute V-trace =======
+        with jax.named_scope("vtrace"):
+            last_obs = trajectory.extras.env_extras.last_obs
+            v_obs = jnp.concatenate(
+                [trajectory.obs, last_obs[-1:]], axis=0
+            )
+            # concat [values, bootstrap_value]
+            vs = self.agent.compute_values(
+                agent_state, SampleBatch(obs=v_obs))
+            target_logp = self.agent.compute_logp(agent_state, trajectory)
+            log_rhos = target_logp - trajectory.extras.policy_extras.logp
+
+            v_targets, advantages = compute_vtrace(
+                log_rhos=log_rhos,
+                rewards=trajectory.rewards,  # peb_rewards
+                values=vs,
+                dones=trajectory.dones,
+                vtrace_lambda=self.config.vtrace_lambda,
+                discount=self.config.discount,
+                clip_rho_threshold=self.config.clip_rho_threshold,
+                clip_pg_rho_threshold=self.config.clip_pg_rho_threshold,
+                clip_c_threshold=self.config.clip_c_threshold
+            )
+            trajectory.extras.v_targets = v_targets
+            trajectory.extras.advantages = advantages
+            # [T,B,...] -> [T*B,...]
+            train_batch = tree_stop_gradient(
+                flatten_rollout_trajectory(trajectory))
+        # ============================
+
+        def loss_fn(agent_state, sample_batch, key):
+            loss_dict = self.agent.loss(agent_state, sample_batch, key)
+            loss_weights = self.config.optimizer.loss_weights
+            loss = jnp.zeros(())
+            for loss_key in loss_weights.keys():
+                loss += loss_weights[loss_key] * loss_dict[loss_key]
+
+            return loss, loss_dict
+
+        with jax.named_scope("gradient_update"):
+            update_fn = agent_gradient_update(
+                loss_fn,
+                self.optimizer,
+                pmap_axis_name=self.pmap_axis_name,
+                has_aux=True,
+                **self.grad_comm_options)
+
+            (loss, loss_dict), opt_state, agent_state = update_fn(
+                opt_state,
+                agent_state,
+                train_batch,
+                key
+            )
+
+        with jax.named_scope("metric_reduction"):
+            train_episode_return = average_episode_discount_return(
+                train_batch.extras.env_extras.episode_return,
+                train_batch.dones,
+                pmap_axis_name=self.pmap_axis_name
+            )
+
+            train_metrics = TrainMetric(
+                train_episode_return=train_episode_return,
+                loss=loss,
+                raw_loss_dict=loss_dict
+            ).all_reduce(pmap_axis_name=self.pmap_axis_name)
+
+        return train_metrics, agent_state, opt_state
+
+    def _learner_update(self, state: State, trajectories: Sequence[SampleBatch]) -> Tuple[TrainMetric, State]:
+        key, learn_key = jax.random.split(state.key)
+        learn_keys = split_key_to_devices(learn_key, self.devices)
+
+        train_metrics, agent_state, opt_state = self._learn_fn(
+            state.agent_state, state.opt_state, tuple(trajectories), learn_keys)
+
+        sampled_timesteps = len(trajectories) * \
+            self.config.rollout_length * self.config.num_envs
+        workflow_metrics = WorkflowMetric(
+            sampled_timesteps=state.metrics.sampled_timesteps + sampled_timesteps,
+            iterations=state.metrics.iterations + 1
+        )
+
+        return train_metrics, state.update(
+            key=key,
+            metrics=workflow_metrics,
+            agent_state=agent_state,
+            opt_state=opt_state
+        )
+
+    def step(self, state: State) -> Tuple[TrainMetric, State]:
+        """
+            Synchronous version of one learner iteration: actors roll out with
+            the latest params in turn, then the learner updates once.
+        """
+        key, rollout_key = jax.random.split(state.key)
+        rollout_keys = jax.random.split(
+            rollout_key, self.config.trajectories_per_update)
+
+        agent_state = self._unpmap(state.agent_state)
+        env_state = list(state.env_state)
+        trajectories = []
+        for i in range(self.config.trajectories_per_update):
+            actor_id = i % self.config.num_actors
+            device = self._actor_device(actor_id)
+            env_state[actor_id], trajectory = self._rollout_fn(
+                env_state[actor_id],
+                jax.device_put(agent_state, device),
+                jax.device_put(rollout_keys[i], device)
+            )
+            trajectories.append(self._shard_to_learners(trajectory))
+
+        state = state.update(key=key, env_state=tuple(env_state))
+        return self._learner_update(state, trajectories)
+
+    @track_traces
+    def _evaluate(self, agent_state: AgentState, key: chex.PRNGKey) -> EvaluateMetric:
+        raw_eval_metrics = self.evaluator.evaluate(
+            agent_state,
+            num_episodes=self.config.eval_episodes,
+            key=key
+        )
+
+        return EvaluateMetric(
+            discount_returns=raw_eval_metrics.discount_returns.mean(),
+            episode_lengths=raw_eval_metrics.episode_lengths.mean()
+        ).all_reduce(pmap_axis_name=self.pmap_axis_name)
+
+    def evaluate(self, state: State) -> Tuple[EvaluateMetric, State]:
+        key, eval_key = jax.random.split(state.key)
+        eval_keys = split_key_to_devices(eval_key, self.devices)
+
+        eval_metrics = self._evaluate_fn(state.agent_state, eval_keys)
+
+        return eval_metrics, state.update(key=key)
+
+    def _actor_loop(self, actor_id: int, env_state, key: chex.PRNGKey,
+                    params_server: ParamsServer, trajectory_queue: queue.Queue,
+                    stop_event: threading.Event, meter: UtilizationMeter,
+                    results: dict) -> None:
+        device = self._actor_device(actor_id)
+        key = jax.device_put(key, device)
+        try:
+            while not stop_event.is_set():
+                meter.start()
+                with jax.profiler.TraceAnnotation("actor_rollout", actor_id=actor_id):
+                    agent_state, version = params_server.pull(device)
+                    key, rollout_key = jax.random.split(key)
+                    env_state, trajectory = self._rollout_fn(
+                        env_state, agent_state, rollout_key)
+                    trajectory = self._shard_to_learners(trajectory)
+                    jax.block_until_ready(trajectory)
+                meter.stop()
+
+                # idle when the queue is full
+                while not stop_event.is_set():
+                    try:
+                        trajectory_queue.put(
+                            (trajectory, version), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as e:
+            logger.exception(f"actor {actor_id} failed")
+            results['error'] = e
+            stop_event.set()
+        finally:
+            results[actor_id] = env_state
+
+    def learn(self, state: State) -> State:
+        one_step_timesteps = self.config.trajectories_per_update * \
+            self.config.rollout_length * self.config.num_envs
+        num_iters = math.ceil(self.config.total_timesteps / one_step_timesteps)
+        start_iteration = int(state.metrics.iterations)
+
+        params_server = ParamsServer()
+        params_server.publish(
+            self._unpmap(state.agent_state), start_iteration)
+
+        trajectory_queue = queue.Queue(maxsize=self.config.queue_size)
+        stop_event = threading.Event()
+        actor_meters = [UtilizationMeter()
+                        for _ in range(self.config.num_actors)]
+        learner_meter = UtilizationMeter()
+        actor_results = {}
+
+        key, actor_key = jax.random.split(state.key)
+        state = state.update(key=key)
+        actor_keys = jax.random.split(actor_key, self.config.num_actors)
+        actors = [
+            threading.Thread(
+                target=self._actor_loop,
+                args=(i, state.env_state[i], actor_keys[i], params_server,
+                      trajectory_queue, stop_event, actor_meters[i], actor_results),
+                name=f"actor-{i}", daemon=True
+            )
+            for i in range(self.config.num_actors)
+        ]
+        for actor in actors:
+            actor.start()
+
+        try:
+            for i in range(start_iteration, num_iters):
+                self._on_iteration_begin(i)
+                with self.trace_window.step(i):
+                    trajectories = []
+                    policy_lag = 0
+                    while len(trajectories) < self.config.trajectories_per_update:
+                        try:
+                            trajectory, version = trajectory_queue.get(timeout=1)
+                        except queue.Empty:
+                            if stop_event.is_set():
+                                raise RuntimeError(
+                                    "actors stopped") from actor_results.get('error')
+                            continue
+                        trajectories.append(trajectory)
+                        policy_lag += i - version
+
+                    learner_meter.start()
+                    train_metrics, state = self.perf_timer.time(
+                        'step', self._learner_update, state, trajectories)
+                    params_server.publish(self._unpmap(state.agent_state), i+1)
+                    jax.block_until_ready(train_metrics)
+                    learner_meter.stop()
+
+                    state = self._on_iteration_end(
+                        i, state, train_metrics,
+                        dict(
+                            utilization=dict(
+                                actor=sum(m.report() for m in actor_meters) / len(actor_meters),
+                                learner=learner_meter.report()
+                            ),
+                            policy_lag=policy_lag / len(trajectories),
+                            queue_size=trajectory_queue.qsize()
+                        ))
+
+                self.trace_window.maybe_stop(i, state)
+        finally:
+            stop_event.set()
+            for actor in actors:
+                actor.join()
+
+        self.metric_aggregator.flush()
+
+        env_state = tuple(
+            actor_results.get(i, state.env_state[i])
+            for i in range(self.config.num_actors)
+        )
+        return state.update(env_state=env_state)
+
+    def _local_workflow_metrics(self, state: State) -> WorkflowMetric:
+        # workflow metrics are kept on the host, not replicated
+        return state.metrics
+
+    def _checkpoint_fields(self, state: State) -> Tuple[str]:
+        # env states live on actor devices and are not saved
+        return tuple(
+            name for name in super()._checkpoint_fields(state)
+            if name != 'env_state')
+
+    def _checkpoint_state(self, state: State, fields: Sequence[str]) -> dict:
+        # only the learner params & opt_state are replicated
+        return {
+            name: self._unpmap(getattr(state, name))
+            if name in self._param_state_fields else getattr(state, name)
+            for name in fields if name != 'env_state'
+        }
+
+    def _restore_state(self, state: State, tree: dict) -> State:
+        tree = {
+            name: jax.device_put_replicated(x, self.devices)
+            if name in self._param_state_fields else x
+            for name, x in tree.items()
+        }
+        return state.update(**tree)
+
+
+def split_actor_learner_devices(devices: Sequence[jax.Device], num_actor_devices: int) -> Tuple[List[jax.Device], List[jax.Device]]:
+    """
+        The first `num_actor_devices` devices are actor devices, the rest are
+        learner devices. With one device, actors and the learner share it.
+    """
+    devices = list(devices)
+    if len(devices) == 1:
+        return devices, devices
+
+    if not 0 < num_actor_devices < len(devices):
+        raise ValueError(
+            f"num_actor_devices({num_actor_devices}) should be in [1, {len(devices)-1}]")
+
+    return devices[:num_actor_devices], devices[num_actor_devices:]
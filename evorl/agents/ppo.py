@@ -4,7 +4,7 @@ import jax.tree_util as jtu
 from flax import struct
 import math
 
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 
 
 from evorl.sample_batch import SampleBatch
@@ -14,11 +14,12 @@ from evorl.distribution import get_categorical_dist, get_tanh_norm_dist
 from evorl.utils.jax_utils import tree_stop_gradient
 from evorl.utils.toolkits import (
     compute_gae, flatten_rollout_trajectory,
-    average_episode_discount_return
+    average_episode_discount_return,
+    minibatch_indices, gather_minibatch
 )
 from evorl.workflows import OnPolicyRLWorkflow
 from evorl.agents import AgentState
-from evorl.distributed import agent_gradient_update, tree_unpmap, psum
+from evorl.distributed import agent_gradient_update, psum, get_sharded_size
 from evorl.envs import create_env, Env, EnvState
 from evorl.evaluator import Evaluator
 from .agent import Agent, AgentState
@@ -31,8 +32,7 @@ import orbax.checkpoint as ocp
 import chex
 import optax
 from evorl.types import (
-    LossDict, Action, Params, PolicyExtraInfo, PyTreeDict, pytree_field,
-    MISSING_REWARD
+    LossDict, Action, Params, PolicyExtraInfo, PyTreeDict, pytree_field
 )
 from evorl.metrics import TrainMetric, WorkflowMetric
 from typing import Tuple, Sequence, Optional, Any
@@ -241,25 +241,16 @@ class PPOWorkflow(OnPolicyRLWorkflow):
     @staticmethod
     def _rescale_config(config, devices) -> None:
         num_devices = len(devices)
-        if config.num_envs % num_devices != 0:
-            logger.warning(
-                f"num_envs({config.num_envs}) cannot be divided by num_devices({num_devices}), "
-                f"rescale num_envs to {config.num_envs // num_devices}"
-            )
-        if config.num_eval_envs % num_devices != 0:
-            logger.warning(
-                f"num_eval_envs({config.num_eval_envs}) cannot be divided by num_devices({num_devices}), "
-                f"rescale num_eval_envs to {config.num_eval_envs // num_devices}"
-            )
-        if config.minibatch_size % num_devices != 0:
-            logger.warning(
-                f"minibatch_size({config.minibatch_size}) cannot be divided by num_devices({num_devices}), "
-                f"rescale minibatch_size to {config.minibatch_size//num_devices}"
-            )
+        # check every size before touching the config
+        num_envs = get_sharded_size(config.num_envs, num_devices, "num_envs")
+        num_eval_envs = get_sharded_size(
+            config.num_eval_envs, num_devices, "num_eval_envs")
+        minibatch_size = get_sharded_size(
+            config.minibatch_size, num_devices, "minibatch_size")
 
-        config.num_envs = config.num_envs // num_devices
-        config.num_eval_envs = config.num_eval_envs // num_devices
-        config.minibatch_size = config.minibatch_size//num_devices
+        config.num_envs = num_envs
+        config.num_eval_envs = num_eval_envs
+        config.minibatch_size = minibatch_size
 
     @classmethod
     def _build_from_config(cls, config: DictConfig):
@@ -303,59 +294,79 @@ class PPOWorkflow(OnPolicyRLWorkflow):
         one_step_rollout_steps = config.num_envs * config.rollout_length
         if one_step_rollout_steps % config.minibatch_size != 0:
             logger.warning(
-                f"minibatch_size ({config.minibath_size} cannot divides num_envs*rollout_length)")
+                f"minibatch_size ({config.minibatch_size} cannot divides num_envs*rollout_length)")
 
         evaluator = Evaluator(
             env=eval_env, agent=agent, max_episode_steps=max_episode_steps)
 
         return cls(env, agent, optimizer, evaluator, config)
 
+    @property
+    def num_epochs(self) -> int:
+        return OmegaConf.select(self.config, 'num_epochs', default=1)
+
+    @property
+    def num_minibatches(self) -> int:
+        return self.config.rollout_length * \
+            self.config.num_envs // self.config.minibatch_size
+
+    @property
+    def num_grad_steps_per_iteration(self) -> int:
+        return self.num_epochs * self.num_minibatches
+
     def step(self, state: State) -> Tuple[TrainMetric, State]:
 
         key, rollout_key, perm_key, learn_key = jax.random.split(
             state.key, num=4)
 
-        # trajectory: [T, #envs, ...]
-        env_state, trajectory = rollout(
-            self.env,
-            self.agent,
-            state.env_state,
-            state.agent_state,
-            rollout_key,
-            rollout_length=self.config.rollout_length,
-            discount=self.config.discount,
-            env_extra_fields=('last_obs', 'episode_return')
-        )
+        with jax.named_scope("rollout"):
+            # trajectory: [T, #envs, ...]
+            env_state, trajectory = rollout(
+                self.env,
+                self.agent,
+                state.env_state,
+                state.agent_state,
+                rollout_key,
+                rollout_length=self.config.rollout_length,
+                discount=self.config.discount,
+                env_extra_fields=self._rollout_env_extra_fields,
+                unroll=self.rollout_unroll
+            )
+            self._write_trajectory(trajectory)
 
         agent_state = state.agent_state
         if agent_state.obs_preprocessor_state is not None:
-            agent_state = agent_state.replace(
-                obs_preprocessor_state=running_statistics.update(
-                    agent_state.obs_preprocessor_state, trajectory.obs,
-                    pmap_axis_name=self.pmap_axis_name
+            with jax.named_scope("normalizer_update"):
+                agent_state = agent_state.replace(
+                    obs_preprocessor_state=running_statistics.update(
+                        agent_state.obs_preprocessor_state, trajectory.obs,
+                        pmap_axis_name=self.pmap_axis_name,
+                        bucket_size=self.grad_comm_options['bucket_size']
+                    )
                 )
-            )
 
         # ======== compute GAE =======
-        last_obs = trajectory.extras.env_extras.last_obs
-        v_obs = jnp.concatenate(
-            [trajectory.obs, last_obs[-1:]], axis=0
-        )
-        # concat [values, bootstrap_value]
-        vs = self.agent.compute_values(
-            state.agent_state, SampleBatch(obs=v_obs))
-        v_targets, advantages = compute_gae(
-            rewards=trajectory.rewards,  # peb_rewards
-            values=vs,
-            dones=trajectory.dones,
-            gae_lambda=self.config.gae_lambda,
-            discount=self.config.discount
-        )
-        trajectory.extras.v_targets = v_targets
-        trajectory.extras.advantages = advantages
-        # [T,B,...] -> [T*B,...]
-        trajectory = flatten_rollout_trajectory(trajectory)
-        trajectory = tree_stop_gradient(trajectory)
+        with jax.named_scope("gae"):
+            last_obs = trajectory.extras.env_extras.last_obs
+            v_obs = jnp.concatenate(
+                [trajectory.obs, last_obs[-1:]], axis=0
+            )
+            # concat [values, bootstrap_value]
+            vs = self.agent.compute_values(
+                state.agent_state, SampleBatch(obs=v_obs))
+            v_targets, advantages = compute_gae(
+                rewards=trajectory.rewards,  # peb_rewards
+                values=vs,
+                dones=trajectory.dones,
+                gae_lambda=self.config.gae_lambda,
+                discount=self.config.discount,
+                **self.gae_scan_options
+            )
+            trajectory.extras.v_targets = v_targets
+            trajectory.extras.advantages = advantages
+            # [T,B,...] -> [T*B,...]
+            trajectory = flatten_rollout_trajectory(trajectory)
+            trajectory = tree_stop_gradient(trajectory)
         # ============================
 
         def loss_fn(agent_state, sample_batch, key):
@@ -372,60 +383,68 @@ class PPOWorkflow(OnPolicyRLWorkflow):
             loss_fn,
             self.optimizer,
             pmap_axis_name=self.pmap_axis_name,
-            has_aux=True)
+            has_aux=True,
+            **self.grad_comm_options)
 
-        num_minibatches = self.config.rollout_length * \
-            self.config.num_envs // self.config.minibatch_size
+        num_grad_steps = self.num_grad_steps_per_iteration
 
-        def _get_shuffled_minibatch(x):
-            x = jax.random.permutation(perm_key, x)[
-                :num_minibatches*self.config.minibatch_size]
-            return x.reshape(num_minibatches, -1, *x.shape[1:])
-
-        def minibatch_step(carray, trajectory):
+        def minibatch_step(carray, indices):
             opt_state, agent_state, key = carray
             key, learn_key = jax.random.split(key)
 
+            # gather the minibatch, instead of shuffled copies of the trajectory
+            minibatch = gather_minibatch(trajectory, indices)
             (loss, loss_dict), opt_state, agent_state = update_fn(
                 opt_state,
                 agent_state,
-                trajectory,
+                minibatch,
                 learn_key
             )
 
             return (opt_state, agent_state, key), (loss, loss_dict)
 
-        (opt_state, agent_state, _), (loss_list, loss_dict_list) = jax.lax.scan(
-            minibatch_step,
-            (state.opt_state, agent_state, learn_key),
-            jtu.tree_map(_get_shuffled_minibatch, trajectory),
-            length=num_minibatches
-        )
+        with jax.named_scope("minibatch_shuffle"):
+            # [num_epochs*num_minibatches, minibatch_size]
+            indices = minibatch_indices(
+                perm_key,
+                self.config.rollout_length * self.config.num_envs,
+                self.config.minibatch_size,
+                num_epochs=self.num_epochs
+            )
 
-        loss = loss_list.mean()
-        loss_dict = jtu.tree_map(jnp.mean, loss_dict_list)
+        with jax.named_scope("gradient_update"):
+            (opt_state, agent_state, _), (loss_list, loss_dict_list) = jax.lax.scan(
+                minibatch_step,
+                (state.opt_state, agent_state, learn_key),
+                indices,
+                length=num_grad_steps
+            )
 
-        # ======== update metrics ========
+        with jax.named_scope("metric_reduction"):
+            loss = loss_list.mean()
+            loss_dict = jtu.tree_map(jnp.mean, loss_dict_list)
 
-        sampled_timesteps = psum(self.config.rollout_length * self.config.num_envs,
-                                 axis_name=self.pmap_axis_name)
+            # ======== update metrics ========
 
-        train_episode_return = average_episode_discount_return(
-            trajectory.extras.env_extras.episode_return,
-            trajectory.dones,
-            pmap_axis_name=self.pmap_axis_name
-        )
+            sampled_timesteps = psum(self.config.rollout_length * self.config.num_envs,
+                                     axis_name=self.pmap_axis_name)
+
+            train_episode_return = average_episode_discount_return(
+                trajectory.extras.env_extras.episode_return,
+                trajectory.dones,
+                pmap_axis_name=self.pmap_axis_name
+            )
 
-        workflow_metrics = WorkflowMetric(
-            sampled_timesteps=state.metrics.sampled_timesteps+sampled_timesteps,
-            iterations=state.metrics.iterations + 1,
-        ).all_reduce(pmap_axis_name=self.pmap_axis_name)
+            workflow_metrics = WorkflowMetric(
+                sampled_timesteps=state.metrics.sampled_timesteps+sampled_timesteps,
+                iterations=state.metrics.iterations + 1,
+            ).all_reduce(pmap_axis_name=self.pmap_axis_name)
 
-        train_metrics = TrainMetric(
-            train_episode_return=train_episode_return,
-            loss=loss,
-            raw_loss_dict=loss_dict
-        ).all_reduce(pmap_axis_name=self.pmap_axis_name)
+            train_metrics = TrainMetric(
+                train_episode_return=train_episode_return,
+                loss=loss,
+                raw_loss_dict=loss_dict
+            ).all_reduce(pmap_axis_name=self.pmap_axis_name)
 
         return train_metrics, state.update(
             key=key,
@@ -439,34 +458,18 @@ class PPOWorkflow(OnPolicyRLWorkflow):
         one_step_timesteps = self.config.rollout_length * self.config.num_envs
         num_iters = math.ceil(self.config.total_timesteps / one_step_timesteps)
 
-        start_iteration = tree_unpmap(
-            state.metrics.iterations, self.pmap_axis_name)
+        start_iteration = self._get_iteration(state)
 
         for i in range(start_iteration, num_iters):
-            train_metrics, state = self.step(state)
-            workflow_metrics = state.metrics
-
-            train_metrics = tree_unpmap(train_metrics, self.pmap_axis_name)
-            workflow_metrics = tree_unpmap(
-                workflow_metrics, self.pmap_axis_name)
-
-            self.recorder.write(workflow_metrics.to_local_dict(), i)
-            train_metric_data = train_metrics.to_local_dict()
-            if train_metrics.train_episode_return == MISSING_REWARD:
-                del train_metric_data['train_episode_return']
-            self.recorder.write(train_metric_data, i)
-
-            if (i+1) % self.config.eval_interval == 0:
-                eval_metrics, state = self.evaluate(state)
-                eval_metrics = tree_unpmap(eval_metrics, self.pmap_axis_name)
-                self.recorder.write({'eval': eval_metrics.to_local_dict()}, i)
-                logger.debug(eval_metrics)
-
-            self.checkpoint_manager.save(
-                i,
-                args=ocp.args.StandardSave(
-                    tree_unpmap(state, self.pmap_axis_name))
-            )
+            self._on_iteration_begin(i)
+            with self.trace_window.step(i):
+                train_metrics, state = self.perf_timer.time(
+                    'step', self.step, state)
+                state = self._on_iteration_end(i, state, train_metrics)
+
+            self.trace_window.maybe_stop(i, state)
+
+        self.metric_aggregator.flush()
 
         return state
 
@@ -515,12 +518,14 @@ def rollout(
     rollout_length: int,
     discount: float,
     env_extra_fields: Sequence[str] = ('last_obs',),
+    unroll: int = 1,
 ) -> Tuple[EnvState, SampleBatch]:
     """
         Collect given rollout_length trajectory.
 
         Args:
             env: vampped env w/ autoreset
+            unroll: unroll of the rollout scan
         Returns:
             env_state: last env_state after rollout
             trajectory: SampleBatch [T, #envs, ...], T=rollout_length
@@ -563,6 +568,7 @@ def rollout(
 
     # trajectory: [T, #envs, ...]
     (env_state, _), trajectory = jax.lax.scan(
-        _one_step_rollout, (env_state, key), (), length=rollout_length)
+        _one_step_rollout, (env_state, key), (), length=rollout_length,
+        unroll=unroll)
 
     return env_state, trajectory
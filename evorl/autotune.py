@@ -0,0 +1,278 @@
+"""
+    Calibrate the sizes of an on-policy workflow for throughput:
+
+    python -m evorl.autotune agent=ppo env=brax/ant autotune.num_envs=[16,64,256] autotune.minibatch_size=[256,1024]
+    python -m evorl.autotune agent=a2c env=brax/hopper autotune.batch_size=2048 autotune.num_envs=[8,32,128] autotune.search=halving
+
+    Each candidate of the grid over `autotune.{num_envs, rollout_length,
+    minibatch_size, rollout_unroll, gae_unroll}` (null keeps the config value)
+    is built, its jitted `step` is compiled, and we record the memory from the
+    XLA memory analysis and the env steps/sec over the timed steps. Candidates
+    above `autotune.memory_limit` (default: the device memory if known) are
+    skipped before running. With `autotune.batch_size`, the rollout length is
+    derived as batch_size / num_envs, so all candidates train on the same
+    batch.
+
+    - grid: time every candidate for `autotune.repeats` steps.
+    - halving: successive halving, every candidate is timed for `repeats`
+        steps, then the faster half is timed again with twice the steps, until
+        one is left. The slow candidates are dropped early, but all the
+        candidates are kept in memory during the first round.
+
+    The compilation dominates on CPU, so keep the grid small. The fastest
+    candidate is logged and saved as config overrides in
+    <output_dir>/autotune.json, eg: `num_envs=64 rollout_length=32 rollout_unroll=4`.
+    The measurements are on a single device.
+"""
+import copy
+import dataclasses
+import itertools
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import hydra
+import jax
+from omegaconf import DictConfig, OmegaConf, open_dict
+
+from evorl.cost_analysis import compiled_cost
+from evorl.utils.cfg_utils import get_output_dir
+
+logger = logging.getLogger(__name__)
+
+TUNED_KEYS = ('num_envs', 'rollout_length', 'minibatch_size',
+              'rollout_unroll', 'gae_unroll')
+
+SEARCH_METHODS = ('grid', 'halving')
+
+
+def candidate_grid(config: DictConfig, tune_config: DictConfig) -> List[Dict[str, Any]]:
+    """
+        Config overrides of all candidates. Keys missing in `config` (eg:
+        `minibatch_size` of A2C) are not tuned.
+    """
+    choices = {}
+    for k in TUNED_KEYS:
+        if k not in config:
+            continue
+        values = OmegaConf.select(tune_config, k, default=None)
+        if values is None:
+            values = [config[k]]
+        choices[k] = list(values)
+
+    batch_size = OmegaConf.select(tune_config, 'batch_size', default=None)
+    if batch_size is not None:
+        # rollout_length is derived from num_envs
+        choices.pop('rollout_length', None)
+
+    candidates = []
+    for values in itertools.product(*choices.values()):
+        candidate = dict(zip(choices.keys(), values))
+        if batch_size is not None:
+            if batch_size % candidate['num_envs'] != 0:
+                continue
+            candidate['rollout_length'] = batch_size // candidate['num_envs']
+
+        if 'minibatch_size' in candidate:
+            num_envs = candidate.get('num_envs', config.get('num_envs'))
+            rollout_length = candidate.get('rollout_length', config.get('rollout_length'))
+            if (num_envs * rollout_length) % candidate['minibatch_size'] != 0:
+                continue
+        candidates.append(candidate)
+
+    return candidates
+
+
+def format_overrides(candidate: Dict[str, Any]) -> str:
+    return ' '.join(
+        f"{k}={'null' if v is None else v}" for k, v in candidate.items())
+
+
+@dataclasses.dataclass
+class Trial:
+    candidate: Dict[str, Any]
+    workflow: Any = None
+    step_fn: Optional[Callable] = None
+    state: Any = None
+    memory: Optional[int] = None
+    compile_time: Optional[float] = None
+    elapsed: float = 0.0
+    env_steps: int = 0
+    num_steps: int = 0
+    status: str = 'pending'
+
+    @property
+    def env_steps_per_sec(self) -> float:
+        return self.env_steps / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self) -> Dict[str, Any]:
+        return dict(
+            overrides=self.candidate,
+            status=self.status,
+            memory=self.memory,
+            compile_time=self.compile_time,
+            env_steps_per_sec=self.env_steps_per_sec,
+            step_time=self.elapsed / self.num_steps if self.num_steps else None,
+        )
+
+
+def _candidate_config(config: DictConfig, candidate: Dict[str, Any]) -> DictConfig:
+    config = copy.deepcopy(config)
+    OmegaConf.set_readonly(config, False)
+    with open_dict(config):
+        for k, v in candidate.items():
+            OmegaConf.update(config, k, v)
+    return config
+
+
+def _device_memory_limit() -> Optional[int]:
+    try:
+        stats = jax.local_devices()[0].memory_stats()
+    except Exception:
+        stats = None
+    return (stats or {}).get('bytes_limit')
+
+
+class Autotuner:
+    """
+        Args:
+            config: the workflow config.
+            tune_config: the `autotune` config section.
+            key: PRNGKey to init the workflows.
+    """
+
+    def __init__(self, config: DictConfig, tune_config: DictConfig, key: jax.Array):
+        self.config = config
+        self.workflow_cls = hydra.utils.get_class(config.workflow_cls)
+        self.key = key
+        self.repeats = tune_config.repeats
+        self.search = tune_config.search
+        if self.search not in SEARCH_METHODS:
+            raise ValueError(
+                f'search {self.search} not supported, choose from {SEARCH_METHODS}')
+        self.memory_limit = OmegaConf.select(
+            tune_config, 'memory_limit', default=None) or _device_memory_limit()
+
+        self.trials = [Trial(c) for c in candidate_grid(config, tune_config)]
+        if len(self.trials) == 0:
+            raise ValueError('no valid candidate in the autotune grid')
+
+    def _build(self, trial: Trial) -> bool:
+        config = _candidate_config(self.config, trial.candidate)
+        workflow = None
+        try:
+            workflow = self.workflow_cls.build_from_config(config, enable_jit=False)
+            state = workflow.init(self.key)
+            start = time.perf_counter()
+            compiled = jax.jit(workflow.step).lower(state).compile()
+            trial.compile_time = time.perf_counter() - start
+        except Exception as e:
+            logger.warning(f"[{format_overrides(trial.candidate)}] failed: {e}")
+            trial.status = 'failed'
+            # release its recorders and writers
+            if workflow is not None:
+                workflow.close()
+            return False
+
+        cost = compiled_cost(compiled)
+        if 'temp_size' in cost:
+            trial.memory = cost['argument_size'] + cost['output_size'] + \
+                cost['temp_size'] - cost['alias_size']
+        if self.memory_limit is not None and trial.memory is not None and \
+                trial.memory > self.memory_limit:
+            logger.info(
+                f"[{format_overrides(trial.candidate)}] skipped: "
+                f"{trial.memory} bytes > memory limit {self.memory_limit}")
+            trial.status = 'out_of_memory'
+            workflow.close()
+            return False
+
+        # warmup
+        _, state = compiled(state)
+        jax.block_until_ready(state)
+        trial.workflow, trial.step_fn, trial.state = workflow, compiled, state
+        trial.status = 'running'
+        return True
+
+    def _measure(self, trial: Trial, num_steps: int) -> None:
+        state = trial.state
+        start_timesteps = int(state.metrics.sampled_timesteps)
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            _, state = trial.step_fn(state)
+        jax.block_until_ready(state)
+        trial.elapsed += time.perf_counter() - start
+        trial.env_steps += int(state.metrics.sampled_timesteps) - start_timesteps
+        trial.num_steps += num_steps
+        trial.state = state
+        logger.info(
+            f"[{format_overrides(trial.candidate)}] "
+            f"{trial.env_steps_per_sec:.0f} env steps/s, memory {trial.memory} bytes, "
+            f"compile {trial.compile_time:.1f}s")
+
+    def _release(self, trial: Trial, status: str) -> None:
+        trial.status = status
+        trial.workflow.close()
+        trial.workflow = trial.step_fn = trial.state = None
+
+    def run(self) -> Optional[Trial]:
+        """
+            Run the search and return the fastest trial.
+        """
+        logger.info(f"{len(self.trials)} candidates, {self.search} search")
+        if self.search == 'grid':
+            for trial in self.trials:
+                if self._build(trial):
+                    self._measure(trial, self.repeats)
+                    self._release(trial, 'done')
+            finished = [t for t in self.trials if t.status == 'done']
+        else:
+            rung = [t for t in self.trials if self._build(t)]
+            num_steps = self.repeats
+            while len(rung) > 0:
+                for trial in rung:
+                    self._measure(trial, num_steps)
+                rung.sort(key=lambda t: t.env_steps_per_sec, reverse=True)
+                if len(rung) == 1:
+                    self._release(rung[0], 'done')
+                    break
+                for trial in rung[len(rung)//2:]:
+                    self._release(trial, 'eliminated')
+                rung = rung[:len(rung)//2]
+                num_steps *= 2
+            finished = [t for t in self.trials if t.status == 'done']
+
+        if len(finished) == 0:
+            return None
+        return max(finished, key=lambda t: t.env_steps_per_sec)
+
+    def report(self, best: Optional[Trial]) -> Dict[str, Any]:
+        return dict(
+            search=self.search,
+            memory_limit=self.memory_limit,
+            best=None if best is None else best.report(),
+            overrides=None if best is None else format_overrides(best.candidate),
+            trials=[t.report() for t in self.trials],
+        )
+
+
+@hydra.main(version_base=None, config_path="../configs", config_name="config")
+def main(config: DictConfig) -> None:
+    tuner = Autotuner(config, config.autotune, jax.random.PRNGKey(config.seed))
+    best = tuner.run()
+    report = tuner.report(best)
+
+    with (get_output_dir()/'autotune.json').open('w') as f:
+        json.dump(report, f, indent=4)
+
+    if best is None:
+        logger.error("all candidates failed or exceeded the memory limit")
+        return
+    logger.info(
+        f"fastest: {best.env_steps_per_sec:.0f} env steps/s, memory {best.memory} bytes, "
+        f"tuned overrides: {report['overrides']}")
+
+
+if __name__ == "__main__":
+    main()
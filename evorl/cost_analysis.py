@@ -0,0 +1,231 @@
+"""
+    XLA cost analysis of the compiled workflow functions:
+
+    python -m evorl.cost_analysis agent=ppo env=brax/ant num_envs=2048 minibatch_size=1024
+    python -m evorl.cost_analysis agent=nsga2 env=brax/ant pop_size=1000
+
+    Lower & compile `step` and `evaluate` of RL workflows, or `_step` and
+    `Problem.evaluate` of EC workflows, then report the FLOPs and bytes
+    accessed from `cost_analysis()`, the argument/output/temp sizes from
+    `memory_analysis()`, and the measured time. Under multi-devices, the
+    numbers are per device.
+
+    Note: XLA counts the body of a while loop (eg: `jax.lax.scan` in rollout
+    and minibatch updates) only once, so FLOPs and bytes accessed are lower
+    bounds, and so are `min_flops_per_sec` and `min_bytes_per_sec` derived
+    from them: with a rollout of 512 steps, the achieved throughput can be
+    orders of magnitude higher. The memory analysis is not affected.
+"""
+import functools
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Sequence
+
+import hydra
+import jax
+from omegaconf import DictConfig, OmegaConf
+
+from evorl.utils.cfg_utils import get_output_dir
+
+logger = logging.getLogger(__name__)
+
+
+def lower_method(obj: Any, name: str, *args) -> jax.stages.Lowered:
+    """
+        Lower the jitted method `obj.name(*args)`, with the jit/pmap/shard_map
+        wrapper bound to `obj` (see `RLWorkflow._bind_methods`) if any.
+    """
+    method = getattr(obj, '_wrapped_methods', {}).get(name)
+    if method is None:
+        method = getattr(type(obj), name)
+    if hasattr(method, 'lower'):
+        # jax.jit or jax.pmap with static `self`
+        return method.lower(obj, *args)
+    # eg: shard_map-ed methods
+    return jax.jit(functools.partial(method, obj)).lower(*args)
+
+
+def compiled_cost(compiled: jax.stages.Compiled) -> Dict[str, float]:
+    """
+        FLOPs, bytes accessed and memory sizes (in bytes) of the compiled function.
+    """
+    cost = compiled.cost_analysis()
+    if isinstance(cost, (list, tuple)):
+        cost = cost[0] if len(cost) > 0 else None
+    cost = cost or {}
+
+    report = dict(
+        flops=cost.get('flops', 0.0),
+        transcendentals=cost.get('transcendentals', 0.0),
+        bytes_accessed=cost.get('bytes accessed', 0.0),
+    )
+
+    memory = compiled.memory_analysis()
+    if memory is not None:
+        report.update(
+            argument_size=memory.argument_size_in_bytes,
+            output_size=memory.output_size_in_bytes,
+            temp_size=memory.temp_size_in_bytes,
+            alias_size=memory.alias_size_in_bytes,
+            generated_code_size=memory.generated_code_size_in_bytes,
+        )
+
+    return report
+
+
+def measure_time(fn: Callable, *args, repeats: int = 10) -> float:
+    """
+        Mean wall time of `fn(*args)` after a warmup call.
+    """
+    jax.block_until_ready(fn(*args))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        outputs = fn(*args)
+    jax.block_until_ready(outputs)
+    return (time.perf_counter() - start) / repeats
+
+
+def analyze(lowered: jax.stages.Lowered, fn: Callable, args: Sequence[Any], repeats: int = 10) -> Dict[str, float]:
+    """
+        Compile `lowered` and report its cost. When repeats > 0, also measure
+        `fn(*args)` and report the FLOP/s and bytes/s from the counted
+        FLOPs and bytes: lower bounds of the achieved ones when `fn` has
+        loops, see the module docstring.
+    """
+    report = compiled_cost(lowered.compile())
+
+    if repeats > 0:
+        elapsed = measure_time(fn, *args, repeats=repeats)
+        report.update(
+            time=elapsed,
+            min_flops_per_sec=report['flops'] / elapsed,
+            min_bytes_per_sec=report['bytes_accessed'] / elapsed,
+        )
+
+    return report
+
+
+def analyze_rl_workflow(workflow, state, repeats: int = 10) -> Dict[str, Dict[str, float]]:
+    """
+        Cost of `workflow.step` and `workflow.evaluate`.
+    """
+    return {
+        name: analyze(
+            lower_method(workflow, name, state),
+            getattr(workflow, name), (state,), repeats)
+        for name in ('step', 'evaluate')
+    }
+
+
+def analyze_problem(problem, state, pop, repeats: int = 10) -> Dict[str, float]:
+    """
+        Cost of `problem.evaluate(state, pop)`.
+    """
+    evaluate_fn = jax.jit(problem.evaluate)
+    return analyze(
+        evaluate_fn.lower(state, pop), evaluate_fn, (state, pop), repeats)
+
+
+def analyze_ec_workflow(workflow, state, repeats: int = 10) -> Dict[str, Dict[str, float]]:
+    """
+        Cost of the whole `ECWorkflow._step` and its `Problem.evaluate`.
+    """
+    step_report = analyze(
+        lower_method(workflow, '_step', state),
+        workflow._step, (state,), repeats)
+
+    cands, state = workflow.candidate_generation(state, False)
+    for transform in workflow.sol_transforms:
+        cands = transform(cands)
+
+    return {
+        'step': step_report,
+        'problem_evaluate': analyze_problem(workflow.problem, state, cands, repeats)
+    }
+
+
+def _human_readable(x: float, unit: str, base: int = 1000) -> str:
+    for prefix in ('', 'K', 'M', 'G', 'T'):
+        if abs(x) < base:
+            break
+        x /= base
+    return f"{x:.2f} {prefix}{unit}"
+
+
+def format_report(reports: Dict[str, Dict[str, float]]) -> str:
+    lines = []
+    for name, r in reports.items():
+        lines.append(f"{name}:")
+        lines.append(
+            f"  flops: {_human_readable(r['flops'], 'FLOP')}, "
+            f"bytes accessed: {_human_readable(r['bytes_accessed'], 'B', 1024)}")
+        if 'temp_size' in r:
+            lines.append(
+                f"  memory: argument {_human_readable(r['argument_size'], 'B', 1024)}, "
+                f"output {_human_readable(r['output_size'], 'B', 1024)}, "
+                f"temp {_human_readable(r['temp_size'], 'B', 1024)}")
+        if 'time' in r:
+            lines.append(
+                f"  time: {r['time']*1e3:.2f} ms, "
+                f">= {_human_readable(r['min_flops_per_sec'], 'FLOP/s')}, "
+                f">= {_human_readable(r['min_bytes_per_sec'], 'B/s', 1024)}")
+    return '\n'.join(lines)
+
+
+def _analyze_ec_config(config: DictConfig) -> None:
+    from evorl.ec.ec_train import build_workflow
+
+    workflow = build_workflow(config)
+    sizes = {
+        k: OmegaConf.select(config, k, default=None)
+        for k in ('pop_size', 'num_envs', 'num_episodes', 'max_episode_steps')
+    }
+    logger.info(f"sizes: {sizes}")
+
+    state = workflow.init(jax.random.PRNGKey(config.seed))
+    reports = analyze_ec_workflow(
+        workflow, state, repeats=config.cost_analysis.repeats)
+    logger.info(
+        "XLA cost analysis (loop bodies counted once):\n" + format_report(reports))
+
+    with (get_output_dir()/'cost_analysis.json').open('w') as f:
+        json.dump(dict(sizes=sizes, reports=reports), f, indent=4)
+
+
+@hydra.main(version_base=None, config_path="../configs", config_name="config")
+def main(config: DictConfig) -> None:
+    from evorl.workflows import ECWorkflow
+
+    workflow_cls = hydra.utils.get_class(config.workflow_cls)
+    if issubclass(workflow_cls, ECWorkflow):
+        _analyze_ec_config(config)
+        return
+
+    devices = jax.devices()
+    if len(devices) > 1:
+        workflow = workflow_cls.build_from_config(
+            config, enable_multi_devices=True, devices=devices)
+    else:
+        workflow = workflow_cls.build_from_config(config, enable_jit=True)
+
+    sizes = {
+        k: OmegaConf.select(workflow.config, k, default=None)
+        for k in ('num_envs', 'rollout_length', 'minibatch_size', 'num_eval_envs')
+    }
+    logger.info(f"#devices={len(devices)}, per-device sizes: {sizes}")
+
+    state = workflow.init(jax.random.PRNGKey(config.seed))
+    reports = analyze_rl_workflow(
+        workflow, state, repeats=config.cost_analysis.repeats)
+    logger.info(
+        "XLA cost analysis (per device, loop bodies counted once):\n" + format_report(reports))
+
+    with (get_output_dir()/'cost_analysis.json').open('w') as f:
+        json.dump(dict(sizes=sizes, reports=reports), f, indent=4)
+
+    workflow.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,5 +2,12 @@ from .comm import psum, pmean, pmin, pmax, unpmap, tree_unpmap, tree_pmean, spli
 
 from .gradients import agent_gradient_update
 
+from .compression import tree_bucketed_psum, tree_bucketed_pmean
 
-PMAP_AXIS_NAME = "P"
\ No newline at end of file
+from .sharding import (
+    create_mesh, get_sharded_size, tree_device_put,
+    replicated_spec, batch_sharded_spec, param_sharded_spec
+)
+
+
+PMAP_AXIS_NAME = "P"
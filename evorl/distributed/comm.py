@@ -49,6 +49,12 @@ def tree_unpmap(tree:chex.ArrayTree, axis_name: Optional[str] = None):
     return jax.tree_map(lambda x: unpmap(x, axis_name), tree)
 
 def split_key_to_devices(key: chex.PRNGKey, devices: Sequence[jax.Device]):
+    """
+        Split key to local devices. In multi-process, keys are also different
+        over processes.
+    """
+    if jax.process_count() > 1:
+        key = jax.random.fold_in(key, jax.process_index())
     return jax.device_put_sharded(
         tuple(jax.random.split(key, len(devices))),
         devices
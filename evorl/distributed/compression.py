@@ -0,0 +1,113 @@
+"""
+    Communication-efficient all-reduce for gradients and statistics.
+
+    - Bucketing: leaves smaller than `bucket_size` are fused into one flat
+      buffer, so a tree of many small leaves only needs one collective.
+    - Compression: floating arrays are sent in `comm_dtype` (eg: bfloat16),
+      while the reduction is accumulated in float32.
+"""
+from typing import Optional
+
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import chex
+
+
+def _axis_size(axis_name: str) -> int:
+    return jax.lax.psum(1, axis_name)
+
+
+def compressed_psum(x: chex.Array, axis_name: str, comm_dtype) -> chex.Array:
+    """
+        psum with `comm_dtype` communication and float32 accumulation.
+
+        Implemented as reduce-scatter (all_to_all + local fp32 sum) followed by
+        all_gather, which has the same communication volume as a ring all-reduce.
+    """
+    num_devices = _axis_size(axis_name)
+    dtype = x.dtype
+    shape = x.shape
+
+    x = x.reshape(-1)
+    size = x.shape[0]
+    chunk_size = -(-size // num_devices)
+    x = jnp.pad(x, (0, chunk_size*num_devices - size))
+
+    # [#devices, chunk_size]: the i-th row is sent to the i-th device
+    x = x.reshape(num_devices, chunk_size).astype(comm_dtype)
+    x = jax.lax.all_to_all(x, axis_name, split_axis=0, concat_axis=0)
+    # local reduction of the chunk owned by this device
+    x = jnp.sum(x.astype(jnp.float32), axis=0)
+    x = jax.lax.all_gather(x.astype(comm_dtype), axis_name, tiled=True)
+
+    return x[:size].astype(dtype).reshape(shape)
+
+
+def _psum(x: chex.Array, axis_name: str, comm_dtype) -> chex.Array:
+    if comm_dtype is not None and jnp.issubdtype(x.dtype, jnp.floating) \
+            and jnp.dtype(comm_dtype) != x.dtype:
+        return compressed_psum(x, axis_name, comm_dtype)
+    return jax.lax.psum(x, axis_name)
+
+
+def tree_bucketed_psum(tree: chex.ArrayTree,
+                       axis_name: Optional[str] = None,
+                       bucket_size: Optional[int] = None,
+                       comm_dtype=None) -> chex.ArrayTree:
+    """
+        psum a tree with fused buckets and optional compression.
+
+        Args:
+            tree: the tree to reduce
+            axis_name: the pmap/shard_map axis, no-op if None
+            bucket_size: leaves with no more than `bucket_size` elements are
+                fused into one flat buffer per dtype. None to disable.
+            comm_dtype: the dtype used for communication of floating leaves,
+                eg: jnp.bfloat16. None to disable compression.
+    """
+    if axis_name is None:
+        return tree
+
+    leaves, treedef = jtu.tree_flatten(tree)
+    leaves = [jnp.asarray(x) for x in leaves]
+    reduced = [None] * len(leaves)
+
+    buckets = {}
+    for i, x in enumerate(leaves):
+        if bucket_size is not None and x.size <= bucket_size:
+            buckets.setdefault(x.dtype, []).append(i)
+        else:
+            reduced[i] = _psum(x, axis_name, comm_dtype)
+
+    for indices in buckets.values():
+        if len(indices) == 1:
+            i = indices[0]
+            reduced[i] = _psum(leaves[i], axis_name, comm_dtype)
+            continue
+
+        flat = jnp.concatenate([leaves[i].reshape(-1) for i in indices])
+        flat = _psum(flat, axis_name, comm_dtype)
+
+        offset = 0
+        for i in indices:
+            x = leaves[i]
+            reduced[i] = flat[offset:offset+x.size].reshape(x.shape)
+            offset += x.size
+
+    return jtu.tree_unflatten(treedef, reduced)
+
+
+def tree_bucketed_pmean(tree: chex.ArrayTree,
+                        axis_name: Optional[str] = None,
+                        bucket_size: Optional[int] = None,
+                        comm_dtype=None) -> chex.ArrayTree:
+    """
+        pmean version of `tree_bucketed_psum`.
+    """
+    if axis_name is None:
+        return tree
+
+    num_devices = _axis_size(axis_name)
+    tree = tree_bucketed_psum(tree, axis_name, bucket_size, comm_dtype)
+    return jtu.tree_map(lambda x: x / num_devices, tree)
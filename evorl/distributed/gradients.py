@@ -5,15 +5,31 @@ from typing import Callable, Optional
 import jax
 import optax
 
+from .compression import tree_bucketed_pmean
+
 
 def loss_and_pgrad(loss_fn: Callable[..., float],
                    pmap_axis_name: Optional[str],
-                   has_aux: bool = False):
+                   has_aux: bool = False,
+                   bucket_size: Optional[int] = None,
+                   comm_dtype=None):
+    """
+        Args:
+            bucket_size: fuse gradient leaves with no more than `bucket_size`
+                elements into one all-reduce. None to disable.
+            comm_dtype: all-reduce gradients in this dtype (eg: bfloat16)
+                with float32 accumulation. None to disable.
+    """
     g = jax.value_and_grad(loss_fn, has_aux=has_aux)
 
     def h(*args, **kwargs):
         value, grads = g(*args, **kwargs)
-        return value, jax.lax.pmean(grads, axis_name=pmap_axis_name)
+        if bucket_size is None and comm_dtype is None:
+            grads = jax.lax.pmean(grads, axis_name=pmap_axis_name)
+        else:
+            grads = tree_bucketed_pmean(
+                grads, pmap_axis_name, bucket_size, comm_dtype)
+        return value, grads
 
     return g if pmap_axis_name is None else h
 
@@ -21,7 +37,9 @@ def loss_and_pgrad(loss_fn: Callable[..., float],
 def gradient_update(loss_fn: Callable[..., float],
                     optimizer: optax.GradientTransformation,
                     pmap_axis_name: Optional[str],
-                    has_aux: bool = False):
+                    has_aux: bool = False,
+                    bucket_size: Optional[int] = None,
+                    comm_dtype=None):
     """Wrapper of the loss function that apply gradient updates.
 
     Args:
@@ -30,6 +48,8 @@ def gradient_update(loss_fn: Callable[..., float],
       pmap_axis_name: If relevant, the name of the pmap axis to synchronize
         gradients.
       has_aux: Whether the loss_fn has auxiliary data.
+      bucket_size: See `loss_and_pgrad`.
+      comm_dtype: See `loss_and_pgrad`.
 
     Returns:
       A function that takes the same argument as the loss function plus the
@@ -37,7 +57,8 @@ def gradient_update(loss_fn: Callable[..., float],
       and the new optimizer state.
     """
     loss_and_pgrad_fn = loss_and_pgrad(
-        loss_fn, pmap_axis_name=pmap_axis_name, has_aux=has_aux)
+        loss_fn, pmap_axis_name=pmap_axis_name, has_aux=has_aux,
+        bucket_size=bucket_size, comm_dtype=comm_dtype)
 
     def f(optimizer_state, params, *args, **kwargs):
         value, grads = loss_and_pgrad_fn(*args, **kwargs)
@@ -52,13 +73,16 @@ def gradient_update(loss_fn: Callable[..., float],
 def agent_gradient_update(loss_fn: Callable[..., float],
                           optimizer: optax.GradientTransformation,
                           pmap_axis_name: Optional[str],
-                          has_aux: bool = False):
+                          has_aux: bool = False,
+                          bucket_size: Optional[int] = None,
+                          comm_dtype=None):
     def _loss_fn(params, agent_state, sample_batch, key):
         return loss_fn(agent_state.replace(params=params),
                        sample_batch, key)
 
     loss_and_pgrad_fn = loss_and_pgrad(
-        _loss_fn, pmap_axis_name=pmap_axis_name, has_aux=has_aux)
+        _loss_fn, pmap_axis_name=pmap_axis_name, has_aux=has_aux,
+        bucket_size=bucket_size, comm_dtype=comm_dtype)
 
     def f(opt_state, agent_state, *args, **kwargs):
         value, grads = loss_and_pgrad_fn(
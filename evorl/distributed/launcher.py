@@ -0,0 +1,146 @@
+"""
+    Launch multi-process training on a single host:
+
+    python -m evorl.distributed.launcher -n 2 -- agent=a2c env=brax/ant
+
+    Each process runs `evorl.train` and joins the same jax.distributed
+    coordinator on localhost. Devices of all processes form one global mesh.
+"""
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from functools import partial
+
+import jax
+from omegaconf import DictConfig, OmegaConf
+
+logger = logging.getLogger(__name__)
+
+
+def initialize_distributed(config: DictConfig) -> None:
+    """
+        Join the jax.distributed cluster described by `config.distributed`.
+        Must be called before any jax computation.
+    """
+    dist_cfg = config.distributed
+    if dist_cfg.num_processes <= 1:
+        return
+
+    # CPU backend needs an explicit cross-process collectives implementation
+    jax.config.update("jax_cpu_collectives_implementation", "gloo")
+
+    local_device_ids = dist_cfg.local_device_ids
+    if local_device_ids is not None:
+        local_device_ids = OmegaConf.to_container(local_device_ids)
+
+    jax.distributed.initialize(
+        coordinator_address=dist_cfg.coordinator_address,
+        num_processes=dist_cfg.num_processes,
+        process_id=dist_cfg.process_id,
+        local_device_ids=local_device_ids
+    )
+    logger.info(
+        f"process {jax.process_index()}/{jax.process_count()}: "
+        f"local devices: {jax.local_devices()}, global devices: {jax.device_count()}"
+    )
+
+
+def _get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def _split_cpus(num_processes: int) -> list[list[int]]:
+    cpus = sorted(os.sched_getaffinity(0))
+    chunk = max(len(cpus) // num_processes, 1)
+    return [cpus[i*chunk:(i+1)*chunk] or cpus for i in range(num_processes)]
+
+
+def launch(num_processes: int, overrides: list[str], port: int = None,
+           cpu_affinity: bool = False, module: str = "evorl.train") -> int:
+    """
+        Start `num_processes` local processes and wait for all of them.
+
+        Args:
+            num_processes: number of processes
+            overrides: hydra overrides passed to every process
+            port: coordinator port, pick a free one if None
+            cpu_affinity: pin each process to a disjoint chunk of cpu cores
+            module: training entry module
+        Return:
+            the first non-zero return code, or 0
+    """
+    if port is None:
+        port = _get_free_port()
+
+    # all processes share the same output dir
+    run_dir = f"outputs/train/{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    cpu_chunks = _split_cpus(num_processes) if cpu_affinity else None
+
+    procs = []
+    for i in range(num_processes):
+        cmd = [
+            sys.executable, "-m", module, *overrides,
+            f"distributed.num_processes={num_processes}",
+            f"distributed.process_id={i}",
+            f"distributed.coordinator_address=localhost:{port}",
+            f"hydra.run.dir={run_dir}",
+            f"hydra.job.name=train_{i}",
+        ]
+
+        preexec_fn = None
+        if cpu_chunks is not None:
+            preexec_fn = partial(os.sched_setaffinity, 0, cpu_chunks[i])
+
+        logger.info(f"launch process {i}: {' '.join(cmd)}")
+        procs.append(subprocess.Popen(cmd, preexec_fn=preexec_fn))
+
+    return_code = 0
+    try:
+        while procs:
+            for p in procs:
+                code = p.poll()
+                if code is None:
+                    continue
+                procs.remove(p)
+                if code != 0 and return_code == 0:
+                    return_code = code
+                    # the others would hang in collectives
+                    for q in procs:
+                        q.terminate()
+                break
+            else:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        raise
+
+    return return_code
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Launch multi-process training on localhost")
+    parser.add_argument("-n", "--num-processes", type=int, default=2)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--cpu-affinity", action="store_true",
+                        help="pin each process to a disjoint set of cpu cores")
+    parser.add_argument("--module", type=str, default="evorl.train")
+    parser.add_argument("overrides", nargs="*",
+                        help="hydra overrides, eg: agent=a2c env=brax/ant")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(launch(args.num_processes, args.overrides, args.port,
+                    args.cpu_affinity, args.module))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import numpy as np
+import jax
+import jax.tree_util as jtu
+import chex
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
+from typing import Optional, Sequence
+
+
+def create_mesh(devices: Optional[Sequence[jax.Device]] = None, axis_name: str = "P") -> Mesh:
+    """
+        Create a 1D device mesh with a single data axis.
+    """
+    if devices is None:
+        devices = jax.devices()
+    return Mesh(np.asarray(devices), (axis_name,))
+
+
+def get_sharded_size(size: int, num_devices: int, name: str = "size") -> int:
+    """
+        Per-device size when spreading `size` items over `num_devices`.
+        Raise a ValueError when `size` is not divisible by `num_devices`,
+        rather than rounding up and silently changing the global size.
+    """
+    if size % num_devices != 0:
+        raise ValueError(
+            f"{name}({size}) cannot be divided by num_devices({num_devices})")
+    return size // num_devices
+
+
+def is_partition_spec(x) -> bool:
+    return isinstance(x, PartitionSpec)
+
+
+def replicated_spec(tree: chex.ArrayTree) -> chex.ArrayTree:
+    return jtu.tree_map(lambda x: PartitionSpec(), tree)
+
+
+def batch_sharded_spec(tree: chex.ArrayTree, axis_name: str) -> chex.ArrayTree:
+    """
+        Split the leading axis of every leaf over the data axis.
+    """
+    return jtu.tree_map(lambda x: PartitionSpec(axis_name), tree)
+
+
+def param_sharded_spec(tree: chex.ArrayTree, axis_name: str, num_devices: int) -> chex.ArrayTree:
+    """
+        Split the leading axis of leaves whose leading axis is divisible by
+        `num_devices`. Other leaves (eg: scalars, odd-sized biases) are replicated.
+    """
+    def _spec(x):
+        if x.ndim > 0 and x.shape[0] % num_devices == 0:
+            return PartitionSpec(axis_name)
+        else:
+            return PartitionSpec()
+
+    return jtu.tree_map(_spec, tree)
+
+
+def _device_put(x: chex.Array, sharding: NamedSharding) -> chex.Array:
+    if isinstance(x, jax.Array) and x.sharding == sharding:
+        return x
+    if sharding.is_fully_addressable:
+        return jax.device_put(x, sharding)
+    else:
+        # multi-process: every process holds the same global value,
+        # and only materializes its addressable shards.
+        x = np.asarray(x)
+        return jax.make_array_from_callback(x.shape, sharding, lambda idx: x[idx])
+
+
+def tree_device_put(tree: chex.ArrayTree, mesh: Mesh, specs: chex.ArrayTree) -> chex.ArrayTree:
+    """
+        Place a tree on the mesh. `specs` can be a prefix of `tree`.
+        Also work for the global mesh in multi-process.
+    """
+    def _put(spec, subtree):
+        sharding = NamedSharding(mesh, spec)
+        return jtu.tree_map(lambda x: _device_put(x, sharding), subtree)
+
+    return jtu.tree_map(_put, specs, tree, is_leaf=is_partition_spec)
+
+
+def tree_local_replica(tree: chex.ArrayTree) -> chex.ArrayTree:
+    """
+        Fetch the local copy of replicated global arrays, which could span
+        non-addressable devices in multi-process.
+    """
+    def _local(x):
+        if isinstance(x, jax.Array) and not x.is_fully_addressable:
+            return x.addressable_data(0)
+        return x
+
+    return jtu.tree_map(_local, tree)
+
+
+def tree_all_gather(tree: chex.ArrayTree, specs: chex.ArrayTree, axis_name: str) -> chex.ArrayTree:
+    """
+        Inside shard_map: gather the param-sharded leaves back to full arrays.
+    """
+    def _gather(spec, x):
+        if spec == PartitionSpec(axis_name):
+            return jax.lax.all_gather(x, axis_name, tiled=True)
+        return x
+
+    return jtu.tree_map(_gather, specs, tree, is_leaf=is_partition_spec)
+
+
+def tree_local_shard(tree: chex.ArrayTree, specs: chex.ArrayTree, axis_name: str, num_devices: int) -> chex.ArrayTree:
+    """
+        Inside shard_map: slice out the local shard of param-sharded leaves.
+        This is the inverse of `tree_all_gather`.
+    """
+    idx = jax.lax.axis_index(axis_name)
+
+    def _slice(spec, x):
+        if spec == PartitionSpec(axis_name):
+            size = x.shape[0] // num_devices
+            return jax.lax.dynamic_slice_in_dim(x, idx*size, size, axis=0)
+        return x
+
+    return jtu.tree_map(_slice, specs, tree, is_leaf=is_partition_spec)
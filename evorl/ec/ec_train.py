@@ -1,5 +1,8 @@
+from typing import Sequence
+
 import jax
 import jax.numpy as jnp
+from omegaconf import DictConfig, OmegaConf
 
 from evorl.ec import MOAlgorithmWrapper, MultiObjectiveBraxProblem
 
@@ -7,48 +10,46 @@ from evorl.utils.ec_utils import ParamVectorSpec
 from evorl.workflows import ECWorkflow
 from evorl.envs import create_wrapped_brax_env
 from evorl.agents.ec import DeterministicECAgent
-from evox import algorithms, monitors
+from evox import Monitor, algorithms, monitors
 from evox.operators import non_dominated_sort
 
-def train(seed=42):
-
-    pop_size = 1000
-
-    parallel_envs: int = 5
-    max_episode_steps: int = 1000
-
-    env_name = 'ant'
-    metric_names = ('reward_forward', 'reward_ctrl')
 
-    key = jax.random.PRNGKey(seed)
-
-    agent_key, workflow_key = jax.random.split(key)
+def build_workflow(config: DictConfig, monitors: Sequence[Monitor] = ()) -> ECWorkflow:
+    """
+        NSGA-II over the policy params of a `DeterministicECAgent` on a
+        Brax env, with `MultiObjectiveBraxProblem` as the problem.
+        `env_episode_length` (default: `max_episode_steps`) is the episode
+        length of the env wrapper, the problem stops at `max_episode_steps`.
+    """
+    metric_names = tuple(config.metric_names)
 
     env = create_wrapped_brax_env(
-        env_name,
-        episode_length=max_episode_steps,
-        parallel=parallel_envs,
+        config.env_name,
+        episode_length=OmegaConf.select(
+            config, 'env_episode_length', default=config.max_episode_steps),
+        parallel=config.num_envs,
         autoreset=False,
     )
 
     agent = DeterministicECAgent(
         action_space=env.action_space,
         obs_space=env.obs_space,
-        actor_hidden_layer_sizes=(32, 32),
-        normalize_obs=False
+        actor_hidden_layer_sizes=tuple(config.agent_network.actor_hidden_layer_sizes),
+        normalize_obs=config.normalize_obs
     )
 
     problem = MultiObjectiveBraxProblem(
         agent=agent,
         env=env,
-        num_episodes=5,
-        max_episode_steps=17,
-        discount=1.0,
+        num_episodes=config.num_episodes,
+        max_episode_steps=config.max_episode_steps,
+        discount=config.discount,
         metric_names=metric_names,
         flatten_objectives=True
     )
 
     # dummy_agent
+    agent_key = jax.random.split(jax.random.PRNGKey(config.seed))[0]
     agent_state = agent.init(agent_key)
     param_vec_spec = ParamVectorSpec(agent_state.params.policy_params)
 
@@ -56,7 +57,7 @@ def train(seed=42):
         lb=jnp.full(shape=(param_vec_spec.vec_size,), fill_value=-10),
         ub=jnp.full(shape=(param_vec_spec.vec_size,), fill_value=10),
         n_objs=len(metric_names),
-        pop_size=pop_size,
+        pop_size=config.pop_size,
     )
 
     nsga2_rl = MOAlgorithmWrapper(
@@ -68,16 +69,35 @@ def train(seed=42):
         params = agent_state.params.replace(policy_params=cand)
         return agent_state.replace(params=params)
 
-    monitor = monitors.EvalMonitor()
-
-    workflow = ECWorkflow(
+    return ECWorkflow(
         algorithm=nsga2_rl,
         problem=problem,
         opt_direction='max',
         sol_transforms=[jax.vmap(_sol_transform)],
-        monitors=[monitor]
+        monitors=list(monitors)
     )
 
+
+def train(seed=42):
+    config = OmegaConf.create(dict(
+        seed=seed,
+        env_name='ant',
+        num_envs=5,
+        env_episode_length=1000,
+        max_episode_steps=17,
+        num_episodes=5,
+        discount=1.0,
+        pop_size=1000,
+        metric_names=['reward_forward', 'reward_ctrl'],
+        normalize_obs=False,
+        agent_network=dict(actor_hidden_layer_sizes=[32, 32]),
+    ))
+
+    workflow_key = jax.random.split(jax.random.PRNGKey(seed))[1]
+
+    monitor = monitors.EvalMonitor()
+    workflow = build_workflow(config, monitors=[monitor])
+
     state = workflow.init(workflow_key)
     for i in range(1000):
         state = workflow.step(state)
@@ -2,10 +2,14 @@ import jax
 import jax.numpy as jnp
 from evox import Problem, State
 import chex
-from typing import Tuple, Union, Callable, List
+from typing import Optional, Tuple, Union, Callable, List
 
 from evorl.agents import Agent, AgentState
 from evorl.envs import create_wrapped_brax_env, Env, EnvState
+from evorl.networks.folding import with_folded_policy
+from evorl.networks.quantization import (
+    QUANTIZATION_MODES, quantize_policy_network, quantize_policy_params
+)
 from evorl.rollout import SampleBatch
 from evorl.types import Reward, RewardDict, Action, PolicyExtraInfo, PyTreeDict
 from evorl.utils.toolkits import compute_discount_return, compute_episode_length
@@ -32,6 +36,8 @@ class MultiObjectiveBraxProblem(Problem):
         metric_names: Tuple[str] = ('reward',),
         flatten_objectives: bool = True,
         reduce_fn: Union[ReductionFn, List[ReductionFn]] = jnp.mean,
+        quantization: Optional[str] = None,
+        fold_normalizer: bool = True,
     ):
         """
             Args:
@@ -42,6 +48,16 @@ class MultiObjectiveBraxProblem(Problem):
                 metric_names: names of the metrics to record as objectives.
                     By default, only original reward is recorded.
                 flatten_objectives: whether to flatten the objectives.
+                quantization: None, 'int8' or 'bfloat16'. Evaluate the
+                    quantized policy network of each individual, the
+                    params are quantized once per evaluation.
+                fold_normalizer: fold the obs normalizer of each individual
+                    into the first layer of its policy network once per
+                    evaluation, instead of normalizing every obs. The
+                    population is only folded when every feature of every
+                    individual is safe to fold, otherwise it keeps the
+                    normalizer. Skipped for 'int8' quantization, see
+                    `evorl.networks.folding.with_folded_policy`.
         """
         self.agent = agent
         self.env = env
@@ -51,6 +67,11 @@ class MultiObjectiveBraxProblem(Problem):
         self.discount = discount
         self.metric_names = metric_names
         self.flatten_objectives = flatten_objectives
+        if quantization is not None and quantization not in QUANTIZATION_MODES:
+            raise ValueError(
+                f'quantization {quantization} not supported, choose from {QUANTIZATION_MODES}')
+        self.quantization = quantization
+        self.fold_normalizer = fold_normalizer
 
         if isinstance(reduce_fn, list):
             assert len(reduce_fn) == len(metric_names), "when reduce_fn is a list, it should have the same length as metric_names"
@@ -65,8 +86,6 @@ class MultiObjectiveBraxProblem(Problem):
                         f"set new num_episodes={self.num_iters*parallel_envs}"
                         )
 
-        self.agent_eval_actions = jax.vmap(
-            self.agent.evaluate_actions, axis_name='pop')
         # Note: there are two vmap: [#pop, #envs, ...]
         self.env_reset = jax.vmap(self.env.reset, axis_name='pop')
         self.env_step = jax.vmap(self.env.step, axis_name='pop')
@@ -77,8 +96,38 @@ class MultiObjectiveBraxProblem(Problem):
         )
 
     def evaluate(self, state: State, pop_agent_state: chex.ArrayTree) -> Tuple[chex.ArrayTree, State]:
+        objectives, _, key = self._fold_and_evaluate(pop_agent_state, state.key)
+        return objectives, state.update(key=key)
+
+    def evaluate_with_env_steps(self, state: State, pop_agent_state: chex.ArrayTree) -> Tuple[chex.ArrayTree, chex.Array, State]:
+        """
+            `evaluate`, also returning the env steps of the evaluation: the
+            sum of the episode lengths, without the steps skipped after the
+            episodes are done. Used by `ECWorkflow` for `perf/env_steps_per_sec`.
+        """
+        objectives, num_env_steps, key = self._fold_and_evaluate(
+            pop_agent_state, state.key)
+        return objectives, num_env_steps, state.update(key=key)
+
+    def _fold_and_evaluate(self, pop_agent_state: chex.ArrayTree, key: chex.PRNGKey) -> Tuple[chex.ArrayTree, chex.Array, chex.PRNGKey]:
+        # the policy network of the agent is lazily initialized,
+        # fold & quantize it at tracing time
+        if self.fold_normalizer and self.quantization != 'int8':
+            return with_folded_policy(
+                partial(self._evaluate, key=key),
+                self.agent, pop_agent_state, population=True)
+        return self._evaluate(self.agent, pop_agent_state, key)
+
+    def _evaluate(self, agent, pop_agent_state: chex.ArrayTree, key: chex.PRNGKey) -> Tuple[chex.ArrayTree, chex.Array, chex.PRNGKey]:
         pop_size = jax.tree_leaves(pop_agent_state)[0].shape[0]
 
+        if self.quantization is not None:
+            agent = quantize_policy_network(agent, self.quantization)
+            pop_agent_state = jax.vmap(partial(
+                quantize_policy_params, mode=self.quantization))(pop_agent_state)
+        agent_eval_actions = jax.vmap(
+            agent.evaluate_actions, axis_name='pop')
+
         def _evaluate_fn(key, unused_t):
 
             next_key, init_env_key, rollout_key = jax.random.split(key, 3)
@@ -86,7 +135,7 @@ class MultiObjectiveBraxProblem(Problem):
                 jax.random.split(init_env_key, num=pop_size))
 
             env_state, episode_trajectory = eval_rollout_episode(
-                self.env_step, self.agent_eval_actions,
+                self.env_step, agent_eval_actions,
                 env_state, pop_agent_state,
                 jax.random.split(rollout_key, num=pop_size),
                 self.max_episode_steps,
@@ -110,12 +159,16 @@ class MultiObjectiveBraxProblem(Problem):
                     # repeats the terminal step value.
                     objectives[name] = episode_trajectory.rewards[name][-1]
 
-            return next_key, objectives  # [#envs]
+            num_env_steps = jnp.minimum(
+                compute_episode_length(episode_trajectory.dones),
+                self.max_episode_steps).sum()
+
+            return next_key, (objectives, num_env_steps)  # [#envs]
 
         # [#iters, #pop, #envs]
-        key, objectives = jax.lax.scan(
+        key, (objectives, num_env_steps) = jax.lax.scan(
             _evaluate_fn,
-            state.key, (),
+            key, (),
             length=self.num_iters)
 
         for k, reduce_fn in zip(objectives.keys(), self.reduce_fn):
@@ -130,7 +183,7 @@ class MultiObjectiveBraxProblem(Problem):
             # by default, we use the mean value over different episodes.
             objectives = jnp.stack(list(objectives.values()), axis=-1)
 
-        return objectives, state.update(key=key)
+        return objectives, num_env_steps.sum(), key
 
 
 def eval_env_step(
@@ -52,11 +52,15 @@ class BraxAdapter(EnvAdapter):
         state.info.update(brax_state.info)
         state.info.metrics.update(brax_state.metrics)
 
+        # some brax envs return weak-typed reward & done in step() but not in
+        # reset(), which causes a retrace of the jitted workflow step.
         return state.replace(
             env_state=brax_state,
             obs=brax_state.obs,
-            reward=brax_state.reward,
-            done=brax_state.done,
+            reward=jax.lax.convert_element_type(
+                brax_state.reward, state.reward.dtype),
+            done=jax.lax.convert_element_type(
+                brax_state.done, state.done.dtype),
         )
 
     @property
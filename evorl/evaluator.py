@@ -4,6 +4,7 @@ import chex
 from evorl.envs import Env
 from evorl.agents import Agent
 from evorl.metrics import EvaluateMetric
+from evorl.networks.folding import with_folded_policy
 from evorl.rollout import eval_rollout_episode
 from evorl.utils.toolkits import compute_discount_return, compute_episode_length
 
@@ -11,6 +12,8 @@ import dataclasses
 import logging
 
 import math
+from functools import partial
+from typing import Any, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +24,12 @@ class Evaluator:
     agent: Agent
     max_episode_steps: int
     discount: float = 1.0
+    # eg: TrajectoryWriter(episodic=True), save the eval episodes
+    trajectory_writer: Optional[Any] = None
+    # fold the frozen obs normalizer into the first layer of the policy
+    # network when it is safe, see `with_folded_policy`. Off by default:
+    # under the seed vmap of multi-seed training, both branches would run.
+    fold_normalizer: bool = False
     # pmap_axis_name: Optional[str] = None
 
     # def enable_multi_devices(self, pmap_axis_name: Optional[str] = None):
@@ -33,20 +42,33 @@ class Evaluator:
             logger.warn(f"num_episode ({num_episodes}) cannot be divided by parallel_envs ({num_envs}),"
                         f"set new num_episodes={self.num_iters*num_envs}"
                         )
+
+        if self.fold_normalizer:
+            return with_folded_policy(
+                partial(self._evaluate, num_iters=num_iters, key=key),
+                self.agent, agent_state)
+        return self._evaluate(self.agent, agent_state, num_iters, key)
+
+    def _evaluate(self, agent, agent_state, num_iters: int, key: chex.PRNGKey) -> EvaluateMetric:
         def _evaluate_fn(key, unused_t):
 
             next_key, init_env_key = jax.random.split(key, 2)
-            env_state = self.env.reset(init_env_key)
+            with jax.named_scope("eval_rollout"):
+                env_state = self.env.reset(init_env_key)
+
+                env_state, episode_trajectory = eval_rollout_episode(
+                    self.env, agent, env_state, agent_state,
+                    key, self.max_episode_steps
+                )
 
-            env_state, episode_trajectory = eval_rollout_episode(
-                self.env, self.agent, env_state, agent_state,
-                key, self.max_episode_steps
-            )
+                if self.trajectory_writer is not None:
+                    self.trajectory_writer.write_async(episode_trajectory)
 
-            discount_returns = compute_discount_return(
-                episode_trajectory.rewards, episode_trajectory.dones, self.discount)
+            with jax.named_scope("eval_metrics"):
+                discount_returns = compute_discount_return(
+                    episode_trajectory.rewards, episode_trajectory.dones, self.discount)
 
-            episode_lengths = compute_episode_length(episode_trajectory.dones)
+                episode_lengths = compute_episode_length(episode_trajectory.dones)
 
             return next_key, (discount_returns, episode_lengths)  # [#envs]
 
@@ -0,0 +1,245 @@
+"""
+    Export the deterministic policy of a trained agent as a `jax.export`
+    artifact:
+
+    python -m evorl.export agent=ppo env=brax/ant resume=<output_dir> export.batch_sizes=[1,16,256]
+
+    The `evaluate_actions` of the agent (obs normalizer, policy network and
+    the mode of the action distribution) is lowered to StableHLO for each
+    batch size, and saved with the params:
+
+        <path>/metadata.json
+        <path>/params.npz
+        <path>/policy_b<batch_size>.jaxexport
+
+    `ExportedPolicy.load(path)` runs it without building the agent, the flax
+    modules or tracing `evaluate_actions`; only the deserialized module is
+    compiled at the first call of each batch size.
+"""
+import json
+import logging
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Union
+
+import hydra
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import numpy as np
+import chex
+from jax import export as jax_export
+from omegaconf import DictConfig, OmegaConf
+
+from evorl.sample_batch import SampleBatch
+from evorl.utils.cfg_utils import get_output_dir
+from evorl.utils.checkpoint import restore_checkpoint
+
+if TYPE_CHECKING:
+    # evorl.agents imports all envs, keep the loader light
+    from evorl.agents import Agent, AgentState
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = 'metadata.json'
+PARAMS_FILE = 'params.npz'
+
+
+def _exported_file(batch_size: int) -> str:
+    return f'policy_b{batch_size}.jaxexport'
+
+
+def export_policy(
+    agent: "Agent",
+    agent_state: "AgentState",
+    path: Union[str, Path],
+    batch_sizes: Sequence[int] = (1,),
+    platforms: Optional[Sequence[str]] = None
+) -> Path:
+    """
+        Export `agent.evaluate_actions` as a function of (params, obs).
+
+        Args:
+            agent_state: the trained agent state, saved as the params.
+            batch_sizes: an artifact per batch size, the loader pads the
+                obs to the nearest one.
+            platforms: lowering platforms, eg: ['cpu', 'cuda'].
+                Default: the current backend.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    agent_state = jax.device_get(agent_state)
+    leaves, treedef = jtu.tree_flatten(agent_state)
+
+    def policy_fn(leaves, obs):
+        # the params are flattened, since only builtin pytree nodes
+        # are serializable
+        agent_state = jtu.tree_unflatten(treedef, leaves)
+        actions, _ = agent.evaluate_actions(
+            agent_state, SampleBatch(obs=obs), jax.random.PRNGKey(0))
+        return actions
+
+    obs_spec = agent.obs_space.sample(jax.random.PRNGKey(0))
+    leaves_spec = [jax.ShapeDtypeStruct(np.shape(x), jnp.result_type(x))
+                   for x in leaves]
+
+    batch_sizes = sorted(set(int(b) for b in batch_sizes))
+    for batch_size in batch_sizes:
+        exported = jax_export.export(jax.jit(policy_fn), platforms=platforms)(
+            leaves_spec,
+            jax.ShapeDtypeStruct((batch_size, *obs_spec.shape), obs_spec.dtype)
+        )
+        (path/_exported_file(batch_size)).write_bytes(exported.serialize())
+
+    np.savez(path/PARAMS_FILE, *[np.asarray(x) for x in leaves])
+
+    action_aval = exported.out_avals[0]
+    metadata = dict(
+        agent=type(agent).__name__,
+        obs_shape=list(obs_spec.shape),
+        obs_dtype=str(obs_spec.dtype),
+        action_shape=list(action_aval.shape[1:]),
+        action_dtype=str(action_aval.dtype),
+        # npz stores bfloat16 as raw bytes
+        params_dtypes=[str(jnp.result_type(x)) for x in leaves],
+        batch_sizes=batch_sizes,
+        platforms=list(exported.platforms),
+        jax_version=jax.__version__
+    )
+    with (path/METADATA_FILE).open('w') as f:
+        json.dump(metadata, f, indent=4)
+
+    logger.info(f'export {metadata["agent"]} policy to {path}: {metadata}')
+    return path
+
+
+class ExportedPolicy:
+    """
+        Deterministic policy loaded from `export_policy`.
+
+        Usage:
+            policy = ExportedPolicy.load(path)
+            actions = policy(obs)  # obs: [B, *obs_shape] or [*obs_shape]
+    """
+
+    def __init__(self, exported: Dict[int, jax_export.Exported], params: Sequence[chex.Array], metadata: dict):
+        self.exported = exported
+        self.params = list(params)
+        self.metadata = metadata
+        self.batch_sizes = sorted(exported.keys())
+        self.obs_shape = tuple(metadata['obs_shape'])
+        self.obs_dtype = np.dtype(metadata['obs_dtype'])
+        self._fns = {}
+
+    @classmethod
+    def load(cls, path: Union[str, Path], device: Optional[jax.Device] = None) -> "ExportedPolicy":
+        path = Path(path)
+        with (path/METADATA_FILE).open('r') as f:
+            metadata = json.load(f)
+
+        with np.load(path/PARAMS_FILE) as params_file:
+            params = [params_file[f'arr_{i}'] for i in range(len(params_file.files))]
+        if 'params_dtypes' in metadata:
+            params = [x.view(jnp.dtype(dtype))
+                      for x, dtype in zip(params, metadata['params_dtypes'])]
+        params = jax.device_put(params, device)
+
+        exported = {
+            batch_size: jax_export.deserialize(
+                bytearray((path/_exported_file(batch_size)).read_bytes()))
+            for batch_size in metadata['batch_sizes']
+        }
+        return cls(exported, params, metadata)
+
+    def _fn(self, batch_size: int):
+        if batch_size not in self._fns:
+            self._fns[batch_size] = jax.jit(self.exported[batch_size].call)
+        return self._fns[batch_size]
+
+    def compile(self) -> None:
+        """
+            Compile all batch sizes ahead of the first calls.
+        """
+        for batch_size in self.batch_sizes:
+            obs = np.zeros((batch_size, *self.obs_shape), self.obs_dtype)
+            jax.block_until_ready(self._fn(batch_size)(self.params, obs))
+
+    def __call__(self, obs: chex.Array) -> chex.Array:
+        obs = np.asarray(obs, dtype=self.obs_dtype)
+        if obs.shape == self.obs_shape:
+            return self(obs[None])[0]
+
+        num_obs = obs.shape[0]
+        max_batch_size = self.batch_sizes[-1]
+        if num_obs > max_batch_size:
+            return jnp.concatenate([
+                self(obs[i:i+max_batch_size])
+                for i in range(0, num_obs, max_batch_size)
+            ])
+
+        # pad to the nearest exported batch size
+        batch_size = next(b for b in self.batch_sizes if b >= num_obs)
+        if batch_size > num_obs:
+            obs = np.concatenate([
+                obs, np.zeros((batch_size-num_obs, *self.obs_shape), obs.dtype)])
+
+        actions = self._fn(batch_size)(self.params, obs)
+        return actions[:num_obs]
+
+
+@hydra.main(version_base=None, config_path="../configs", config_name="config")
+def main(config: DictConfig) -> None:
+    if config.resume is None:
+        raise ValueError('resume is not set, give the checkpoint to export by resume=<output_dir>')
+
+    workflow_cls = hydra.utils.get_class(config.workflow_cls)
+    workflow = workflow_cls.build_from_config(config, enable_jit=True)
+
+    # only the structure of agent_state is needed: skip the env & buffer init
+    template = workflow.agent.init(jax.random.PRNGKey(config.seed))
+    restored, step = restore_checkpoint(
+        config.resume, dict(agent_state=template), config.resume_step)
+    agent_state = restored['agent_state']
+    logger.info(f'export the agent_state of checkpoint {step} of {config.resume}')
+
+    agent = workflow.agent
+    quantization = OmegaConf.select(config, 'export.quantization', default=None)
+    if OmegaConf.select(config, 'export.fold_normalizer', default=True) and \
+            quantization != 'int8':
+        from evorl.networks import (
+            can_fold_policy_normalizer, fold_policy_normalizer,
+            fold_policy_normalizer_params, is_fold_safe
+        )
+        if can_fold_policy_normalizer(agent):
+            mean_std = agent_state.obs_preprocessor_state
+            if is_fold_safe(mean_std.mean, mean_std.std):
+                agent_state = fold_policy_normalizer_params(agent, agent_state)
+                agent = fold_policy_normalizer(agent)
+            else:
+                logger.warning('the obs normalizer has near-constant features, export it unfolded')
+    if quantization is not None:
+        from evorl.networks import quantize_policy_network, quantize_policy_params
+        agent = quantize_policy_network(agent, quantization)
+        agent_state = quantize_policy_params(agent_state, quantization)
+
+    path = config.export.path
+    path = get_output_dir()/'policy' if path is None else Path(path)
+    export_policy(
+        agent, agent_state, path,
+        batch_sizes=config.export.batch_sizes,
+        platforms=config.export.platforms
+    )
+
+    # cold start of the artifact
+    start = time.perf_counter()
+    policy = ExportedPolicy.load(path)
+    policy.compile()
+    logger.info(
+        f'load & compile {policy.batch_sizes}: {(time.perf_counter()-start)*1e3:.2f} ms')
+
+    workflow.close()
+
+
+if __name__ == "__main__":
+    main()
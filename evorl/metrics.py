@@ -1,12 +1,15 @@
+import time
 import jax
 import jax.numpy as jnp
+import jax.tree_util as jtu
 import numpy as np
 import chex
 from flax import struct
-from typing import Optional, Callable
+from omegaconf import DictConfig, OmegaConf
+from typing import Any, Dict, Optional, Callable, Sequence
 
 
-from .types import LossDict, PyTreeDict, PyTreeNode
+from .types import LossDict, PyTreeDict, PyTreeNode, MISSING_REWARD
 from .distributed import pmean, psum, tree_pmean
 import dataclasses
 
@@ -116,3 +119,163 @@ def _to_local_dict_inner(obj, dict_factory):
             return obj.tolist()
         else:
             return obj
+
+
+def _to_tree_dict(obj):
+    """
+        Like to_local_dict(), but keep the arrays on device and drop None.
+    """
+    if _is_dataclass_instance(obj):
+        obj = {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    if isinstance(obj, (dict, PyTreeDict)):
+        return {k: _to_tree_dict(v) for k, v in obj.items() if v is not None}
+    return obj
+
+
+def _init_window(metrics: chex.ArrayTree) -> chex.ArrayTree:
+    return jtu.tree_map(
+        lambda x: dict(
+            count=jnp.zeros(jnp.shape(x), dtype=jnp.int32),
+            sum=jnp.zeros(jnp.shape(x), dtype=jnp.float32),
+            min=jnp.full(jnp.shape(x), jnp.inf, dtype=jnp.float32),
+            max=jnp.full(jnp.shape(x), -jnp.inf, dtype=jnp.float32),
+        ),
+        metrics
+    )
+
+
+def _update_window(window: chex.ArrayTree, metrics: chex.ArrayTree) -> chex.ArrayTree:
+    def _update(stats, x):
+        x = jnp.asarray(x, dtype=jnp.float32)
+        # eg: train_episode_return without finished episodes
+        valid = x != MISSING_REWARD
+        return dict(
+            count=stats['count'] + valid,
+            sum=stats['sum'] + jnp.where(valid, x, 0),
+            min=jnp.where(valid, jnp.minimum(stats['min'], x), stats['min']),
+            max=jnp.where(valid, jnp.maximum(stats['max'], x), stats['max']),
+        )
+
+    return jtu.tree_map(
+        _update, window, metrics,
+        is_leaf=lambda x: isinstance(x, dict) and 'count' in x)
+
+
+class MetricAggregator:
+    """
+        Windowed mean, min & max of the train metrics. The statistics are
+        accumulated on device without synchronization, and written to the
+        recorder every `flush_interval` iterations or `flush_seconds`.
+        Entries equal to `MISSING_REWARD` are skipped in the window, and a
+        metric without any valid entry is omitted.
+
+        Usage:
+            for i in range(num_iters):
+                train_metrics, state = workflow.step(state)
+                aggregator.add(i, train_metrics, latest=state.metrics)
+            aggregator.flush()
+
+        Args:
+            recorder: eg: the `ChainRecorder` of the workflow.
+            flush_interval: flush every k iterations.
+            flush_seconds: also flush when the window exceeds this time.
+            count_metrics: also report `<name>_count`, the number of valid
+                entries in the window.
+    """
+
+    def __init__(self,
+                 recorder,
+                 flush_interval: int = 1,
+                 flush_seconds: Optional[float] = None,
+                 count_metrics: Sequence[str] = ('train_episode_return',)):
+        self.recorder = recorder
+        self.flush_interval = flush_interval
+        self.flush_seconds = flush_seconds
+        self.count_metrics = tuple(count_metrics)
+
+        self._update = jax.jit(_update_window)
+        self._window = None
+        self._window_size = 0
+        self._window_start = time.monotonic()
+        self._step = None
+        self._latest = {}
+
+    @classmethod
+    def from_config(cls, config: DictConfig, recorder) -> "MetricAggregator":
+        """
+            Build from the `metric_aggregator` section of the config.
+        """
+        return cls(
+            recorder,
+            flush_interval=OmegaConf.select(
+                config, 'metric_aggregator.flush_interval', default=1),
+            flush_seconds=OmegaConf.select(
+                config, 'metric_aggregator.flush_seconds', default=None),
+        )
+
+    @property
+    def windowed(self) -> bool:
+        """
+            Whether the window may contain more than one iteration. If not,
+            only the mean (ie: the raw value) is written.
+        """
+        return self.flush_interval > 1 or self.flush_seconds is not None
+
+    def add(self, step: int, *metrics: Any, latest: Optional[Any] = None) -> None:
+        """
+            Args:
+                step: the current iteration.
+                metrics: train metrics to be aggregated, eg: `TrainMetric`
+                    or a dict. Multiple metrics are merged.
+                latest: metrics only written with their latest value at
+                    flush, eg: the cumulative `WorkflowMetric`.
+        """
+        metrics = {k: v for m in metrics for k, v in _to_tree_dict(m).items()}
+        if self._window is None:
+            self._window = _init_window(metrics)
+        self._window = self._update(self._window, metrics)
+        self._window_size += 1
+        self._step = step
+        if latest is not None:
+            self._latest = latest
+
+        if self._window_size >= self.flush_interval or (
+                self.flush_seconds is not None and
+                time.monotonic() - self._window_start >= self.flush_seconds):
+            self.flush()
+
+    def _summarize(self, window: Dict[str, Any]) -> Dict[str, Any]:
+        data = {}
+        for name, stats in window.items():
+            if 'count' not in stats:
+                data[name] = self._summarize(stats)
+                continue
+
+            count = stats['count']
+            if np.all(count == 0):
+                continue
+
+            mean = stats['sum'] / np.maximum(count, 1)
+            data[name] = mean.tolist()
+            if self.windowed:
+                data[f'{name}_min'] = stats['min'].tolist()
+                data[f'{name}_max'] = stats['max'].tolist()
+                if name in self.count_metrics:
+                    data[f'{name}_count'] = count.tolist()
+        return data
+
+    def flush(self) -> None:
+        if self._window_size == 0:
+            return
+
+        data = self._summarize(jax.device_get(self._window))
+        if _is_dataclass_instance(self._latest):
+            data = {**to_local_dict(self._latest), **data}
+        else:
+            data = {**self._latest, **data}
+        self.recorder.write(data, self._step)
+
+        self._window = None
+        self._window_size = 0
+        self._window_start = time.monotonic()
+        self._latest = {}
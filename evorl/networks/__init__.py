@@ -4,4 +4,20 @@ from .linear import (
     make_policy_network,
     make_value_network,
     make_q_network,
-)
\ No newline at end of file
+)
+from .folding import (
+    can_fold_policy_normalizer,
+    fold_normalizer_into_dense,
+    fold_policy_normalizer,
+    fold_policy_normalizer_params,
+    fold_safe_features,
+    is_fold_safe,
+    with_folded_policy,
+)
+from .quantization import (
+    QuantizedMLP,
+    quantize_mlp,
+    quantize_mlp_params,
+    quantize_policy_network,
+    quantize_policy_params,
+)
@@ -0,0 +1,153 @@
+"""
+    Fold the frozen observation normalizer of an agent into the first Dense
+    layer of its `MLP` policy network, for evaluation-only policies:
+
+        W' = W / std[:, None]
+        b' = b - (mean / std) @ W
+
+    so that `policy(normalize(obs)) == folded_policy(obs)` up to float
+    rounding, without the elementwise normalization of every obs. Usage:
+
+        fagent = fold_policy_normalizer(agent)
+        fagent_state = fold_policy_normalizer_params(agent, agent_state)
+        actions, _ = fagent.evaluate_actions(fagent_state, sample_batch, key)
+
+    The fold is unsafe in float32 for near-constant features: the std is
+    clipped at `running_statistics.update(std_min_value=1e-6)`, so W / std
+    is huge and `b - (mean / std) @ W` cancels catastrophically. Use
+    `with_folded_policy` to fold only when every feature passes
+    `fold_safe_features`, and keep the original agent and its normalizer
+    otherwise. The check is done once for the whole (population of) agent
+    state(s), outside the rollout, so the policy has no per-step branch.
+
+    Only the policy network is folded: the folded agent must not be used to
+    compute values nor losses. Fold before a 'bfloat16' quantization, but
+    not before 'int8': the per-channel scale would be dominated by the rows
+    of near-constant features.
+"""
+import copy
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable
+
+import chex
+import jax
+import jax.numpy as jnp
+
+from .linear import MLP
+
+if TYPE_CHECKING:
+    from evorl.agents import Agent, AgentState
+
+FOLD_MIN_STD = 1e-4
+FOLD_MAX_MEAN_STD_RATIO = 1e3
+
+
+def _identity_preprocessor(obs: chex.Array, obs_preprocessor_state) -> chex.Array:
+    return obs
+
+
+def can_fold_policy_normalizer(agent: "Agent") -> bool:
+    """
+        Whether the agent normalizes the obs before a float `MLP` policy
+        network with biases.
+    """
+    return (getattr(agent, 'normalize_obs', False) and
+            getattr(agent, 'obs_preprocessor', None) is not _identity_preprocessor and
+            isinstance(getattr(agent, 'policy_network', None), MLP) and
+            agent.policy_network.bias)
+
+
+def fold_safe_features(mean: chex.Array, std: chex.Array) -> chex.Array:
+    """
+        Traced bool per feature, whether folding its (mean, std) keeps the
+        float32 precision.
+    """
+    return (std > FOLD_MIN_STD) & (jnp.abs(mean / std) <= FOLD_MAX_MEAN_STD_RATIO)
+
+
+def is_fold_safe(mean: chex.Array, std: chex.Array) -> chex.Array:
+    """
+        Traced bool, whether every feature of (mean, std) is safe to fold.
+        Also accepts the stacked (mean, std) of a population.
+    """
+    return jnp.all(fold_safe_features(mean, std))
+
+
+def fold_normalizer_into_dense(params: chex.ArrayTree, mean: chex.Array, std: chex.Array) -> chex.ArrayTree:
+    """
+        Fold `(x - mean) / std` into {'kernel': [in, out], 'bias': [out]}
+        of a `nn.Dense`. Traceable, eg: vmapped over a population. It
+        doesn't check `is_fold_safe`.
+    """
+    kernel = params['kernel']
+    scale = (1.0 / std).astype(kernel.dtype)
+    folded_kernel = kernel * scale[:, None]
+    folded_bias = params['bias'] - jnp.dot(mean.astype(kernel.dtype), folded_kernel)
+    return dict(params, kernel=folded_kernel, bias=folded_bias)
+
+
+def fold_policy_normalizer(agent: "Agent") -> "Agent":
+    """
+        A copy of the initialized agent, whose obs preprocessor is replaced
+        by the identity. Its `compute_actions` and `evaluate_actions` then
+        expect the params from `fold_policy_normalizer_params`. Return the
+        agent itself when it can't be folded.
+    """
+    if not can_fold_policy_normalizer(agent):
+        return agent
+    fagent = copy.copy(agent)
+    fagent.set_frozen_attr('obs_preprocessor', _identity_preprocessor)
+    return fagent
+
+
+def fold_policy_normalizer_params(agent: "Agent", agent_state: "AgentState") -> "AgentState":
+    """
+        Fold the `obs_preprocessor_state` of `agent_state` into the first
+        layer of the policy params, see `fold_policy_normalizer`. It
+        doesn't check `is_fold_safe`, see `with_folded_policy`.
+    """
+    if not can_fold_policy_normalizer(agent):
+        return agent_state
+
+    mean_std = agent_state.obs_preprocessor_state
+    policy_params = agent_state.params.policy_params
+    layers = dict(policy_params['params'])
+    layers['hidden_0'] = fold_normalizer_into_dense(
+        layers['hidden_0'], mean_std.mean, mean_std.std)
+
+    params = agent_state.params.replace(
+        policy_params=dict(policy_params, params=layers))
+    return agent_state.replace(params=params, obs_preprocessor_state=None)
+
+
+def with_folded_policy(
+        fn: Callable[["Agent", "AgentState"], Any],
+        agent: "Agent", agent_state: "AgentState", population: bool = False) -> Any:
+    """
+        `fn(agent, agent_state)` with the folded agent when every feature
+        is safe to fold, else with the original agent and normalizer.
+
+        The fold and the check happen once, by a `lax.cond` around `fn`
+        (eg: a whole evaluation): only one branch runs, unless this is
+        itself vmapped, where the cond becomes a select running both.
+
+        Args:
+            fn: traceable, returning the same structure for both agents.
+            population: agent_state is stacked over a leading population
+                axis; it is folded only when every individual is safe.
+    """
+    if not can_fold_policy_normalizer(agent):
+        return fn(agent, agent_state)
+
+    fagent = fold_policy_normalizer(agent)
+    fold_params = partial(fold_policy_normalizer_params, agent)
+    if population:
+        fold_params = jax.vmap(fold_params)
+
+    mean_std = agent_state.obs_preprocessor_state
+    return jax.lax.cond(
+        is_fold_safe(mean_std.mean, mean_std.std),
+        lambda agent_state: fn(fagent, fold_params(agent_state)),
+        lambda agent_state: fn(agent, agent_state),
+        agent_state
+    )
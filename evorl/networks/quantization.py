@@ -0,0 +1,163 @@
+"""
+    Post-training weight quantization of `MLP` policy networks for inference.
+
+    - 'int8': symmetric per-output-channel int8 kernels with a float32 scale;
+        the matmul accumulates in float32 and the scale is applied to its
+        output.
+    - 'bfloat16': bfloat16 kernels and inputs, accumulated in float32.
+
+    Biases and activations stay in float32. Usage:
+
+        qagent = quantize_policy_network(agent, 'int8')
+        qagent_state = quantize_policy_params(agent_state, 'int8')
+        actions, _ = qagent.evaluate_actions(qagent_state, sample_batch, key)
+"""
+import copy
+from typing import TYPE_CHECKING, Callable, Sequence
+
+import chex
+import jax
+import jax.numpy as jnp
+from flax import linen as nn
+
+from .linear import MLP
+
+if TYPE_CHECKING:
+    from evorl.agents import Agent, AgentState
+
+QUANTIZATION_MODES = ('int8', 'bfloat16')
+
+ActivationFn = Callable[[jnp.ndarray], jnp.ndarray]
+
+
+def _check_mode(mode: str) -> None:
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(
+            f'quantization mode {mode} not supported, choose from {QUANTIZATION_MODES}')
+
+
+def _dense_dot(inputs: jnp.ndarray, kernel: jnp.ndarray) -> jnp.ndarray:
+    return jax.lax.dot_general(
+        inputs, kernel,
+        (((inputs.ndim - 1,), (0,)), ((), ())),
+        preferred_element_type=jnp.float32
+    )
+
+
+class QuantizedDense(nn.Module):
+    """
+        Inference-only Dense layer with quantized kernel, its params are
+        converted from a `nn.Dense` by `quantize_dense_params`.
+    """
+    features: int
+    mode: str = 'int8'
+    use_bias: bool = True
+
+    @nn.compact
+    def __call__(self, inputs: jnp.ndarray) -> jnp.ndarray:
+        kernel_shape = (inputs.shape[-1], self.features)
+        if self.mode == 'int8':
+            kernel = self.param(
+                'kernel', nn.initializers.zeros, kernel_shape, jnp.int8)
+            scale = self.param(
+                'scale', nn.initializers.ones, (self.features,), jnp.float32)
+            inputs = inputs.astype(jnp.float32)
+            y = _dense_dot(inputs, kernel.astype(jnp.float32)) * scale
+        elif self.mode == 'bfloat16':
+            kernel = self.param(
+                'kernel', nn.initializers.zeros, kernel_shape, jnp.bfloat16)
+            y = _dense_dot(inputs.astype(jnp.bfloat16), kernel)
+        else:
+            _check_mode(self.mode)
+
+        if self.use_bias:
+            bias = self.param(
+                'bias', nn.initializers.zeros, (self.features,), jnp.float32)
+            y = y + bias
+        return y
+
+
+class QuantizedMLP(nn.Module):
+    """Quantized counterpart of `MLP`, with the same layer names."""
+    layer_sizes: Sequence[int]
+    activation: ActivationFn = nn.relu
+    activate_final: bool = False
+    bias: bool = True
+    mode: str = 'int8'
+
+    @nn.compact
+    def __call__(self, data: jnp.ndarray) -> jnp.ndarray:
+        hidden = data
+        for i, hidden_size in enumerate(self.layer_sizes):
+            hidden = QuantizedDense(
+                hidden_size,
+                mode=self.mode,
+                use_bias=self.bias,
+                name=f'hidden_{i}')(hidden)
+            if i != len(self.layer_sizes) - 1 or self.activate_final:
+                hidden = self.activation(hidden)
+        return hidden
+
+
+def quantize_mlp(mlp: MLP, mode: str = 'int8') -> QuantizedMLP:
+    _check_mode(mode)
+    if not isinstance(mlp, MLP):
+        raise TypeError(
+            f'only MLP can be quantized, got {type(mlp).__name__}')
+    return QuantizedMLP(
+        layer_sizes=mlp.layer_sizes,
+        activation=mlp.activation,
+        activate_final=mlp.activate_final,
+        bias=mlp.bias,
+        mode=mode
+    )
+
+
+def quantize_dense_params(params: chex.ArrayTree, mode: str = 'int8') -> chex.ArrayTree:
+    """
+        Convert {'kernel': [in, out], 'bias': [out]} of a `nn.Dense`.
+        Traceable, eg: vmapped over a population of params.
+    """
+    _check_mode(mode)
+    kernel = params['kernel']
+    if mode == 'int8':
+        scale = jnp.max(jnp.abs(kernel), axis=0) / 127
+        scale = jnp.where(scale > 0, scale, 1.0).astype(jnp.float32)
+        kernel = jnp.clip(jnp.round(kernel / scale), -127, 127)
+        quantized = dict(kernel=kernel.astype(jnp.int8), scale=scale)
+    else:
+        quantized = dict(kernel=kernel.astype(jnp.bfloat16))
+
+    if 'bias' in params:
+        quantized['bias'] = params['bias'].astype(jnp.float32)
+    return quantized
+
+
+def quantize_mlp_params(params: chex.ArrayTree, mode: str = 'int8') -> chex.ArrayTree:
+    """
+        Convert the params of `MLP` to the params of `QuantizedMLP`.
+    """
+    return dict(params={
+        name: quantize_dense_params(layer_params, mode)
+        for name, layer_params in params['params'].items()
+    })
+
+
+def quantize_policy_network(agent: "Agent", mode: str = 'int8') -> "Agent":
+    """
+        A copy of the initialized agent, whose `policy_network` is replaced
+        by its `QuantizedMLP`. All methods of the agent using the
+        policy network (eg: `evaluate_actions`) then expect the params from
+        `quantize_policy_params`.
+    """
+    qagent = copy.copy(agent)
+    qagent.set_frozen_attr(
+        'policy_network', quantize_mlp(agent.policy_network, mode))
+    return qagent
+
+
+def quantize_policy_params(agent_state: "AgentState", mode: str = 'int8') -> "AgentState":
+    params = agent_state.params.replace(
+        policy_params=quantize_mlp_params(agent_state.params.policy_params, mode))
+    return agent_state.replace(params=params)
+
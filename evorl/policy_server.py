@@ -0,0 +1,414 @@
+"""
+    Local policy inference server with dynamic micro-batching:
+
+    python -m evorl.policy_server policy_server.path=<output_dir>/policy policy_server.port=5555
+
+    Concurrent single-observation requests are collected into a batch until
+    the largest batch size is reached or the oldest request has waited
+    `max_latency_ms`. The batch is padded to the nearest pre-compiled batch
+    size and run by one jitted call.
+
+    Requests come from the in-process client (`PolicyServer.submit()` or
+    `PolicyServer.__call__`), or from other processes via `serve_socket()`
+    and `SocketPolicyClient`.
+"""
+import json
+import logging
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Union
+
+import hydra
+import jax
+import numpy as np
+import chex
+from omegaconf import DictConfig
+
+from evorl.export import ExportedPolicy
+from evorl.sample_batch import SampleBatch
+
+if TYPE_CHECKING:
+    from evorl.agents import Agent, AgentState
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+        Latencies in log-spaced buckets (ms), thread-safe.
+    """
+
+    def __init__(self, min_ms: float = 0.01, max_ms: float = 1e4, buckets_per_decade: int = 10):
+        num_buckets = int(np.ceil(np.log10(max_ms/min_ms)*buckets_per_decade))
+        # bucket i: [edges[i-1], edges[i]), the last bucket is the overflow
+        self.edges = min_ms * 10 ** (np.arange(num_buckets+1) / buckets_per_decade)
+        self.counts = np.zeros(num_buckets+2, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms: float) -> None:
+        with self._lock:
+            self.counts[np.searchsorted(self.edges, latency_ms, side='right')] += 1
+            self.total += latency_ms
+            self.max = max(self.max, latency_ms)
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def percentile(self, q: float) -> float:
+        """
+            Upper edge of the bucket containing the q-th percentile.
+        """
+        with self._lock:
+            count = self.counts.sum()
+            if count == 0:
+                return float('nan')
+            i = int(np.searchsorted(np.cumsum(self.counts), q/100*count))
+            upper = self.edges[i] if i < len(self.edges) else self.max
+            return float(min(upper, self.max))
+
+    def summary(self) -> Dict[str, float]:
+        count = self.count
+        return dict(
+            mean=self.total/count if count > 0 else float('nan'),
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            max=self.max
+        )
+
+
+class _Request:
+    __slots__ = ('obs', 'future', 'submit_time')
+
+    def __init__(self, obs: np.ndarray):
+        self.obs = obs
+        self.future = Future()
+        self.submit_time = time.perf_counter()
+
+
+class PolicyServer:
+    """
+        Micro-batching server of a batched policy `obs[B, ...] -> actions[B, ...]`.
+
+        Args:
+            policy_fn: jitted policy, traced once per batch size.
+            obs_shape: shape of a single obs.
+            batch_sizes: pre-compiled batch sizes, a batch of n requests is
+                padded to the smallest batch size >= n.
+            max_latency_ms: max time the oldest request waits for the batch
+                to fill up.
+    """
+
+    def __init__(
+        self,
+        policy_fn: Callable[[chex.Array], chex.Array],
+        obs_shape: Sequence[int],
+        obs_dtype=np.float32,
+        batch_sizes: Sequence[int] = (1, 8, 32, 128),
+        max_latency_ms: float = 2.0
+    ):
+        self.policy_fn = policy_fn
+        self.obs_shape = tuple(obs_shape)
+        self.obs_dtype = np.dtype(obs_dtype)
+        self.batch_sizes = sorted(set(int(b) for b in batch_sizes))
+        self.max_batch_size = self.batch_sizes[-1]
+        self.max_latency = max_latency_ms / 1e3
+
+        self.action_shape = None
+        self.action_dtype = None
+
+        self.latency_hist = LatencyHistogram()
+        self.compute_hist = LatencyHistogram()
+        self.batch_size_counts = np.zeros(self.max_batch_size+1, dtype=np.int64)
+        self.padded_size_counts = {b: 0 for b in self.batch_sizes}
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+        # no request is queued after close(), so _serve() drains all of them.
+        # Also guards the stats, updated by the batcher thread.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_agent(cls, agent: "Agent", agent_state: "AgentState", **kwargs) -> "PolicyServer":
+        """
+            Serve `agent.evaluate_actions`.
+        """
+        @jax.jit
+        def _evaluate_actions(agent_state, obs):
+            actions, _ = agent.evaluate_actions(
+                agent_state, SampleBatch(obs=obs), jax.random.PRNGKey(0))
+            return actions
+
+        obs_spec = agent.obs_space.sample(jax.random.PRNGKey(0))
+        return cls(
+            partial(_evaluate_actions, jax.device_put(agent_state)),
+            obs_spec.shape, obs_spec.dtype, **kwargs)
+
+    @classmethod
+    def from_exported(cls, path: Union[str, Path], max_latency_ms: float = 2.0) -> "PolicyServer":
+        """
+            Serve an artifact of `evorl.export`, with its batch sizes.
+        """
+        policy = ExportedPolicy.load(path)
+        return cls(
+            policy, policy.obs_shape, policy.obs_dtype,
+            batch_sizes=policy.batch_sizes, max_latency_ms=max_latency_ms)
+
+    def start(self) -> "PolicyServer":
+        # compile all batch sizes before serving
+        for batch_size in self.batch_sizes:
+            actions = np.asarray(self.policy_fn(
+                np.zeros((batch_size, *self.obs_shape), self.obs_dtype)))
+        self.action_shape = actions.shape[1:]
+        self.action_dtype = actions.dtype
+
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._serve, name='policy-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "PolicyServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def submit(self, obs: chex.Array) -> Future:
+        """
+            Request the action of a single obs, return a Future.
+        """
+        obs = np.asarray(obs, dtype=self.obs_dtype)
+        if obs.shape != self.obs_shape:
+            raise ValueError(
+                f'obs shape {obs.shape} mismatches {self.obs_shape}')
+        request = _Request(obs)
+        with self._lock:
+            if not self._running:
+                raise RuntimeError('PolicyServer is not running, call start() first')
+            self._queue.put(request)
+        return request.future
+
+    def __call__(self, obs: chex.Array) -> np.ndarray:
+        return self.submit(obs).result()
+
+    def _collect(self) -> List[_Request]:
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = batch[0].submit_time + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    # take the already queued requests
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _serve(self) -> None:
+        while self._running or not self._queue.empty():
+            batch = self._collect()
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch: List[_Request]) -> None:
+        num_requests = len(batch)
+        batch_size = next(b for b in self.batch_sizes if b >= num_requests)
+
+        obs = np.zeros((batch_size, *self.obs_shape), self.obs_dtype)
+        for i, request in enumerate(batch):
+            obs[i] = request.obs
+
+        start = time.perf_counter()
+        try:
+            actions = np.asarray(self.policy_fn(obs))
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        end = time.perf_counter()
+
+        for i, request in enumerate(batch):
+            request.future.set_result(actions[i])
+
+        with self._lock:
+            for request in batch:
+                self.latency_hist.add((end - request.submit_time)*1e3)
+            self.compute_hist.add((end - start)*1e3)
+            self.batch_size_counts[num_requests] += 1
+            self.padded_size_counts[batch_size] += 1
+
+    def stats(self) -> Dict[str, Union[float, Dict]]:
+        """
+            Latency (ms) from submit to result, compute time (ms) per batch,
+            and batch size stats.
+        """
+        # a consistent snapshot, the batcher updates all of them under the lock
+        with self._lock:
+            batch_size_counts = self.batch_size_counts.copy()
+            padded_size_counts = dict(self.padded_size_counts)
+            latency_ms = self.latency_hist.summary()
+            compute_ms = self.compute_hist.summary()
+
+        num_batches = int(batch_size_counts.sum())
+        num_requests = int((batch_size_counts *
+                            np.arange(self.max_batch_size+1)).sum())
+        num_padded = sum(b*n for b, n in padded_size_counts.items())
+        return dict(
+            num_requests=num_requests,
+            num_batches=num_batches,
+            mean_batch_size=num_requests/num_batches if num_batches > 0 else 0.0,
+            padding_ratio=1 - num_requests/num_padded if num_padded > 0 else 0.0,
+            latency_ms=latency_ms,
+            compute_ms=compute_ms,
+            padded_batch_sizes=padded_size_counts,
+        )
+
+
+# socket protocol: messages prefixed by their uint32 length. The server first
+# sends the json spec of obs & actions, then answers each raw obs by the raw action.
+_HEADER = struct.Struct('!I')
+
+
+def _send_msg(sock: socket.socket, data: bytes) -> None:
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv_msg(sock: socket.socket) -> Optional[bytes]:
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    return _recv_exact(sock, _HEADER.unpack(header)[0])
+
+
+class _PolicyRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        policy_server = self.server.policy_server
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _send_msg(self.request, json.dumps(dict(
+            obs_shape=policy_server.obs_shape,
+            obs_dtype=policy_server.obs_dtype.str,
+            action_shape=policy_server.action_shape,
+            action_dtype=policy_server.action_dtype.str
+        )).encode())
+
+        while (data := _recv_msg(self.request)) is not None:
+            obs = np.frombuffer(data, dtype=policy_server.obs_dtype).reshape(
+                policy_server.obs_shape)
+            actions = policy_server(obs)
+            _send_msg(self.request, np.ascontiguousarray(actions).tobytes())
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_socket(policy_server: PolicyServer, host: str = '127.0.0.1', port: int = 0) -> socketserver.BaseServer:
+    """
+        Serve the started `policy_server` on a local TCP socket in a
+        background thread, one thread per connection. Use `port=0` for a
+        free port, see `server.server_address`. Stop by `server.shutdown()`.
+    """
+    server = _ThreadingTCPServer((host, port), _PolicyRequestHandler)
+    server.policy_server = policy_server
+    threading.Thread(
+        target=server.serve_forever, name='policy-socket-server', daemon=True).start()
+    logger.info(f'serve policy on {server.server_address}')
+    return server
+
+
+class SocketPolicyClient:
+    """
+        Client of `serve_socket()`, one request in flight per client.
+
+        Usage:
+            with SocketPolicyClient(host, port) as client:
+                action = client(obs)
+    """
+
+    def __init__(self, host: str, port: int):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        spec = json.loads(_recv_msg(self.sock))
+        self.obs_shape = tuple(spec['obs_shape'])
+        self.obs_dtype = np.dtype(spec['obs_dtype'])
+        self.action_shape = tuple(spec['action_shape'])
+        self.action_dtype = np.dtype(spec['action_dtype'])
+
+    def __call__(self, obs: chex.Array) -> np.ndarray:
+        obs = np.ascontiguousarray(obs, dtype=self.obs_dtype)
+        if obs.shape != self.obs_shape:
+            raise ValueError(
+                f'obs shape {obs.shape} mismatches {self.obs_shape}')
+        _send_msg(self.sock, obs.tobytes())
+        data = _recv_msg(self.sock)
+        if data is None:
+            raise ConnectionError('policy server closed the connection')
+        return np.frombuffer(data, dtype=self.action_dtype).reshape(self.action_shape)
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "SocketPolicyClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+@hydra.main(version_base=None, config_path="../configs", config_name="config")
+def main(config: DictConfig) -> None:
+    server_config = config.policy_server
+    policy_server = PolicyServer.from_exported(
+        server_config.path, max_latency_ms=server_config.max_latency_ms).start()
+    socket_server = serve_socket(
+        policy_server, server_config.host, server_config.port)
+
+    try:
+        while True:
+            time.sleep(server_config.stats_interval)
+            logger.info(f'policy server stats: {policy_server.stats()}')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        socket_server.shutdown()
+        policy_server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
 from .recorder import Recorder, ChainRecorder
 from .wandb_recorder import WandbRecorder
-from .log_recorder import LogRecorder
\ No newline at end of file
+from .log_recorder import LogRecorder
+from .columnar_recorder import ColumnarRecorder, ColumnarReader
@@ -0,0 +1,439 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .recorder import Recorder
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = 'schema.json'
+CHUNKS_FILE = 'chunks.jsonl'
+STEP_FILE = '_step.npy'
+
+
+def flatten_metrics(data: Mapping[str, Any], prefix: str = '') -> Dict[str, Any]:
+    """
+        Flatten nested dicts to {'eval/discount_returns': ...}
+    """
+    flat = {}
+    for k, v in data.items():
+        name = f'{prefix}{k}'
+        if isinstance(v, Mapping):
+            flat.update(flatten_metrics(v, prefix=f'{name}/'))
+        else:
+            flat[name] = v
+    return flat
+
+
+def _column_file(name: str) -> str:
+    return name.replace('/', '.') + '.npy'
+
+
+def _valid_file(column_file: str) -> str:
+    return column_file[:-len('.npy')] + '.valid.npy'
+
+
+def _is_float(dtype) -> bool:
+    return np.issubdtype(np.dtype(dtype), np.floating)
+
+
+def _write_json(path: Path, data: Any) -> None:
+    # atomic write, readers never see a partial schema
+    tmp_path = path.with_suffix('.tmp')
+    with tmp_path.open('w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_chunks(path: Path) -> List[Dict[str, Any]]:
+    chunks = []
+    if not path.exists():
+        return chunks
+    with path.open('r') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # a record being appended
+            chunks.append(json.loads(line))
+    return chunks
+
+
+class ColumnarRecorder(Recorder):
+    """
+        Append metrics into columnar chunks of `.npy` files:
+
+        <path>/schema.json
+        <path>/chunks.jsonl
+        <path>/chunk_000000/_step.npy
+        <path>/chunk_000000/eval.discount_returns.npy
+        ...
+
+        Writes of the same step are merged into one row. Columns keep the
+        dtype of their first value; missing values are NaN for float
+        columns, and masked by a `<column>.valid.npy` file for int & bool
+        columns. Non-numeric metrics are skipped.
+
+        A chunk is flushed every `chunk_size` rows, or at the first new row
+        after `flush_interval` seconds, and its record is appended to
+        chunks.jsonl, so only complete chunks are visible to
+        `ColumnarReader`. The schema is only rewritten for new columns.
+
+        Args:
+            path: directory of this run.
+            chunk_size: max number of rows per chunk.
+            flush_interval: seconds, None to only flush full chunks.
+            meta: extra run info saved in the schema, eg: the config overrides.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 10000,
+                 flush_interval: Optional[float] = 600.0,
+                 meta: Optional[Mapping[str, Any]] = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+
+        schema_path = self.path/SCHEMA_FILE
+        if schema_path.exists():
+            # resume: append to the existing chunks
+            with schema_path.open('r') as f:
+                self.schema = json.load(f)
+            chunks = _read_chunks(self.path/CHUNKS_FILE)
+            self._num_chunks = len(chunks)
+            self._total_rows = sum(chunk['num_rows'] for chunk in chunks)
+            self._schema_dirty = False
+        else:
+            self.schema = dict(meta=dict(meta or {}), columns={})
+            self._num_chunks = 0
+            self._total_rows = 0
+            self._schema_dirty = True
+
+        self._steps = []
+        self._rows = []
+        self._skipped = set()
+        self._last_flush = time.monotonic()
+
+    def write(self, data: Mapping[str, Any], step: Optional[int] = None) -> None:
+        if step is None:
+            step = self._steps[-1] + 1 if len(self._steps) > 0 else self._total_rows
+
+        if len(self._steps) == 0 or self._steps[-1] != step:
+            if len(self._rows) >= self.chunk_size or (
+                    self.flush_interval is not None and
+                    time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+            self._steps.append(step)
+            self._rows.append({})
+
+        row = self._rows[-1]
+        for name, value in flatten_metrics(data).items():
+            value = np.asarray(value)
+            if not np.issubdtype(value.dtype, np.number) and value.dtype != np.bool_:
+                if name not in self._skipped:
+                    logger.warning(
+                        f"skip non-numeric metric {name} of dtype {value.dtype}")
+                    self._skipped.add(name)
+                continue
+
+            column = self.schema['columns'].get(name)
+            if column is None:
+                column = dict(file=_column_file(name), shape=list(value.shape),
+                              dtype=value.dtype.str)
+                self.schema['columns'][name] = column
+                self._schema_dirty = True
+            if tuple(column['shape']) != value.shape:
+                if name not in self._skipped:
+                    logger.warning(
+                        f"skip metric {name} with shape {value.shape}, expected {tuple(column['shape'])}")
+                    self._skipped.add(name)
+                continue
+
+            row[name] = value
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if len(self._rows) == 0:
+            return
+
+        chunk_name = f"chunk_{self._num_chunks:06d}"
+        chunk_dir = self.path/chunk_name
+        chunk_dir.mkdir(exist_ok=True)
+
+        num_rows = len(self._rows)
+        np.save(chunk_dir/STEP_FILE, np.asarray(self._steps, dtype=np.int64))
+
+        names = sorted(set().union(*(row.keys() for row in self._rows)))
+        masked = []
+        for name in names:
+            column = self.schema['columns'][name]
+            dtype = np.dtype(column.get('dtype', 'float64'))
+            if _is_float(dtype):
+                values = np.full((num_rows, *column['shape']), np.nan, dtype=dtype)
+            else:
+                values = np.zeros((num_rows, *column['shape']), dtype=dtype)
+            valid = np.zeros(num_rows, dtype=np.bool_)
+            for i, row in enumerate(self._rows):
+                if name in row:
+                    values[i] = row[name]
+                    valid[i] = True
+            np.save(chunk_dir/column['file'], values)
+            if not _is_float(dtype) and not valid.all():
+                np.save(chunk_dir/_valid_file(column['file']), valid)
+                masked.append(name)
+
+        if self._schema_dirty:
+            _write_json(self.path/SCHEMA_FILE, self.schema)
+            self._schema_dirty = False
+
+        record = dict(
+            name=chunk_name,
+            num_rows=num_rows,
+            first_step=int(self._steps[0]),
+            last_step=int(self._steps[-1]),
+            columns=names,
+            masked=masked
+        )
+        with (self.path/CHUNKS_FILE).open('a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        self._num_chunks += 1
+        self._total_rows += num_rows
+        self._steps = []
+        self._rows = []
+
+    def close(self) -> None:
+        self.flush()
+        if self._schema_dirty:
+            # a run without any row
+            _write_json(self.path/SCHEMA_FILE, self.schema)
+            self._schema_dirty = False
+
+
+class ChunkedColumn:
+    """
+        Lazy view of a column over the chunks of a run. Each chunk is
+        loaded as a read-only memmap when indexed; indexing a single chunk
+        (eg: `column[-1]`, a slice within a chunk) doesn't copy, and only
+        the indexed rows are gathered otherwise. `np.asarray(column)`
+        concatenates all chunks.
+
+        Args:
+            loaders: functions loading the array of each chunk.
+            lengths: number of rows of each chunk.
+    """
+
+    def __init__(self, loaders: Sequence[Callable[[], np.ndarray]], lengths: Sequence[int],
+                 shape: Tuple[int, ...], dtype):
+        self._loaders = list(loaders)
+        self._offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        self.row_shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return (len(self), *self.row_shape)
+
+    @property
+    def ndim(self) -> int:
+        return 1 + len(self.row_shape)
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self._loaders)
+
+    def chunk(self, i: int) -> np.ndarray:
+        return self._loaders[i]()
+
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        chunk_ids = np.searchsorted(self._offsets, rows, side='right') - 1
+        out = np.empty((len(rows), *self.row_shape), dtype=self.dtype)
+        for i in np.unique(chunk_ids):
+            mask = chunk_ids == i
+            out[mask] = self.chunk(i)[rows[mask] - self._offsets[i]]
+        return out
+
+    def _rows(self, index) -> np.ndarray:
+        if isinstance(index, (int, np.integer)):
+            row = int(index) + len(self) if index < 0 else int(index)
+            if not 0 <= row < len(self):
+                raise IndexError(f'row {index} out of range for {len(self)} rows')
+            i = np.searchsorted(self._offsets, row, side='right') - 1
+            return self.chunk(i)[row - self._offsets[i]]
+
+        if isinstance(index, slice):
+            start, stop, stride = index.indices(len(self))
+            if stride == 1 and stop > start:
+                i = np.searchsorted(self._offsets, start, side='right') - 1
+                if stop <= self._offsets[i+1]:
+                    # within a chunk: a view of the memmap
+                    offset = self._offsets[i]
+                    return self.chunk(i)[start-offset:stop-offset]
+            return self._gather(np.arange(start, stop, stride))
+
+        index = np.asarray(index)
+        if index.dtype == np.bool_:
+            index = np.flatnonzero(index)
+        return self._gather(np.where(index < 0, index + len(self), index))
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            return self._rows(index)
+        out = self._rows(index[0])
+        if isinstance(index[0], (int, np.integer)):
+            return out[index[1:]]
+        return out[(slice(None), *index[1:])]
+
+    def __array__(self, dtype=None, copy=None):
+        if self.num_chunks == 1:
+            out = np.asarray(self.chunk(0))
+        elif self.num_chunks == 0:
+            out = np.zeros(self.shape, dtype=self.dtype)
+        else:
+            out = np.concatenate([self.chunk(i) for i in range(self.num_chunks)], axis=0)
+        return out if dtype is None else out.astype(dtype)
+
+
+class ColumnarReader:
+    """
+        Read the metrics of one or many runs written by `ColumnarRecorder`.
+        Runs are found by their `schema.json` under `root` (eg: the sweep dir),
+        and named by the relative path. Columns are `ChunkedColumn` views
+        of memory-mapped chunks.
+
+        Usage:
+            reader = ColumnarReader('multirun/train/2024-01-01_00-00-00')
+            for run, (steps, values) in reader.read('eval/discount_returns').items():
+                ...
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+            Reload the run index, schemas and chunk records.
+        """
+        self.schemas = {}
+        self.chunks = {}
+        for schema_path in sorted(self.root.rglob(SCHEMA_FILE)):
+            run = schema_path.parent.relative_to(self.root).as_posix()
+            with schema_path.open('r') as f:
+                self.schemas[run] = json.load(f)
+            self.chunks[run] = _read_chunks(schema_path.parent/CHUNKS_FILE)
+
+    @property
+    def runs(self) -> List[str]:
+        return list(self.schemas.keys())
+
+    def meta(self, run: str) -> Dict[str, Any]:
+        return self.schemas[run]['meta']
+
+    def columns(self, run: Optional[str] = None) -> List[str]:
+        """
+            Column names of a run, or the union over all runs.
+        """
+        schemas = self.schemas.values() if run is None else [self.schemas[run]]
+        return sorted(set().union(*(s['columns'].keys() for s in schemas)))
+
+    def _run_dir(self, run: str) -> Path:
+        return self.root/run if run != '.' else self.root
+
+    def steps(self, run: str) -> ChunkedColumn:
+        run_dir = self._run_dir(run)
+        chunks = self.chunks[run]
+        return ChunkedColumn(
+            [_mmap_loader(run_dir/chunk['name']/STEP_FILE) for chunk in chunks],
+            [chunk['num_rows'] for chunk in chunks], (), np.int64)
+
+    def _column_meta(self, run: str, name: str) -> Dict[str, Any]:
+        column = self.schemas[run]['columns'].get(name)
+        if column is None:
+            raise KeyError(f"column {name} not found in run {run}")
+        return column
+
+    def column(self, run: str, name: str) -> ChunkedColumn:
+        """
+            All rows of a column in a run, in the dtype of the column.
+            Chunks without the column are NaN for float columns, and 0 for
+            int & bool columns, see `valid()`.
+        """
+        column = self._column_meta(run, name)
+        run_dir = self._run_dir(run)
+        shape = tuple(column['shape'])
+        dtype = np.dtype(column.get('dtype', 'float64'))
+
+        loaders = []
+        for chunk in self.chunks[run]:
+            if name in chunk['columns']:
+                loaders.append(_mmap_loader(run_dir/chunk['name']/column['file']))
+            else:
+                loaders.append(_fill_loader(
+                    (chunk['num_rows'], *shape), dtype,
+                    np.nan if _is_float(dtype) else 0))
+        return ChunkedColumn(
+            loaders, [chunk['num_rows'] for chunk in self.chunks[run]], shape, dtype)
+
+    def valid(self, run: str, name: str) -> np.ndarray:
+        """
+            Bool mask of the rows where the metric is written.
+        """
+        column = self._column_meta(run, name)
+        run_dir = self._run_dir(run)
+        is_float = _is_float(column.get('dtype', 'float64'))
+
+        masks = []
+        for chunk in self.chunks[run]:
+            chunk_dir = run_dir/chunk['name']
+            if name not in chunk['columns']:
+                mask = np.zeros(chunk['num_rows'], dtype=np.bool_)
+            elif is_float:
+                values = np.load(chunk_dir/column['file'], mmap_mode='r')
+                mask = ~np.isnan(values.reshape(len(values), -1)).all(axis=1)
+            elif name in chunk.get('masked', ()):
+                mask = np.load(chunk_dir/_valid_file(column['file']))
+            else:
+                mask = np.ones(chunk['num_rows'], dtype=np.bool_)
+            masks.append(mask)
+        if len(masks) == 0:
+            return np.zeros(0, dtype=np.bool_)
+        return np.concatenate(masks)
+
+    def read(self, name: str, runs: Optional[Sequence[str]] = None,
+             dropna: bool = True) -> Dict[str, Tuple[Any, Any]]:
+        """
+            Get {run: (steps, values)} of a column over runs.
+
+            Args:
+                runs: default to all runs having the column.
+                dropna: only keep the rows where the metric is written, as
+                    arrays; otherwise the lazy `ChunkedColumn` views.
+        """
+        if runs is None:
+            runs = [run for run, s in self.schemas.items()
+                    if name in s['columns']]
+
+        results = {}
+        for run in runs:
+            steps = self.steps(run)
+            values = self.column(run, name)
+            if dropna:
+                rows = np.flatnonzero(self.valid(run, name))
+                steps, values = steps[rows], values[rows]
+            results[run] = (steps, values)
+        return results
+
+
+def _mmap_loader(path: Path) -> Callable[[], np.ndarray]:
+    return lambda: np.load(path, mmap_mode='r')
+
+
+def _fill_loader(shape: Tuple[int, ...], dtype, fill_value) -> Callable[[], np.ndarray]:
+    return lambda: np.full(shape, fill_value, dtype=dtype)
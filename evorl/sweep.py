@@ -0,0 +1,299 @@
+"""
+    Run the jobs of a sweep concurrently on disjoint slots of the local
+    devices, for configs that can't be vmapped together (see `seeds`):
+
+    python -m evorl.sweep --num-slots 4 -- agent=a2c,ppo env=brax/ant,brax/hopper
+    python -m evorl.sweep --gpus 0 1 --jobs-per-gpu 2 -- agent=ppo env=brax/ant,brax/humanoid seed=0,1
+
+    The sweep overrides are expanded like hydra's basic sweeper, and each job
+    runs `evorl.train` in its own process under <sweep_dir>/<job_id>. A slot is
+    either a GPU (CUDA_VISIBLE_DEVICES, with `--jobs-per-gpu` jobs sharing its
+    memory), or a chunk of CPU cores (pinned by sched_setaffinity) exposing
+    `--cpu-devices-per-slot` virtual devices. Remaining jobs are queued until a
+    slot is free.
+
+    The results are gathered from the metrics store (`ColumnarRecorder`) of
+    each job: the per-job throughput, and the packing efficiency of the sweep
+    (slot utilization and the aggregated env steps/sec) are written to
+    <sweep_dir>/sweep_report.json.
+"""
+import argparse
+import collections
+import dataclasses
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from hydra.core.override_parser.overrides_parser import OverridesParser
+
+from evorl.recorders import ColumnarReader
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE = 'sweep_report.json'
+
+
+def expand_sweep(overrides: Sequence[str]) -> List[List[str]]:
+    """
+        Cartesian product of the sweep overrides, eg:
+        ['agent=a2c,ppo', 'seed=1'] -> [['agent=a2c', 'seed=1'], ['agent=ppo', 'seed=1']]
+    """
+    parsed = OverridesParser.create().parse_overrides(list(overrides))
+    choices = []
+    for override in parsed:
+        key = override.get_key_element()
+        if override.is_sweep_override():
+            choices.append([f'{key}={v}' for v in override.sweep_string_iterator()])
+        else:
+            choices.append([f'{key}={override.get_value_element_as_str()}'])
+    return [list(job) for job in itertools.product(*choices)]
+
+
+@dataclasses.dataclass
+class Slot:
+    slot_id: int
+    env: Dict[str, str]
+    cpus: Optional[List[int]] = None
+
+    def describe(self) -> str:
+        if 'CUDA_VISIBLE_DEVICES' in self.env:
+            return f"gpu {self.env['CUDA_VISIBLE_DEVICES']}"
+        return f"cpu {self.cpus[0]}-{self.cpus[-1]}"
+
+
+def gpu_slots(gpus: Sequence[int], jobs_per_gpu: int = 1) -> List[Slot]:
+    slots = []
+    for gpu in gpus:
+        for _ in range(jobs_per_gpu):
+            env = dict(CUDA_VISIBLE_DEVICES=str(gpu))
+            if jobs_per_gpu > 1:
+                env['XLA_PYTHON_CLIENT_MEM_FRACTION'] = f'{0.9/jobs_per_gpu:.3f}'
+            slots.append(Slot(len(slots), env))
+    return slots
+
+
+def cpu_slots(num_slots: int, cpu_devices_per_slot: int = 1) -> List[Slot]:
+    cpus = sorted(os.sched_getaffinity(0))
+    if num_slots > len(cpus):
+        logger.warning(
+            f'{num_slots} slots for {len(cpus)} cpu cores, slots share the cores')
+        cpus = [cpus[i % len(cpus)] for i in range(num_slots)]
+    chunk = len(cpus) // num_slots
+    xla_flags = os.environ.get('XLA_FLAGS', '') + \
+        f' --xla_force_host_platform_device_count={cpu_devices_per_slot}'
+    slots = []
+    for i in range(num_slots):
+        env = dict(JAX_PLATFORMS='cpu', XLA_FLAGS=xla_flags.strip())
+        slots.append(Slot(i, env, cpus[i*chunk:(i+1)*chunk]))
+    return slots
+
+
+@dataclasses.dataclass
+class Job:
+    job_id: int
+    overrides: List[str]
+    run_dir: Path
+    slot: Optional[Slot] = None
+    process: Optional[subprocess.Popen] = None
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    return_code: Optional[int] = None
+
+
+class SweepScheduler:
+    """
+        Run each job on the first free slot, in the order of the sweep.
+
+        Args:
+            jobs: hydra overrides of each job.
+            slots: disjoint device slots.
+            sweep_dir: jobs run in <sweep_dir>/<job_id>.
+            module: training entry module.
+    """
+
+    def __init__(self, jobs: Sequence[Sequence[str]], slots: Sequence[Slot],
+                 sweep_dir: Path, module: str = 'evorl.train'):
+        self.sweep_dir = Path(sweep_dir)
+        self.slots = list(slots)
+        self.module = module
+        self.jobs = [
+            Job(i, list(overrides), self.sweep_dir/str(i))
+            for i, overrides in enumerate(jobs)
+        ]
+
+    def _start(self, job: Job, slot: Slot) -> None:
+        cmd = [
+            sys.executable, '-m', self.module, *job.overrides,
+            'metrics_store.enable=true',
+            f'hydra.run.dir={job.run_dir}',
+        ]
+        env = {**os.environ, **slot.env}
+        preexec_fn = None
+        if slot.cpus is not None:
+            preexec_fn = partial(os.sched_setaffinity, 0, slot.cpus)
+
+        job.run_dir.mkdir(parents=True, exist_ok=True)
+        with (job.run_dir/'stdout.log').open('w') as log_file:
+            job.process = subprocess.Popen(
+                cmd, env=env, preexec_fn=preexec_fn,
+                stdout=log_file, stderr=subprocess.STDOUT)
+        job.slot = slot
+        job.start_time = time.perf_counter()
+        logger.info(
+            f"job {job.job_id} on slot {slot.slot_id} ({slot.describe()}): {' '.join(job.overrides)}")
+
+    def run(self, poll_interval: float = 1.0) -> float:
+        """
+            Run all jobs and return the makespan in seconds.
+        """
+        pending = collections.deque(self.jobs)
+        free_slots = collections.deque(self.slots)
+        running = []
+        start = time.perf_counter()
+        try:
+            while pending or running:
+                while pending and free_slots:
+                    job = pending.popleft()
+                    self._start(job, free_slots.popleft())
+                    running.append(job)
+
+                time.sleep(poll_interval)
+                for job in list(running):
+                    code = job.process.poll()
+                    if code is None:
+                        continue
+                    running.remove(job)
+                    free_slots.append(job.slot)
+                    job.return_code = code
+                    job.end_time = time.perf_counter()
+                    level = logging.INFO if code == 0 else logging.ERROR
+                    logger.log(
+                        level, f"job {job.job_id} exited with {code} after "
+                        f"{job.end_time - job.start_time:.1f}s, see {job.run_dir}")
+        except KeyboardInterrupt:
+            for job in running:
+                job.process.terminate()
+            raise
+
+        return time.perf_counter() - start
+
+
+def _last(values: np.ndarray) -> Optional[Any]:
+    if len(values) == 0:
+        return None
+    return values[-1].tolist()
+
+
+def sweep_report(scheduler: SweepScheduler, makespan: float) -> Dict[str, Any]:
+    """
+        Per-job throughput read from the metrics store of each job, and the
+        packing efficiency of the sweep.
+    """
+    reader = ColumnarReader(scheduler.sweep_dir)
+    runs = {run.split('/', 1)[0]: run for run in reader.runs}
+
+    jobs = []
+    for job in scheduler.jobs:
+        wall_time = job.end_time - job.start_time
+        report = dict(
+            job_id=job.job_id,
+            overrides=job.overrides,
+            slot=job.slot.describe(),
+            return_code=job.return_code,
+            wall_time=wall_time,
+        )
+        run = runs.get(str(job.job_id))
+        if run is not None:
+            columns = reader.columns(run)
+            if 'sampled_timesteps' in columns:
+                _, sampled_timesteps = reader.read('sampled_timesteps', [run])[run]
+                sampled_timesteps = _last(np.sum(
+                    sampled_timesteps.reshape(len(sampled_timesteps), -1), axis=-1))
+                report['sampled_timesteps'] = sampled_timesteps
+                if sampled_timesteps is not None:
+                    # including the startup and compilation
+                    report['env_steps_per_sec'] = sampled_timesteps / wall_time
+            if 'perf/env_steps_per_sec' in columns:
+                # steady state, sampled by PerfTimer
+                _, steps_per_sec = reader.read('perf/env_steps_per_sec', [run])[run]
+                report['steady_env_steps_per_sec'] = float(np.median(steps_per_sec)) \
+                    if len(steps_per_sec) else None
+            if 'eval/discount_returns' in columns:
+                _, returns = reader.read('eval/discount_returns', [run])[run]
+                report['eval_discount_returns'] = _last(returns)
+        jobs.append(report)
+
+    busy_time = sum(job['wall_time'] for job in jobs)
+    total_timesteps = sum(job.get('sampled_timesteps') or 0 for job in jobs)
+    return dict(
+        num_jobs=len(jobs),
+        num_slots=len(scheduler.slots),
+        makespan=makespan,
+        # fraction of the slot-time used by jobs
+        slot_utilization=busy_time / (makespan * len(scheduler.slots)),
+        env_steps_per_sec=total_timesteps / makespan,
+        jobs=jobs,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the jobs of a sweep concurrently on slots of the local devices")
+    parser.add_argument("--gpus", type=int, nargs="+", default=None,
+                        help="gpu ids to use as slots, default: cpu slots")
+    parser.add_argument("--jobs-per-gpu", type=int, default=1)
+    parser.add_argument("--num-slots", type=int, default=None,
+                        help="cpu slots, default: one per 4 cores")
+    parser.add_argument("--cpu-devices-per-slot", type=int, default=1,
+                        help="virtual cpu devices of each cpu slot")
+    parser.add_argument("--sweep-dir", type=str, default=None,
+                        help="default: multirun/sweep/<date>")
+    parser.add_argument("--module", type=str, default="evorl.train")
+    parser.add_argument("overrides", nargs="*",
+                        help="hydra sweep overrides, eg: agent=a2c,ppo env=brax/ant,brax/hopper")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.gpus is not None:
+        slots = gpu_slots(args.gpus, args.jobs_per_gpu)
+    else:
+        num_slots = args.num_slots or max(len(os.sched_getaffinity(0)) // 4, 1)
+        slots = cpu_slots(num_slots, args.cpu_devices_per_slot)
+
+    sweep_dir = args.sweep_dir or \
+        f"multirun/sweep/{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    jobs = expand_sweep(args.overrides)
+    logger.info(f"{len(jobs)} jobs on {len(slots)} slots under {sweep_dir}")
+
+    scheduler = SweepScheduler(jobs, slots, Path(sweep_dir), args.module)
+    makespan = scheduler.run()
+    report = sweep_report(scheduler, makespan)
+
+    with (Path(sweep_dir)/REPORT_FILE).open('w') as f:
+        json.dump(report, f, indent=4)
+
+    for job in report['jobs']:
+        logger.info(
+            f"job {job['job_id']} [{job['slot']}] {' '.join(job['overrides'])}: "
+            f"code {job['return_code']}, {job['wall_time']:.1f}s, "
+            f"{job.get('env_steps_per_sec') or 0:.0f} env steps/s "
+            f"(steady {job.get('steady_env_steps_per_sec') or 0:.0f})")
+    logger.info(
+        f"makespan {report['makespan']:.1f}s, slot utilization "
+        f"{report['slot_utilization']:.1%}, {report['env_steps_per_sec']:.0f} env steps/s in total")
+
+    sys.exit(int(any(job['return_code'] != 0 for job in report['jobs'])))
+
+
+if __name__ == "__main__":
+    main()
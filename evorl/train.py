@@ -1,16 +1,57 @@
 import jax
+import jax.numpy as jnp
 
 from omegaconf import DictConfig, OmegaConf
 import hydra
+from hydra.core.hydra_config import HydraConfig
 import logging
 
 from evorl.utils.cfg_utils import get_output_dir
-from evorl.recorders import WandbRecorder, LogRecorder, ChainRecorder
+from evorl.recorders import Recorder, WandbRecorder, LogRecorder, ChainRecorder, ColumnarRecorder
+from evorl.distributed.launcher import initialize_distributed
+from evorl.utils.memory import estimate_rl_workflow_memory, check_memory
 from pathlib import Path
+from typing import List
 
 logger = logging.getLogger(__name__)
 
 
+def setup_recorders(config: DictConfig, workflow_cls) -> List[Recorder]:
+    seeds = OmegaConf.select(config, 'seeds', default=None)
+    multi_seeds = seeds is not None
+
+    output_dir = get_output_dir()
+    wandb_project = config.wandb.project
+    wandb_tags = [workflow_cls.name(), config.env.env_name, config.env.env_type] + \
+        OmegaConf.to_container(config.wandb.tags)
+    wandb_name = '-'.join(
+        [workflow_cls.name(), config.env.env_name, config.env.env_type]
+    )
+    wandb_mode = 'online' if config.wandb.enable and not config.debug else 'disabled'
+
+    wandb_recorder = WandbRecorder(
+        project=wandb_project,
+        name=wandb_name,
+        config=OmegaConf.to_container(config),  # save the unrescaled config
+        tags=wandb_tags,
+        dir=output_dir,
+        mode=wandb_mode
+    )
+    log_recorder = LogRecorder(log_path=output_dir/f'{wandb_name}.log')
+    recorders = [wandb_recorder, log_recorder]
+    if OmegaConf.select(config, 'metrics_store.enable', default=False):
+        recorders.append(ColumnarRecorder(
+            output_dir/'metrics',
+            chunk_size=config.metrics_store.chunk_size,
+            flush_interval=OmegaConf.select(
+                config, 'metrics_store.flush_interval', default=600.0),
+            meta=dict(name=wandb_name,
+                      seed=list(seeds) if multi_seeds else config.seed,
+                      overrides=list(HydraConfig.get().overrides.task))
+        ))
+    return recorders
+
+
 @hydra.main(version_base=None, config_path="../configs", config_name="config")
 def train(config: DictConfig) -> None:
     logger.info("config:\n"+OmegaConf.to_yaml(config))
@@ -20,41 +61,51 @@ def train(config: DictConfig) -> None:
         jax_config.update("jax_debug_nans", True)
         # jax_config.update("jax_debug_infs", True)
 
+    initialize_distributed(config)
+
     workflow_cls = hydra.utils.get_class(config.workflow_cls)
 
-    devices = jax.local_devices()
-    if len(devices) > 1:
+    # independent seeds vmapped in one program
+    seeds = OmegaConf.select(config, 'seeds', default=None)
+    multi_seeds = seeds is not None
+
+    # global devices over all processes
+    devices = jax.devices()
+    if len(devices) > 1 and not multi_seeds:
         logger.info(f"Enable Multi Devices: {devices}")
         workflow = workflow_cls.build_from_config(
             config, enable_multi_devices=True, devices=devices,
         )
     else:
+        if multi_seeds:
+            logger.info(f"Enable Multi Seeds: {list(seeds)}")
         workflow = workflow_cls.build_from_config(
             config,
-            enable_jit=True
+            enable_jit=True,
+            enable_multi_seeds=multi_seeds
         )
 
-    output_dir = get_output_dir()
-    wandb_project = config.wandb.project
-    wandb_tags = [workflow_cls.name(), config.env.env_name, config.env.env_type] + \
-        OmegaConf.to_container(config.wandb.tags)
-    wandb_name = '-'.join(
-        [workflow_cls.name(), config.env.env_name, config.env.env_type]
-    )
-    wandb_mode = 'online' if config.wandb.enable and not config.debug else 'disabled'
+    # only the main process records metrics, other processes don't
+    # touch the shared output dir
+    if jax.process_index() == 0:
+        workflow.add_recorders(setup_recorders(config, workflow_cls))
 
-    wandb_recorder = WandbRecorder(
-        project=wandb_project,
-        name=wandb_name,
-        config=OmegaConf.to_container(config),  # save the unrescaled config
-        tags=wandb_tags,
-        dir=output_dir,
-        mode=wandb_mode
-    )
-    log_recorder = LogRecorder(log_path=output_dir/f'{wandb_name}.log')
-    workflow.add_recorders([wandb_recorder, log_recorder])
+    if OmegaConf.select(config, 'memory.check', default=False):
+        estimates = estimate_rl_workflow_memory(workflow)
+        if multi_seeds:
+            estimates = {k: v*len(seeds) for k, v in estimates.items()}
+        # global devices of other processes have no memory stats
+        check_memory(estimates, jax.local_devices()[0])
 
-    state = workflow.init(jax.random.PRNGKey(config.seed))
+    if multi_seeds:
+        # per-seed metrics are recorded as [#seeds] lists
+        key = jnp.stack([jax.random.PRNGKey(seed) for seed in seeds])
+    else:
+        key = jax.random.PRNGKey(config.seed)
+    state = workflow.init(key)
+    if config.resume is not None:
+        # fields not in the checkpoint (eg: env_state) are kept from init()
+        state = workflow.restore(state, config.resume, config.resume_step)
     state = workflow.learn(state)
 
     workflow.close()
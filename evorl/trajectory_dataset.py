@@ -0,0 +1,459 @@
+"""
+    Stream trajectories off the device into a sharded, memory-mapped dataset
+    for offline RL or behaviour cloning:
+
+    <path>/index.json: fields (dtype & shape), shard_size and #rows per shard
+    <path>/episodes.npy: [#episodes, 3] of (start_row, length, complete)
+    <path>/shard_000000/obs.npy: [shard_size, ...]
+    ...
+
+    Transitions are grouped by episode, so each episode occupies contiguous
+    rows (possibly across two shards). Episodes still running when the
+    writer is closed, or truncated in episodic trajectories, are marked as
+    incomplete.
+
+    `DataLoader` samples minibatches from the dataset for offline training.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import chex
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import numpy as np
+from jax.experimental import io_callback
+
+from .sample_batch import SampleBatch
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+EPISODES_FILE = 'episodes.npy'
+DEFAULT_FIELDS = ('obs', 'actions', 'rewards', 'next_obs', 'dones')
+
+
+def _field_name(path) -> str:
+    return '.'.join(
+        str(getattr(k, 'name', getattr(k, 'key', getattr(k, 'idx', k)))) for k in path)
+
+
+def flatten_trajectory(trajectory: SampleBatch, fields: Sequence[str] = DEFAULT_FIELDS) -> Dict[str, chex.Array]:
+    """
+        Select the fields of the SampleBatch as {name: array}, eg: 'obs',
+        'extras.policy_extras.logp'.
+    """
+    flat, _ = jtu.tree_flatten_with_path(trajectory)
+    data = {}
+    for path, x in flat:
+        name = _field_name(path)
+        if any(name == f or name.startswith(f + '.') for f in fields):
+            data[name] = x
+    return data
+
+
+def _episode_valid_mask(dones: np.ndarray) -> np.ndarray:
+    # steps before and at the first done of each env: [T, B]
+    return (np.cumsum(dones, axis=0) - dones) == 0
+
+
+def _shard_name(shard_id: int) -> str:
+    return f'shard_{shard_id:06d}'
+
+
+def _write_json(path: Path, data) -> None:
+    tmp_path = path.with_suffix('.tmp')
+    with tmp_path.open('w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class TrajectoryWriter:
+    """
+        Write trajectory chunks [T, B, ...] into fixed-size shards.
+
+        Inside jitted functions, `write_async()` streams the chunk to the host by
+        `io_callback`, and a background thread writes it, so the device can
+        compute the next chunk meanwhile. At most `num_buffers` chunks are
+        pending on the host (double buffering by default); the callback blocks
+        when the writer falls behind.
+
+        Args:
+            path: directory of the dataset.
+            shard_size: #transitions per shard.
+            episodic: the trajectories are from `eval_rollout_episode` or
+                `rollout_episode`: each chunk starts new episodes and the steps
+                after the first done are padding. Otherwise (autoreset envs),
+                episodes continue across chunks.
+            fields: fields of SampleBatch to save.
+            num_buffers: max #chunks waiting for the writer thread.
+    """
+
+    def __init__(self,
+                 path: str,
+                 shard_size: int = 1_000_000,
+                 episodic: bool = False,
+                 fields: Sequence[str] = DEFAULT_FIELDS,
+                 num_buffers: int = 2):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.episodic = episodic
+        self.fields = tuple(fields)
+
+        self.schema = None
+        self.shard_rows = []
+        self.episodes = []
+        self._shard = None
+        # (stream_id, env_id) -> [{name: [n, ...]}, ...]
+        self._pending = {}
+
+        self._queue = queue.Queue(maxsize=num_buffers)
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._worker, name='TrajectoryWriter', daemon=True)
+        self._thread.start()
+
+    @property
+    def num_rows(self) -> int:
+        return sum(self.shard_rows)
+
+    def write_async(self, trajectory: SampleBatch, stream_id: chex.Array = 0) -> None:
+        """
+            Stream the trajectory [T, B, ...] to the writer inside jitted functions.
+
+            Args:
+                stream_id: distinguish the envs of different devices, eg:
+                    `jax.lax.axis_index(pmap_axis_name)`.
+        """
+        data = flatten_trajectory(trajectory, self.fields)
+        io_callback(self._enqueue, None, data,
+                    jnp.asarray(stream_id, dtype=jnp.int32))
+
+    def write(self, trajectory: SampleBatch, stream_id: int = 0) -> None:
+        """
+            Write the trajectory [T, B, ...] from the host.
+        """
+        data = jax.device_get(flatten_trajectory(trajectory, self.fields))
+        self._enqueue(data, stream_id)
+
+    def _enqueue(self, data: Dict[str, np.ndarray], stream_id) -> None:
+        if self._error is not None:
+            raise RuntimeError("TrajectoryWriter failed") from self._error
+        self._queue.put((data, int(stream_id)))
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._append_chunk(*item)
+            except Exception as e:
+                logger.exception("failed to write the trajectory")
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _init_schema(self, data: Dict[str, np.ndarray]) -> None:
+        self.schema = {
+            name: dict(dtype=np.dtype(x.dtype).str, shape=list(x.shape[2:]))
+            for name, x in data.items()
+        }
+
+    def _append_chunk(self, data: Dict[str, np.ndarray], stream_id: int) -> None:
+        if self.schema is None:
+            self._init_schema(data)
+
+        dones = np.asarray(data['dones'])
+        T, B = dones.shape[:2]
+        valid = _episode_valid_mask(dones) if self.episodic \
+            else np.ones((T, B), dtype=bool)
+
+        for b in range(B):
+            key = (stream_id, b)
+            steps = np.flatnonzero(valid[:, b])
+
+            def _add_piece(start, end):
+                self._pending.setdefault(key, []).append(
+                    {name: x[steps[start:end], b] for name, x in data.items()})
+
+            start = 0
+            for end in np.flatnonzero(dones[steps, b]) + 1:
+                _add_piece(start, end)
+                self._flush_episode(key, complete=True)
+                start = end
+            if start < len(steps):
+                _add_piece(start, len(steps))
+
+            if self.episodic:
+                # reach max_episode_steps without done
+                self._flush_episode((stream_id, b), complete=False)
+
+    def _flush_episode(self, key: Tuple[int, int], complete: bool) -> None:
+        pieces = self._pending.pop(key, None)
+        if not pieces:
+            return
+        episode = {
+            name: np.concatenate([p[name] for p in pieces], axis=0)
+            for name in self.schema
+        }
+        length = len(episode['dones'])
+        self.episodes.append((self.num_rows, length, int(complete)))
+        self._append_rows(episode, length)
+
+    def _open_shard(self) -> None:
+        shard_dir = self.path/_shard_name(len(self.shard_rows))
+        shard_dir.mkdir(exist_ok=True)
+        self._shard = {
+            name: np.lib.format.open_memmap(
+                shard_dir/f'{name}.npy', mode='w+',
+                dtype=np.dtype(spec['dtype']),
+                shape=(self.shard_size, *spec['shape']))
+            for name, spec in self.schema.items()
+        }
+        self.shard_rows.append(0)
+
+    def _close_shard(self) -> None:
+        for x in self._shard.values():
+            x.flush()
+        self._shard = None
+        self._write_index()
+
+    def _append_rows(self, episode: Dict[str, np.ndarray], length: int) -> None:
+        start = 0
+        while start < length:
+            if self._shard is None:
+                self._open_shard()
+            offset = self.shard_rows[-1]
+            n = min(length - start, self.shard_size - offset)
+            for name, x in episode.items():
+                self._shard[name][offset:offset+n] = x[start:start+n]
+            self.shard_rows[-1] += n
+            start += n
+            if self.shard_rows[-1] == self.shard_size:
+                self._close_shard()
+
+    def _write_index(self) -> None:
+        np.save(self.path/EPISODES_FILE,
+                np.asarray(self.episodes, dtype=np.int64).reshape(-1, 3))
+        _write_json(self.path/INDEX_FILE, dict(
+            fields=self.schema,
+            shard_size=self.shard_size,
+            shard_rows=self.shard_rows,
+        ))
+
+    def flush(self) -> None:
+        """
+            Wait until the streamed chunks are written.
+        """
+        self._queue.join()
+        if self._error is not None:
+            raise RuntimeError("TrajectoryWriter failed") from self._error
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+        for key in list(self._pending.keys()):
+            self._flush_episode(key, complete=False)
+        if self._shard is not None:
+            self._close_shard()
+        elif self.schema is not None:
+            self._write_index()
+        logger.info(
+            f"saved {self.num_rows} transitions, {len(self.episodes)} episodes to {self.path}")
+
+
+class TrajectoryDataset:
+    """
+        Read the dataset written by `TrajectoryWriter`. Shards are memory-mapped,
+        and rows are indexed globally over the shards.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with (self.path/INDEX_FILE).open('r') as f:
+            index = json.load(f)
+        self.fields = index['fields']
+        self.shard_size = index['shard_size']
+        self.shard_rows = index['shard_rows']
+        # [#episodes, 3]: (start_row, length, complete)
+        self.episodes = np.load(self.path/EPISODES_FILE)
+
+        self._shards = [
+            {
+                name: np.load(self.path/_shard_name(i)/f'{name}.npy', mmap_mode='r')
+                for name in self.fields
+            }
+            for i in range(len(self.shard_rows))
+        ]
+
+    def __len__(self) -> int:
+        return sum(self.shard_rows)
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.episodes)
+
+    def read(self, start: int, end: int, fields: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+            Rows [start, end) of the dataset.
+        """
+        fields = self.fields.keys() if fields is None else fields
+        pieces = {name: [] for name in fields}
+        while start < end:
+            shard_id, offset = divmod(start, self.shard_size)
+            n = min(end - start, self.shard_size - offset)
+            for name in fields:
+                pieces[name].append(
+                    self._shards[shard_id][name][offset:offset+n])
+            start += n
+        return {
+            name: p[0] if len(p) == 1 else np.concatenate(p, axis=0)
+            for name, p in pieces.items()
+        }
+
+    def gather(self, rows: np.ndarray, fields: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+            Random access of rows, eg: sampled minibatch indices.
+        """
+        fields = self.fields.keys() if fields is None else fields
+        shard_ids, offsets = np.divmod(np.asarray(rows), self.shard_size)
+        data = {}
+        for name in fields:
+            spec = self.fields[name]
+            out = np.empty((len(shard_ids), *spec['shape']), dtype=np.dtype(spec['dtype']))
+            for shard_id in np.unique(shard_ids):
+                mask = shard_ids == shard_id
+                out[mask] = self._shards[shard_id][name][offsets[mask]]
+            data[name] = out
+        return data
+
+    def episode(self, i: int, fields: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        start, length, _ = self.episodes[i]
+        return self.read(start, start + length, fields)
+
+    def complete_episodes(self) -> List[int]:
+        return np.flatnonzero(self.episodes[:, 2]).tolist()
+
+
+def to_sample_batch(data: Dict[str, chex.Array]) -> SampleBatch:
+    """
+        Convert the {name: array} of the dataset back to SampleBatch. Fields
+        of extras are skipped.
+    """
+    return SampleBatch(**{
+        name: x for name, x in data.items() if name in DEFAULT_FIELDS
+    })
+
+
+class DataLoader:
+    """
+        Sample minibatches of transitions uniformly from a `TrajectoryDataset`
+        on a background thread: the sampled rows are gathered from the
+        memory-mapped shards by a thread pool, then transferred by
+        `device_put_fn`. Up to `prefetch` batches are transferred ahead, so
+        the next batch is copied to the device while the current gradient
+        step runs.
+
+        Usage:
+            loader = DataLoader(dataset, batch_size=256)
+            for i in range(num_iters):
+                batch = loader.next()  # SampleBatch on device
+            loader.close()
+
+        Args:
+            batch_size: #transitions per batch.
+            fields: fields to load, default to all fields of SampleBatch.
+            device_put_fn: transfer the numpy SampleBatch to devices,
+                eg: with a sharding. Default to `jax.device_put`.
+            num_workers: #threads to gather the rows.
+            prefetch: #batches transferred ahead.
+    """
+
+    def __init__(self,
+                 dataset: TrajectoryDataset,
+                 batch_size: int,
+                 fields: Optional[Sequence[str]] = None,
+                 device_put_fn: Optional[Callable[[SampleBatch], SampleBatch]] = None,
+                 num_workers: int = 4,
+                 prefetch: int = 2,
+                 seed: int = 0):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.fields = [f for f in (fields or dataset.fields)
+                       if f in DEFAULT_FIELDS]
+        self.device_put_fn = jax.device_put if device_put_fn is None else device_put_fn
+        self.num_workers = num_workers
+
+        self._rng = np.random.default_rng(seed)
+        self._pool = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix='DataLoader')
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop_event = threading.Event()
+        # the load error, re-raised by every next() after the queued batches
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._worker, name='DataLoader', daemon=True)
+        self._thread.start()
+
+    def _sample(self) -> SampleBatch:
+        # sorted rows read the mmaps sequentially; the order in a minibatch
+        # does not matter
+        rows = np.sort(self._rng.integers(
+            0, len(self.dataset), size=self.batch_size))
+        chunks = np.array_split(rows, self.num_workers)
+        parts = list(self._pool.map(
+            lambda chunk: self.dataset.gather(chunk, self.fields), chunks))
+        data = {
+            name: np.concatenate([p[name] for p in parts], axis=0)
+            for name in self.fields
+        }
+        return to_sample_batch(data)
+
+    def _put(self, item) -> None:
+        # don't block when the consumer stopped, eg: in close()
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _worker(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                self._put(self.device_put_fn(self._sample()))
+        except Exception as e:
+            logger.exception("failed to load the batch")
+            self._error = e
+
+    def next(self) -> SampleBatch:
+        while True:
+            if self._stop_event.is_set():
+                raise RuntimeError("DataLoader is closed")
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._error is not None:
+                    raise RuntimeError("DataLoader failed") from self._error
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> SampleBatch:
+        return self.next()
+
+    def close(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        self._pool.shutdown()
@@ -15,7 +15,6 @@ from typing_extensions import (
 )
 import dataclasses
 
-from jax._src.util import safe_zip
 
 Metrics = Mapping[str, chex.ArrayTree]
 Observation = Union[chex.Array, Mapping[str, chex.Array]]
@@ -180,55 +179,83 @@ class PyTreeDict(dict):
     """
         An easydict with pytree support
         Adapted from src: https://github.com/makinacorpus/easydict
+
+        Items are mirrored in the instance `__dict__` for fast attribute
+        reads. Nested dicts, also in lists, are converted on assignment,
+        except those already converted. The pytree unflatten and `copy`
+        skip the conversion and fill both dicts in one `dict.update`.
     """
 
     def __init__(self, *args, **kwargs):
-        d = dict(*args, **kwargs)
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def _convert(self, value):
+        cls = self.__class__
+        if isinstance(value, (list, tuple)):
+            value = [cls(x) if isinstance(x, dict) and not isinstance(x, cls)
+                     else x for x in value]
+        elif isinstance(value, dict) and not isinstance(value, cls):
+            value = cls(value)
+        return value
 
-        for k, v in d.items():
-            setattr(self, k, v)
+    def __setitem__(self, name, value):
+        if isinstance(value, (dict, list, tuple)):
+            value = self._convert(value)
+        dict.__setitem__(self, name, value)
+        self.__dict__[name] = value
 
-        # # Class attributes
-        # for k in self.__class__.__dict__.keys():
-        #     if not (k.startswith('__') and k.endswith('__')) and not k in ('update', 'pop'):
-        #         setattr(self, k, getattr(self, k))
+    __setattr__ = __setitem__
+
+    def __delitem__(self, name):
+        super(PyTreeDict, self).__delitem__(name)
+        self.__dict__.pop(name, None)
+
+    __delattr__ = __delitem__
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def pop(self, k, *d):
+        self.__dict__.pop(k, None)
+        return super(PyTreeDict, self).pop(k, *d)
 
-    def __setattr__(self, name, value):
-        if isinstance(value, (list, tuple)):
-            value = [self.__class__(x)
-                     if isinstance(x, dict) else x for x in value]
-        elif isinstance(value, dict) and not isinstance(value, self.__class__):
-            value = self.__class__(value)
-        super(PyTreeDict, self).__setattr__(name, value)
-        super(PyTreeDict, self).__setitem__(name, value)
-
-    __setitem__ = __setattr__
-
-    def update(self, e=None, **f):
-        d = e or dict()
-        d.update(f)
-        for k in d:
-            setattr(self, k, d[k])
-
-    def pop(self, k, d=None):
-        delattr(self, k)
-        return super(PyTreeDict, self).pop(k, d)
-    
     def copy(self):
-        d = super().copy() # dict
-        return self.__class__(d)
-    
+        # children are already converted
+        return _new_pytree_dict(self.__class__, self)
+
     def replace(self, **d):
         clone = self.copy()
         clone.update(**d)
         return clone
 
 
+def _new_pytree_dict(cls, items) -> PyTreeDict:
+    d = dict.__new__(cls)
+    dict.update(d, items)
+    d.__dict__.update(d)
+    return d
+
+
+def _pytree_dict_flatten(d: PyTreeDict):
+    return tuple(d.values()), tuple(d.keys())
+
+
+def _pytree_dict_flatten_with_keys(d: PyTreeDict):
+    return tuple((jax.tree_util.DictKey(k), v) for k, v in d.items()), tuple(d.keys())
+
+
+def _pytree_dict_unflatten(keys, values) -> PyTreeDict:
+    return _new_pytree_dict(PyTreeDict, zip(keys, values))
+
 
-jax.tree_util.register_pytree_node(
+# keys are kept in insertion order (unlike dict)
+jax.tree_util.register_pytree_with_keys(
     PyTreeDict,
-    lambda d: (tuple(d.values()), tuple(d.keys())),
-    lambda keys, values: PyTreeDict(dict(safe_zip(keys, values)))
+    _pytree_dict_flatten_with_keys,
+    _pytree_dict_unflatten,
+    _pytree_dict_flatten
 )
 
 
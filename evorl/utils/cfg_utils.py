@@ -3,7 +3,8 @@ from pathlib import Path
 
 def get_output_dir(default_path: str='./debug'):
     if HydraConfig.initialized():
-        output_dir = Path(HydraConfig.get().run.dir).absolute()
+        # run.dir or sweep.dir/subdir under multirun
+        output_dir = Path(HydraConfig.get().runtime.output_dir).absolute()
     else:
         output_dir = Path(default_path).absolute()
 
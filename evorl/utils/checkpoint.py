@@ -0,0 +1,337 @@
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import numpy as np
+import chex
+import orbax.checkpoint as ocp
+from omegaconf import DictConfig, OmegaConf
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_ITEMS = ('state', 'refs')
+COMPRESSION_DTYPES = {'bfloat16': jnp.bfloat16}
+
+
+def _key_name(key) -> str:
+    if isinstance(key, jtu.DictKey):
+        return str(key.key)
+    elif isinstance(key, jtu.GetAttrKey):
+        return key.name
+    elif isinstance(key, jtu.SequenceKey):
+        return str(key.idx)
+    elif isinstance(key, jtu.FlattenedIndexKey):
+        return str(key.key)
+    return str(key)
+
+
+def flatten_state(tree: Dict[str, chex.ArrayTree]) -> Dict[str, chex.Array]:
+    """
+        {field: subtree} -> {'field.a.b': leaf}
+    """
+    flat = {}
+    for name, subtree in tree.items():
+        for path, leaf in jtu.tree_flatten_with_path(subtree)[0]:
+            flat['.'.join([name] + [_key_name(k) for k in path])] = leaf
+    return flat
+
+
+def unflatten_state(flat: Dict[str, chex.Array], tree: Dict[str, chex.ArrayTree]) -> Dict[str, chex.ArrayTree]:
+    """
+        Inverse of `flatten_state` with the structure of `tree`. Fields
+        without any leaf in `flat` are skipped.
+    """
+    restored = {}
+    for name, subtree in tree.items():
+        paths, treedef = jtu.tree_flatten_with_path(subtree)
+        names = ['.'.join([name] + [_key_name(k) for k in path])
+                 for path, _ in paths]
+        missing = [n for n in names if n not in flat]
+        if len(missing) == len(names):
+            continue
+        elif missing:
+            raise ValueError(
+                f'structure of {name} mismatches the checkpoint, missing: {missing}')
+        restored[name] = jtu.tree_unflatten(
+            treedef, [flat[n] for n in names])
+    return restored
+
+
+def _fmix32(x: chex.Array) -> chex.Array:
+    # murmur3 finalizer
+    x = x ^ (x >> 16)
+    x = x * jnp.uint32(0x85ebca6b)
+    x = x ^ (x >> 13)
+    x = x * jnp.uint32(0xc2b2ae35)
+    return x ^ (x >> 16)
+
+
+def _leaf_words(x: chex.Array) -> chex.Array:
+    """
+        The bits of x as a flat uint32 array; 64-bit words are split in
+        two halves.
+    """
+    x = jnp.ravel(x)
+    if x.dtype == jnp.bool_:
+        x = x.astype(jnp.uint8)
+    if x.dtype.itemsize > 4:
+        # 64-bit words -> uint32[..., 2]
+        return jnp.ravel(jax.lax.bitcast_convert_type(x, jnp.uint32))
+    return jax.lax.bitcast_convert_type(
+        x, jnp.dtype(f'uint{x.dtype.itemsize*8}')).astype(jnp.uint32)
+
+
+def _leaf_fingerprint(x: chex.Array) -> chex.Array:
+    """
+        64-bit position-sensitive hash of the bits of x, as uint32[2].
+    """
+    x = _leaf_words(x)
+    i = jnp.arange(x.size, dtype=jnp.uint32)
+    h1 = _fmix32(x ^ _fmix32(i)).sum(dtype=jnp.uint32)
+    h2 = _fmix32(x + i * jnp.uint32(0x9e3779b9) + jnp.uint32(0x7f4a7c15)
+                 ).sum(dtype=jnp.uint32)
+    return jnp.stack([h1, h2])
+
+
+@jax.jit
+def _fingerprints(leaves):
+    return [_leaf_fingerprint(x) for x in leaves]
+
+
+def _host_bitwise_equal(x: np.ndarray, y: np.ndarray) -> bool:
+    return (x.shape == y.shape and x.dtype == y.dtype and
+            np.array_equal(np.ravel(x).view(np.uint8), np.ravel(y).view(np.uint8)))
+
+
+def fingerprint_leaves(flat: Dict[str, chex.Array]) -> Dict[str, Tuple]:
+    """
+        Fingerprints of the leaves computed on their devices; only 8 bytes
+        per leaf are transferred to the host.
+    """
+    names = list(flat.keys())
+    leaves = [flat[n] for n in names]
+    hashes = jax.device_get(_fingerprints(leaves))
+    return {
+        n: (tuple(np.shape(x)), str(jnp.result_type(x)), tuple(int(v) for v in h))
+        for n, x, h in zip(names, leaves, hashes)
+    }
+
+
+def _compression_dtype(compression: Optional[str]):
+    if compression is None:
+        return None
+    if compression not in COMPRESSION_DTYPES:
+        raise ValueError(
+            f'checkpoint compression {compression} not supported, '
+            f'choose from {list(COMPRESSION_DTYPES)}')
+    return COMPRESSION_DTYPES[compression]
+
+
+def _dedup_from_config(ckpt_config: DictConfig) -> bool:
+    dedup = OmegaConf.select(ckpt_config, 'dedup', default=None)
+    if dedup is None:
+        # on for params-only checkpoints, whose host copies are small
+        return OmegaConf.select(ckpt_config, 'subset', default='full') == 'params'
+    return dedup
+
+
+class Checkpointer:
+    """
+        Save {field: subtree} dicts by an orbax CheckpointManager, as the flat
+        leaves (item 'state') and the step storing each leaf (item 'refs').
+
+        Args:
+            checkpoint_manager: manager with item_names=CHECKPOINT_ITEMS.
+            max_to_keep: keep the latest k checkpoints (and the older ones
+                holding their deduplicated leaves), None to keep all.
+            dedup: leaves unchanged since the last save (eg: frozen nets,
+                normalizer states) are not written again, but referenced.
+                A leaf whose fingerprint matches is compared bitwise with
+                its last saved value before being referenced, so the
+                checkpointer keeps a host copy of every saved leaf (meant
+                for params-only checkpoints, not the replay buffer). Leaves
+                not fully addressable by this process are always written.
+            compression: None or 'bfloat16', store float leaves in bfloat16
+                (lossy, eg: for params-only checkpoints). The arrays are
+                always zstd-compressed by orbax.
+    """
+
+    def __init__(
+        self,
+        checkpoint_manager: ocp.CheckpointManager,
+        max_to_keep: Optional[int] = None,
+        dedup: bool = False,
+        compression: Optional[str] = None
+    ):
+        self.checkpoint_manager = checkpoint_manager
+        self.max_to_keep = max_to_keep
+        self.dedup = dedup
+        self.compression_dtype = _compression_dtype(compression)
+
+        # leaf -> (fingerprint, step storing it, host copy of the last saved value)
+        self._stored = {}
+        # step -> steps referenced by it
+        self._step_refs = {}
+        if max_to_keep is not None:
+            # steps saved before a resume are pruned too
+            for step in checkpoint_manager.all_steps():
+                self._step_refs[step] = self._load_step_refs(step)
+
+    @classmethod
+    def from_config(cls, config: DictConfig, checkpoint_manager: ocp.CheckpointManager):
+        ckpt_config = config.checkpoint
+        return cls(
+            checkpoint_manager,
+            max_to_keep=ckpt_config.max_to_keep,
+            dedup=_dedup_from_config(ckpt_config),
+            compression=OmegaConf.select(
+                ckpt_config, 'compression', default=None)
+        )
+
+    def _load_step_refs(self, step: int) -> set:
+        refs = self.checkpoint_manager.restore(
+            step, args=ocp.args.Composite(refs=ocp.args.JsonRestore())).refs
+        return set(refs.values())
+
+    def should_save(self, step: int) -> bool:
+        return self.checkpoint_manager.should_save(step)
+
+    def _save_args(self, flat: Dict[str, chex.Array]) -> Dict[str, ocp.SaveArgs]:
+        def _save_arg(x):
+            if (self.compression_dtype is not None and
+                    jnp.issubdtype(jnp.result_type(x), jnp.floating)):
+                return ocp.SaveArgs(dtype=self.compression_dtype)
+            return ocp.SaveArgs()
+        return {n: _save_arg(x) for n, x in flat.items()}
+
+    def save(self, step: int, tree: Dict[str, chex.ArrayTree]) -> None:
+        flat = flatten_state(tree)
+
+        if self.dedup:
+            fingerprints = fingerprint_leaves(flat)
+            # the same on every process, so all of them write the same leaves
+            addressable = [n for n, x in flat.items()
+                           if getattr(x, 'is_fully_addressable', True)]
+            host_values = dict(zip(
+                addressable, jax.device_get([flat[n] for n in addressable])))
+
+            refs = {}
+            for n, fp in fingerprints.items():
+                host_value = host_values.get(n)
+                prev = self._stored.get(n)
+                # confirm the fingerprint matches exactly
+                if (host_value is not None and prev is not None and
+                        prev[0] == fp and prev[2] is not None and
+                        _host_bitwise_equal(host_value, prev[2])):
+                    refs[n] = prev[1]
+                else:
+                    refs[n] = step
+                self._stored[n] = (fp, refs[n], host_value)
+        else:
+            refs = {n: step for n in flat}
+
+        stored = {n: x for n, x in flat.items() if refs[n] == step}
+        args = dict(refs=ocp.args.JsonSave(refs))
+        if stored:
+            args['state'] = ocp.args.PyTreeSave(
+                stored, save_args=self._save_args(stored))
+        self.checkpoint_manager.save(step, args=ocp.args.Composite(**args))
+        self._step_refs[step] = set(refs.values())
+
+        logger.debug(
+            f'checkpoint {step}: {len(stored)}/{len(flat)} leaves written')
+        self._prune()
+
+    def _prune(self) -> None:
+        if self.max_to_keep is None:
+            return
+        steps = sorted(self._step_refs)
+        keep = set(steps[-self.max_to_keep:])
+        pending = list(keep)
+        while pending:
+            for ref_step in self._step_refs.get(pending.pop(), ()):
+                if ref_step not in keep:
+                    keep.add(ref_step)
+                    pending.append(ref_step)
+
+        for step in steps:
+            if step not in keep:
+                self.checkpoint_manager.delete(step)
+                self._step_refs.pop(step)
+
+    def wait_until_finished(self) -> None:
+        self.checkpoint_manager.wait_until_finished()
+
+    def close(self) -> None:
+        self.checkpoint_manager.close()
+
+
+def get_checkpoint_path(path: Union[str, Path]) -> Path:
+    """
+        Accept a run output dir or its `checkpoints` dir.
+    """
+    path = Path(path).expanduser().absolute()
+    if (path/'checkpoints').is_dir():
+        path = path/'checkpoints'
+    return path
+
+
+def restore_checkpoint(path: Union[str, Path], target: Dict[str, chex.ArrayTree], step: Optional[int] = None) -> Tuple[Dict[str, chex.ArrayTree], int]:
+    """
+        Restore a checkpoint saved by `Checkpointer`.
+
+        Args:
+            path: checkpoints dir (or the run output dir).
+            target: {field: subtree} giving the structure, dtype and
+                sharding of the leaves to restore, eg: a freshly initialized
+                state. Leaves are read directly to the sharding of the target.
+            step: None for the latest step.
+
+        Returns:
+            The fields of target saved in the checkpoint, and the step.
+            Deduplicated leaves are read from the steps storing them, and
+            fields absent in the checkpoint are skipped without reading.
+    """
+    path = get_checkpoint_path(path)
+    checkpoint_manager = ocp.CheckpointManager(
+        path,
+        item_names=CHECKPOINT_ITEMS,
+        options=ocp.CheckpointManagerOptions(read_only=True)
+    )
+    if step is None:
+        step = checkpoint_manager.latest_step()
+        if step is None:
+            raise FileNotFoundError(f'no checkpoint found in {path}')
+
+    refs = checkpoint_manager.restore(
+        step, args=ocp.args.Composite(refs=ocp.args.JsonRestore())).refs
+
+    target_flat = flatten_state(target)
+    saved_fields = set(n.split('.', 1)[0] for n in refs)
+    by_step = {}
+    for n, x in target_flat.items():
+        if n in refs:
+            by_step.setdefault(refs[n], []).append(n)
+        elif n.split('.', 1)[0] in saved_fields:
+            raise ValueError(
+                f'{n} not found in the checkpoint {step}, the state structure mismatches')
+
+    flat = {}
+    for ref_step, names in sorted(by_step.items()):
+        item = {n: target_flat[n] for n in names}
+        restored = checkpoint_manager.restore(
+            ref_step,
+            args=ocp.args.Composite(state=ocp.args.PyTreeRestore(
+                item=item,
+                restore_args=ocp.checkpoint_utils.construct_restore_args(item),
+                transforms={}  # partial restore
+            ))
+        ).state
+        flat.update(restored)
+
+    checkpoint_manager.close()
+
+    return unflatten_state(flat, target), step
@@ -0,0 +1,191 @@
+"""
+    Device memory instrumentation:
+
+    - `device_memory_metrics`: in-use & peak bytes from `device.memory_stats()`.
+    - `estimate_rl_workflow_memory`: predict the size of the env_state carry,
+      the rollout SampleBatch (with its extras), the GAE intermediates and
+      the replay buffer before allocation.
+"""
+import logging
+import os
+import resource
+from typing import Dict, Optional, Sequence
+
+import chex
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import numpy as np
+from omegaconf import OmegaConf
+
+from evorl.envs import Env
+from evorl.envs.space import Space, Box, Discrete
+
+logger = logging.getLogger(__name__)
+
+
+def tree_nbytes(tree: chex.ArrayTree) -> int:
+    """
+        Total bytes of arrays or `jax.ShapeDtypeStruct` in the tree.
+    """
+    return sum(
+        int(np.prod(x.shape)) * jnp.dtype(x.dtype).itemsize
+        for x in jtu.tree_leaves(tree)
+    )
+
+
+def space_nbytes(space: Space) -> int:
+    if isinstance(space, Box):
+        return space.low.size * space.low.dtype.itemsize
+    elif isinstance(space, Discrete):
+        # sampled as int32
+        return jnp.dtype(jnp.int32).itemsize
+    else:
+        raise TypeError(f"Unsupported space: {type(space)}")
+
+
+def transition_nbytes(obs_space: Space, action_space: Space, with_next_obs: bool = True) -> int:
+    """
+        Bytes of one transition: obs, actions, rewards, dones (and next_obs).
+    """
+    # rewards & dones are float32
+    nbytes = space_nbytes(obs_space) + space_nbytes(action_space) + 2*4
+    if with_next_obs:
+        nbytes += space_nbytes(obs_space)
+    return nbytes
+
+
+def estimate_sample_batch_nbytes(env: Env, agent, rollout_length: int,
+                                 env_extra_fields: Sequence[str] = ()) -> int:
+    """
+        Bytes of the SampleBatch [T, #envs, ...] returned by
+        `evorl.rollout.rollout`, including the policy extras and the env
+        extras, traced by `jax.eval_shape` without allocation.
+    """
+    from evorl.rollout import rollout
+
+    def _rollout(key):
+        env_state = env.reset(key)
+        _, trajectory = rollout(
+            env, agent, env_state, agent.init(key), key,
+            rollout_length=rollout_length, env_extra_fields=env_extra_fields)
+        return trajectory
+
+    return tree_nbytes(jax.eval_shape(_rollout, jax.random.PRNGKey(0)))
+
+
+def estimate_gae_nbytes(obs_space: Space, num_envs: int, rollout_length: int) -> int:
+    """
+        Bytes of the GAE intermediates of an on-policy step: the obs with
+        the bootstrap obs and their values [T+1, #envs], the v_targets and
+        advantages [T, #envs].
+    """
+    return (rollout_length+1) * num_envs * (space_nbytes(obs_space) + 4) + \
+        2 * rollout_length * num_envs * 4
+
+
+def estimate_replay_buffer_nbytes(obs_space: Space, action_space: Space, capacity: int) -> int:
+    return capacity * transition_nbytes(obs_space, action_space)
+
+
+def estimate_env_state_nbytes(env: Env) -> int:
+    """
+        Bytes of the EnvState carry, traced by `jax.eval_shape` without allocation.
+    """
+    return tree_nbytes(jax.eval_shape(env.reset, jax.random.PRNGKey(0)))
+
+
+def estimate_rl_workflow_memory(workflow) -> Dict[str, int]:
+    """
+        Estimated bytes of the main data on each device. The intermediates
+        of the compiled step are not included, see `evorl.cost_analysis`.
+    """
+    config = workflow.config
+    env = workflow.env
+    key = jax.random.PRNGKey(0)
+
+    estimates = dict(
+        agent_state=tree_nbytes(jax.eval_shape(workflow.agent.init, key)),
+        env_state=estimate_env_state_nbytes(env),
+    )
+
+    num_envs = OmegaConf.select(config, 'num_envs', default=None)
+    rollout_length = OmegaConf.select(config, 'rollout_length', default=None)
+    if num_envs is not None and rollout_length is not None:
+        estimates['sample_batch'] = estimate_sample_batch_nbytes(
+            env, workflow.agent, rollout_length,
+            getattr(workflow, '_rollout_env_extra_fields', ()))
+        if OmegaConf.select(config, 'gae_lambda', default=None) is not None:
+            estimates['gae'] = estimate_gae_nbytes(
+                env.obs_space, num_envs, rollout_length)
+            # the trajectory flattened to [T*#envs, ...] with the GAE
+            # targets; an upper bound, XLA may alias the reshape
+            estimates['flat_sample_batch'] = estimates['sample_batch'] + \
+                2 * rollout_length * num_envs * 4
+
+    capacity = OmegaConf.select(config, 'replay_buffer.capacity', default=None)
+    if capacity is not None:
+        estimates['replay_buffer'] = estimate_replay_buffer_nbytes(
+            env.obs_space, env.action_space, capacity)
+
+    return estimates
+
+
+def _host_memory() -> int:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def available_memory(device: jax.Device) -> Optional[int]:
+    """
+        Free bytes of the device. For CPU devices, use the host memory.
+    """
+    stats = device.memory_stats()
+    if stats is not None and 'bytes_limit' in stats:
+        return stats['bytes_limit'] - stats.get('bytes_in_use', 0)
+    if device.platform == 'cpu':
+        return _host_memory()
+    return None
+
+
+def check_memory(estimates: Dict[str, int], device: jax.Device) -> bool:
+    """
+        Warn when the estimated memory exceeds the available memory of the device.
+    """
+    total = sum(estimates.values())
+    estimates_str = ', '.join(
+        f"{k}={v/2**20:.1f}MiB" for k, v in estimates.items())
+    logger.info(
+        f"estimated memory per device: {total/2**20:.1f}MiB ({estimates_str})")
+
+    available = available_memory(device)
+    if available is not None and total > available:
+        logger.warning(
+            f"estimated memory ({total/2**20:.1f}MiB) exceeds the available memory "
+            f"of {device} ({available/2**20:.1f}MiB), consider smaller num_envs, "
+            f"rollout_length or replay_buffer.capacity")
+        return False
+    return True
+
+
+def device_memory_metrics(devices: Sequence[jax.Device]) -> Dict[str, int]:
+    """
+        In-use & peak bytes, maximum over devices. CPU devices have no
+        memory_stats(), use the RSS of the host process instead.
+    """
+    stats = [d.memory_stats() for d in devices]
+    stats = [s for s in stats if s is not None]
+
+    if len(stats) > 0:
+        return {
+            'memory/bytes_in_use': max(s.get('bytes_in_use', 0) for s in stats),
+            'memory/peak_bytes_in_use': max(s.get('peak_bytes_in_use', 0) for s in stats),
+        }
+
+    if all(d.platform == 'cpu' for d in devices):
+        # ru_maxrss is in KiB on linux
+        return {
+            'memory/peak_bytes_in_use': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024
+        }
+
+    return {}
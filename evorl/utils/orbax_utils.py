@@ -13,7 +13,9 @@ def load(path, state: chex.ArrayTree) -> chex.ArrayTree:
         Args:
             path: checkpoint path
             state: the same structure as the saved state. Can be a dummy state 
-                or its abstract_state by `jtu.tree_map(ocp.utils.to_shape_dtype_struct, state)`
+                or its abstract_state by `jtu.tree_map(ocp.utils.to_shape_dtype_struct, state)`.
+                Arrays are restored with the sharding of the corresponding leaves in `state`,
+                eg: state from the shard_map backend is restored directly onto the mesh.
     """
     ckpt = ocp.StandardCheckpointer()
     state = ckpt.restore(path, args=ocp.args.StandardRestore(state))
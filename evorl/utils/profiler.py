@@ -0,0 +1,226 @@
+"""
+    Profiling helpers:
+
+    - Inside jitted functions, phases are tagged by `jax.named_scope`, which
+      shows up as the op names in the device trace.
+    - On the host side, `TraceWindow` captures a `jax.profiler` trace for a
+      window of iterations, and annotates each iteration as a trace step.
+    - `PerfTimer` measures the wall time of host-side phases and the
+      throughput, recorded under the `perf/` namespace.
+
+    View the trace with tensorboard (tensorboard-plugin-profile) or perfetto.
+"""
+import contextlib
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+import chex
+import jax
+from omegaconf import DictConfig, OmegaConf
+
+from .cfg_utils import get_output_dir
+
+logger = logging.getLogger(__name__)
+
+
+class TraceWindow:
+    """
+        Capture a `jax.profiler` trace for the iterations in
+        [start_iteration, start_iteration + num_iterations).
+
+        Usage:
+            for i in range(num_iters):
+                with trace_window.step(i):
+                    state = workflow.step(state)
+                trace_window.maybe_stop(i, state)
+    """
+
+    def __init__(self,
+                 log_dir: Union[str, Path],
+                 start_iteration: int = 0,
+                 num_iterations: int = 1,
+                 enable: bool = True,
+                 create_perfetto_link: bool = False):
+        self.log_dir = Path(log_dir)
+        self.start_iteration = start_iteration
+        self.stop_iteration = start_iteration + num_iterations
+        self.enable = enable
+        self.create_perfetto_link = create_perfetto_link
+        self._tracing = False
+
+    @classmethod
+    def from_config(cls, config: DictConfig) -> "TraceWindow":
+        """
+            Build from the `profiler` section of the config.
+        """
+        profiler_cfg = OmegaConf.select(config, 'profiler', default=None)
+        if profiler_cfg is None:
+            return cls(log_dir=get_output_dir()/'profile', enable=False)
+
+        log_dir = profiler_cfg.get('log_dir', None)
+        if log_dir is None:
+            log_dir = get_output_dir()/'profile'
+
+        return cls(
+            log_dir=log_dir,
+            start_iteration=profiler_cfg.start_iteration,
+            num_iterations=profiler_cfg.num_iterations,
+            enable=profiler_cfg.enable,
+            create_perfetto_link=profiler_cfg.get('create_perfetto_link', False)
+        )
+
+    @property
+    def tracing(self) -> bool:
+        return self._tracing
+
+    def start(self) -> None:
+        if self._tracing:
+            return
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        logger.info(f"start profiler trace, save to {self.log_dir}")
+        jax.profiler.start_trace(
+            str(self.log_dir), create_perfetto_link=self.create_perfetto_link)
+        self._tracing = True
+
+    def stop(self, outputs: Optional[chex.ArrayTree] = None) -> None:
+        if not self._tracing:
+            return
+        if outputs is not None:
+            # wait for the async dispatched computation to be traced
+            jax.block_until_ready(outputs)
+        jax.profiler.stop_trace()
+        self._tracing = False
+        logger.info(f"stop profiler trace, saved to {self.log_dir}")
+
+    @contextlib.contextmanager
+    def step(self, iteration: int, name: str = 'train'):
+        """
+            Annotate one iteration, and start the trace at `start_iteration`.
+        """
+        if self.enable and iteration == self.start_iteration:
+            self.start()
+
+        if self._tracing:
+            with jax.profiler.StepTraceAnnotation(name, step_num=iteration):
+                yield
+        else:
+            yield
+
+    def maybe_stop(self, iteration: int, outputs: Optional[chex.ArrayTree] = None) -> None:
+        """
+            Stop the trace at the end of the window.
+        """
+        if self._tracing and iteration + 1 >= self.stop_iteration:
+            self.stop(outputs)
+
+
+
+class PerfTimer:
+    """
+        Wall time of host-side phases (eg: step, evaluate, checkpoint) and
+        the throughput (eg: env_steps/sec, grad_steps/sec).
+
+        To keep the async dispatch, the outputs are only synchronized by
+        `block_until_ready` every `sample_interval` iterations.
+
+        Usage:
+            for i in range(num_iters):
+                perf_timer.begin(i)
+                state = perf_timer.time('step', workflow.step, state)
+                recorder.write(perf_timer.report(state, env_steps=...), i)
+    """
+
+    def __init__(self, sample_interval: int = 10):
+        """
+            Args:
+                sample_interval: measure every k iterations, 0 to disable.
+        """
+        self.sample_interval = sample_interval
+        self._sampling = False
+        self._iteration = 0
+        self._phase_times = {}
+        self._last_time = None
+        self._last_iteration = None
+        self._last_counters = {}
+
+    @classmethod
+    def from_config(cls, config: DictConfig) -> "PerfTimer":
+        """
+            Build from the `perf` section of the config.
+        """
+        return cls(sample_interval=OmegaConf.select(
+            config, 'perf.sample_interval', default=0))
+
+    @property
+    def enable(self) -> bool:
+        return self.sample_interval > 0
+
+    @property
+    def sampling(self) -> bool:
+        """
+            Whether the current iteration is measured.
+        """
+        return self._sampling
+
+    def begin(self, iteration: int) -> None:
+        self._iteration = iteration
+        self._sampling = self.enable and \
+            (iteration + 1) % self.sample_interval == 0
+
+    def time(self, name: str, fn: Callable, *args, force: bool = False) -> Any:
+        """
+            Call `fn(*args)` and measure its wall time when sampling.
+
+            Args:
+                force: measure it in every iteration, used for phases that
+                    are already synchronous or infrequent (eg: evaluate).
+        """
+        if not (self._sampling or (self.enable and force)):
+            return fn(*args)
+
+        # exclude the pending computations of previous phases
+        jax.block_until_ready(args)
+        start = time.perf_counter()
+        outputs = fn(*args)
+        jax.block_until_ready(outputs)
+        self._phase_times[name] = time.perf_counter() - start
+        return outputs
+
+    def report(self, outputs: Optional[chex.ArrayTree] = None, **counters) -> Dict[str, float]:
+        """
+            Get the perf metrics of the current iteration.
+
+            Args:
+                outputs: synchronized before measuring the throughput.
+                counters: accumulated counters (eg: env_steps=sampled_timesteps),
+                    reported as `perf/<name>_per_sec`.
+        """
+        data = {
+            f'perf/{name}_time': t for name, t in self._phase_times.items()
+        }
+        self._phase_times.clear()
+
+        if not self._sampling:
+            return data
+
+        jax.block_until_ready(outputs)
+        now = time.perf_counter()
+        counters = {k: int(v) for k, v in counters.items()}
+
+        # throughput over the iterations between two samples
+        if self._last_time is not None:
+            elapsed = now - self._last_time
+            data['perf/iteration_time'] = elapsed / \
+                (self._iteration - self._last_iteration)
+            for k, v in counters.items():
+                data[f'perf/{k}_per_sec'] = (
+                    v - self._last_counters[k]) / elapsed
+
+        self._last_time = now
+        self._last_iteration = self._iteration
+        self._last_counters = counters
+        self._sampling = False
+
+        return data
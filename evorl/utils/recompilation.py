@@ -0,0 +1,164 @@
+"""
+    Retrace & recompilation telemetry of jitted workflow methods.
+
+    `track_traces` wraps the python function before `jax.jit` / `jax.pmap` /
+    shard_map. Its body only runs when jax traces it (ie: a cache miss), so it
+    counts the traces and logs the argument signature that caused each retrace.
+    The following backend compilation is attributed to the same function.
+"""
+import functools
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import jax
+import jax.tree_util as jtu
+from jax.api_util import shaped_abstractify
+from omegaconf import DictConfig, OmegaConf
+
+logger = logging.getLogger(__name__)
+
+BACKEND_COMPILE_EVENT = '/jax/core/compile/backend_compile_duration'
+
+# the (monitor, name) of the latest trace on this thread
+_local = threading.local()
+_listener_registered = False
+
+
+class RecompilationError(RuntimeError):
+    pass
+
+
+def _arg_signature(x: Any) -> str:
+    if isinstance(x, (jax.Array, jax.core.Tracer)):
+        aval = shaped_abstractify(x)
+        weak = '(weak)' if getattr(aval, 'weak_type', False) else ''
+        return aval.str_short() + weak
+    # static or python scalar args
+    try:
+        return f"{type(x).__name__}(hash={hash(x)})"
+    except TypeError:
+        return f"{type(x).__name__}(unhashable)"
+
+
+def get_signature(args: Tuple, kwargs: Dict) -> Dict[str, str]:
+    """
+        Flatten the arguments to {path: "dtype[shape]"}.
+    """
+    flat, _ = jtu.tree_flatten_with_path((args, kwargs))
+    return {jtu.keystr(path): _arg_signature(x) for path, x in flat}
+
+
+def _diff_signature(old: Dict[str, str], new: Dict[str, str]) -> List[str]:
+    diff = []
+    for path in sorted(old.keys() | new.keys()):
+        if old.get(path) != new.get(path):
+            diff.append(
+                f"{path}: {old.get(path, '<missing>')} -> {new.get(path, '<missing>')}")
+    return diff
+
+
+def _on_event_duration(event: str, duration: float, **kwargs) -> None:
+    if event != BACKEND_COMPILE_EVENT:
+        return
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        monitor, name = current
+        monitor._on_compile(name, duration)
+        _local.current = None
+
+
+class RecompilationMonitor:
+    """
+        Count the traces and compilations per function.
+
+        Args:
+            raise_after_steps: raise `RecompilationError` when a tracked function
+                is retraced after this number of steps, None to only log it.
+    """
+
+    def __init__(self, raise_after_steps: Optional[int] = None):
+        self.raise_after_steps = raise_after_steps
+        self.num_traces = defaultdict(int)
+        self.num_compiles = defaultdict(int)
+        self.compile_time = defaultdict(float)
+        self._signatures = {}
+        self._step = 0
+
+        global _listener_registered
+        if not _listener_registered:
+            jax.monitoring.register_event_duration_secs_listener(
+                _on_event_duration)
+            _listener_registered = True
+
+    @classmethod
+    def from_config(cls, config: DictConfig) -> "RecompilationMonitor":
+        return cls(raise_after_steps=OmegaConf.select(
+            config, 'recompilation.raise_after_steps', default=None))
+
+    def step(self, iteration: int) -> None:
+        """
+            Set the current training step.
+        """
+        self._step = iteration
+
+    def _on_trace(self, name: str, signature: Dict[str, str]) -> None:
+        self.num_traces[name] += 1
+        _local.current = (self, name)
+
+        prev_signature = self._signatures.get(name)
+        self._signatures[name] = signature
+        if prev_signature is None:
+            logger.debug(f"trace {name} at step {self._step}")
+            return
+
+        diff = _diff_signature(prev_signature, signature)
+        reason = '\n'.join(diff) if diff else \
+            "same argument signature, the hash of static args or the cache may change"
+        msg = f"retrace {name} (#{self.num_traces[name]}) at step {self._step}:\n{reason}"
+
+        if self.raise_after_steps is not None and self._step >= self.raise_after_steps:
+            raise RecompilationError(msg)
+        logger.warning(msg)
+
+    def _on_compile(self, name: str, duration: float) -> None:
+        self.num_compiles[name] += 1
+        self.compile_time[name] += duration
+        logger.debug(f"compile {name}: {duration:.2f}s")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: dict(
+                num_traces=self.num_traces[name],
+                num_compiles=self.num_compiles[name],
+                compile_time=self.compile_time[name]
+            )
+            for name in self.num_traces
+        }
+
+
+def track_traces(fn: Callable, name: Optional[str] = None) -> Callable:
+    """
+        Wrap a method `fn(self, *args)` to be jitted. Each trace is reported to
+        `self.recompile_monitor` if the instance has one.
+    """
+    name = fn.__qualname__ if name is None else name
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        monitor = getattr(self, 'recompile_monitor', None)
+        # skip nested traces of the same function, eg: jit(jit(fn))
+        tracing = getattr(_local, 'tracing', set())
+        if monitor is None or name in tracing:
+            return fn(self, *args, **kwargs)
+
+        monitor._on_trace(
+            name, get_signature((self,) + args, kwargs))
+        _local.tracing = tracing | {name}
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            _local.tracing = tracing
+
+    return wrapper
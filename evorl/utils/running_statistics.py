@@ -14,6 +14,7 @@ import jax.numpy as jnp
 import jax.tree_util as jtu
 import chex
 
+from evorl.distributed.compression import tree_bucketed_psum
 from .jax_utils import tree_zeros_like
 
 from .jax_utils import tree_ones_like
@@ -81,6 +82,7 @@ def update(state: RunningStatisticsState,
            std_min_value: float = 1e-6,
            std_max_value: float = 1e6,
            pmap_axis_name: Optional[str] = None,
+           bucket_size: Optional[int] = None,
            validate_shapes: bool = True) -> RunningStatisticsState:
     """Updates the running statistics with the given batch of data.
 
@@ -102,6 +104,8 @@ def update(state: RunningStatisticsState,
       std_min_value: Minimum value for the standard deviation.
       std_max_value: Maximum value for the standard deviation.
       pmap_axis_name: Name of the pmapped axis, if any.
+      bucket_size: Fuse the psums of leaves with no more than `bucket_size`
+        elements into one collective. None to psum each leaf separately.
       validate_shapes: If true, the shapes of all leaves of the batch will be
         validated. Enabled by default. Doesn't impact performance when jitted.
 
@@ -134,11 +138,9 @@ def update(state: RunningStatisticsState,
                 raise ValueError(f'{weights.shape} != {batch_dims}')
         _validate_batch_shapes(batch, state.mean, batch_dims)
 
-    def _compute_node_statistics(
-            mean: chex.Array, summed_variance: chex.Array,
-            batch: chex.Array) -> Tuple[chex.Array, chex.Array]:
+    def _compute_diff_to_old_mean(mean: chex.Array,
+                                  batch: chex.Array) -> chex.Array:
         assert isinstance(mean, chex.Array), type(mean)
-        assert isinstance(summed_variance, chex.Array), type(summed_variance)
         # The mean and the sum of past variances are updated with Welford's
         # algorithm using batches (see https://stackoverflow.com/q/56402955).
         diff_to_old_mean = batch - mean
@@ -147,27 +149,38 @@ def update(state: RunningStatisticsState,
                 weights,
                 list(weights.shape) + [1] * (batch.ndim - weights.ndim))
             diff_to_old_mean = diff_to_old_mean * expanded_weights
-        mean_update = jnp.sum(diff_to_old_mean, axis=batch_axis) / count
-        if pmap_axis_name is not None:
-            mean_update = jax.lax.psum(
-                mean_update, axis_name=pmap_axis_name)
-        mean = mean + mean_update
+        return diff_to_old_mean
+
+    def _psum(tree):
+        # one collective per bucket instead of one per leaf
+        return tree_bucketed_psum(tree, pmap_axis_name, bucket_size)
+
+    diff_to_old_mean = jtu.tree_map(
+        _compute_diff_to_old_mean, state.mean, batch)
+
+    mean_update = jtu.tree_map(
+        lambda d: jnp.sum(d, axis=batch_axis), diff_to_old_mean)
+    mean_update = _psum(mean_update)
+    mean = jtu.tree_map(lambda m, u: m + u / count, state.mean, mean_update)
 
+    def _compute_variance_update(diff_to_old_mean: chex.Array,
+                                 mean: chex.Array,
+                                 batch: chex.Array) -> chex.Array:
         diff_to_new_mean = batch - mean
         variance_update = diff_to_old_mean * diff_to_new_mean
-        variance_update = jnp.sum(variance_update, axis=batch_axis)
-        if pmap_axis_name is not None:
-            variance_update = jax.lax.psum(
-                variance_update, axis_name=pmap_axis_name)
-        summed_variance = summed_variance + variance_update
-        return mean, summed_variance
-
-    updated_stats = jtu.tree_map(_compute_node_statistics, state.mean,
-                                           state.summed_variance, batch)
-    # Extract `mean` and `summed_variance` from `updated_stats` nest.
-    mean = jtu.tree_map(lambda _, x: x[0], state.mean, updated_stats)
-    summed_variance = jtu.tree_map(lambda _, x: x[1], state.mean,
-                                             updated_stats)
+        return jnp.sum(variance_update, axis=batch_axis)
+
+    variance_update = jtu.tree_map(
+        _compute_variance_update, diff_to_old_mean, mean, batch)
+    variance_update = _psum(variance_update)
+
+    def _update_summed_variance(summed_variance: chex.Array,
+                                variance_update: chex.Array) -> chex.Array:
+        assert isinstance(summed_variance, chex.Array), type(summed_variance)
+        return summed_variance + variance_update
+
+    summed_variance = jtu.tree_map(
+        _update_summed_variance, state.summed_variance, variance_update)
 
     def compute_std(summed_variance: chex.Array,
                     std: chex.Array) -> chex.Array:
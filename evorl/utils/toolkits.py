@@ -7,6 +7,57 @@ from typing import Tuple, Optional
 from evorl.sample_batch import SampleBatch
 from evorl.types import MISSING_REWARD
 
+# use `jax.lax.associative_scan` for trajectories with at least this length
+ASSOCIATIVE_SCAN_MIN_LENGTH = 32
+
+
+def reverse_discounted_cumsum(
+        x: chex.Array,  # [T, B]
+        factors: chex.Array,  # [T, B]
+        associative: Optional[bool] = None,
+        unroll: int = 16) -> chex.Array:
+    """
+        Solve the linear recurrence y_t = x_t + factors_t * y_{t+1} with
+        y_T = 0 backwards in time. It is the core of discounted returns,
+        GAE and V-trace.
+
+        Args:
+            associative: use `jax.lax.associative_scan` with O(log T) depth,
+                otherwise a sequential reverse `jax.lax.scan` with O(T) depth.
+                None to choose by the length T (see `ASSOCIATIVE_SCAN_MIN_LENGTH`).
+            unroll: unroll of the sequential scan.
+
+        Returns:
+            y with the same shape as x.
+    """
+    if associative is None:
+        associative = x.shape[0] >= ASSOCIATIVE_SCAN_MIN_LENGTH
+
+    if associative:
+        def _combine(later, earlier):
+            # compose y -> a*y + b of step t (earlier) and t+1 (later)
+            a_later, b_later = later
+            a_earlier, b_earlier = earlier
+            return a_earlier * a_later, b_earlier + a_earlier * b_later
+
+        _, y = jax.lax.associative_scan(
+            _combine, (factors, x), reverse=True, axis=0)
+        return y
+
+    def _step(y_t_plus_1, x_t):
+        x_t, factor_t = x_t
+        y_t = x_t + factor_t * y_t_plus_1
+        return y_t, y_t
+
+    _, y = jax.lax.scan(
+        _step,
+        jnp.zeros_like(x[0]),
+        (x, factors),
+        reverse=True,
+        unroll=unroll
+    )
+    return y
+
 
 def compute_episode_length(
     dones: chex.Array,  # [T, B]
@@ -26,25 +77,12 @@ def compute_discount_return(
     """
         For episodic trajectory
     """
-    def _compute_discount_return(discount_return, x_t):
-        # G_t := r_t + γ * G_{t+1}
-        reward_t, discount_t = x_t
-        discount_return = reward_t + discount_return * discount_t
+    # G_t := r_t + γ * G_{t+1}
+    discount_returns = reverse_discounted_cumsum(
+        rewards, (1 - dones)*discount)
 
-        return discount_return, None
+    return discount_returns[0]  # [B]
 
-    # [#envs]
-    discount_return = jnp.zeros_like(rewards[0])
-
-    discount_return, _ = jax.lax.scan(
-        _compute_discount_return,
-        discount_return,
-        (rewards, (1 - dones)*discount),
-        reverse=True,
-        unroll=16
-    )
-
-    return discount_return  # [B]
 
 def compute_discount_return_mod(
         rewards: chex.Array,  # [T, B]
@@ -52,36 +90,26 @@ def compute_discount_return_mod(
         prev_dones: chex.Array,  # [B]
         discount: float = 1.0) -> chex.Array:
     """
-        for autoreset envs trajectory
+        for autoreset envs trajectory: the mean return of the complete
+        episodes of each env, 0 for envs without a complete episode.
     """
-
-    def _compute_discount_return(carry, x_t):
-        # G_t := r_t + γ * G_{t+1}
-
-        discount_return_sum, discount_return = carry
-        reward_t, dones_t = x_t
-        discount_return_sum += discount_return*dones_t
-        discount_return = reward_t + discount_return * (1-dones_t)*discount
-
-        return (discount_return_sum, discount_return), None
-
-    # [#envs]
-    discount_return = jnp.zeros_like(rewards[0])
-
-    discount_return_sum, discount_return, _ = jax.lax.scan(
-        _compute_discount_return,
-        discount_return,
-        (rewards, dones),
-        reverse=True,
-        unroll=16
+    # G_t := r_t + γ * G_{t+1}, reset at the end of each episode
+    discount_returns = reverse_discounted_cumsum(
+        rewards, (1 - dones)*discount)
+
+    # an episode starts at t=0 (if prev_dones=1) or after a done, and is
+    # complete if it ends with a done in the trajectory
+    episode_starts = jnp.concatenate([prev_dones[None], dones[:-1]], axis=0)
+    complete = jax.lax.cummax(dones, axis=0, reverse=True)
+    mask = episode_starts * complete
+
+    cnt = mask.sum(axis=0)
+    discount_return = jnp.where(
+        cnt > 0,
+        (discount_returns*mask).sum(axis=0) / jnp.maximum(cnt, 1),
+        0.0
     )
 
-    # case: add first episode's discount_return if it is complete:
-    # i.e. prev_dones = 1
-    discount_return_sum += discount_return*prev_dones
-
-    discount_return = discount_return_sum / dones.sum(axis=0)
-
     return discount_return  # [B]
 
 
@@ -89,7 +117,9 @@ def compute_gae(rewards: jax.Array,  # [T, B]
                 values: jax.Array,  # [T+1, B]
                 dones: jax.Array,  # [T, B]
                 gae_lambda: float = 1.0,
-                discount: float = 0.99) -> Tuple[jax.Array, jax.Array]:
+                discount: float = 0.99,
+                associative: Optional[bool] = None,
+                unroll: int = 16) -> Tuple[jax.Array, jax.Array]:
     """
     Calculates the Generalized Advantage Estimation (GAE).
 
@@ -101,6 +131,7 @@ def compute_gae(rewards: jax.Array,  # [T, B]
         dones: A float32 tensor of shape [T, B] with truncation signal.
         gae_lambda: Mix between 1-step (gae_lambda=0) and n-step (gae_lambda=1). 
         discount: TD discount.
+        associative, unroll: scan options, see `reverse_discounted_cumsum`.
 
     Returns:
         A float32 tensor of shape [T, B]. Can be used as target to
@@ -112,25 +143,74 @@ def compute_gae(rewards: jax.Array,  # [T, B]
 
     deltas = rewards + discount * (1 - dones) * values[1:] - values[:-1]
 
-    last_gae = jnp.zeros_like(values[0])
+    advantages = reverse_discounted_cumsum(
+        deltas, discount*gae_lambda*(1-dones),
+        associative=associative, unroll=unroll)
 
-    def _compute_gae(gae_t_plus_1, x_t):
-        delta_t, factor_t = x_t
-        gae_t = delta_t + factor_t * gae_t_plus_1
+    lambda_retruns = advantages + values[:-1]
 
-        return gae_t, gae_t
+    return jax.lax.stop_gradient(lambda_retruns), jax.lax.stop_gradient(advantages)
 
-    _, advantages = jax.lax.scan(
-        _compute_gae,
-        last_gae,
-        (deltas, discount*gae_lambda*(1-dones)),
-        reverse=True,
-        unroll=16
-    )
 
-    lambda_retruns = advantages + values[:-1]
+def compute_vtrace(log_rhos: jax.Array,  # [T, B]
+                   rewards: jax.Array,  # [T, B]
+                   values: jax.Array,  # [T+1, B]
+                   dones: jax.Array,  # [T, B]
+                   vtrace_lambda: float = 1.0,
+                   discount: float = 0.99,
+                   clip_rho_threshold: Optional[float] = 1.0,
+                   clip_pg_rho_threshold: Optional[float] = 1.0,
+                   clip_c_threshold: Optional[float] = 1.0) -> Tuple[jax.Array, jax.Array]:
+    """
+    Calculates the V-trace targets and policy gradient advantages (IMPALA).
 
-    return jax.lax.stop_gradient(lambda_retruns), jax.lax.stop_gradient(advantages)
+    Args:
+        log_rhos: A float32 tensor of shape [T, B] of log importance ratios
+          log(pi(a_t|x_t)/mu(a_t|x_t)), where pi is the target policy and mu is
+          the behaviour policy.
+        rewards: A float32 tensor of shape [T, B] containing rewards generated by
+          following the behaviour policy.
+        values: A float32 tensor of shape [T+1, B] with the value function estimates
+          wrt. the target policy. values[T] is the bootstrap_value
+        dones: A float32 tensor of shape [T, B] with termination signal.
+        vtrace_lambda: Mix between 1-step (vtrace_lambda=0) and n-step (vtrace_lambda=1).
+        discount: TD discount.
+        clip_rho_threshold: clip of importance ratios in the TD errors (rho bar).
+          None for no clipping.
+        clip_pg_rho_threshold: clip of importance ratios in the policy gradient
+          advantages. None for no clipping.
+        clip_c_threshold: clip of trace cutting ratios (c bar). None for no clipping.
+
+    Returns:
+        A float32 tensor of shape [T, B] of V-trace targets vs. Can be used as
+          target to train a baseline (V(x_t) - vs_t)^2.
+        A float32 tensor of shape [T, B] of policy gradient advantages.
+    """
+    rewards_shape = rewards.shape
+    chex.assert_shape(values, (rewards_shape[0]+1, *rewards_shape[1:]))
+    chex.assert_equal_shape([log_rhos, rewards, dones])
+
+    def _clip(x, threshold):
+        return x if threshold is None else jnp.minimum(threshold, x)
+
+    rhos = jnp.exp(log_rhos)
+    clipped_rhos = _clip(rhos, clip_rho_threshold)
+    cs = vtrace_lambda * _clip(rhos, clip_c_threshold)
+    discounts = discount * (1 - dones)
+
+    deltas = clipped_rhos * (rewards + discounts * values[1:] - values[:-1])
+
+    vs_minus_v = reverse_discounted_cumsum(deltas, discounts*cs)
+
+    vs = vs_minus_v + values[:-1]
+    # [v_{s+1}, ..., v_{s+T-1}, V(x_{s+T})]
+    vs_t_plus_1 = jnp.concatenate([vs[1:], values[-1:]], axis=0)
+
+    clipped_pg_rhos = _clip(rhos, clip_pg_rho_threshold)
+    pg_advantages = clipped_pg_rhos * \
+        (rewards + discounts * vs_t_plus_1 - values[:-1])
+
+    return jax.lax.stop_gradient(vs), jax.lax.stop_gradient(pg_advantages)
 
 
 def shuffle_sample_batch(sample_batch: SampleBatch, key: chex.PRNGKey):
@@ -140,6 +220,39 @@ def shuffle_sample_batch(sample_batch: SampleBatch, key: chex.PRNGKey):
     )
 
 
+def minibatch_indices(key: chex.PRNGKey, batch_size: int, minibatch_size: int,
+                      num_epochs: int = 1) -> jax.Array:
+    """
+        Shuffled indices of the minibatches of `num_epochs` passes over a
+        batch, one permutation per epoch. The tail of each permutation that
+        doesn't fill a minibatch is dropped.
+
+        Returns:
+            int array of shape [num_epochs * num_minibatches, minibatch_size]
+    """
+    num_minibatches = batch_size // minibatch_size
+    # one epoch reuses the key, same order as `jax.random.permutation(key, x)`
+    keys = key[None] if num_epochs == 1 else jax.random.split(key, num_epochs)
+
+    def _epoch_indices(key):
+        perm = jax.random.permutation(key, batch_size)
+        return perm[:num_minibatches*minibatch_size].reshape(num_minibatches, minibatch_size)
+
+    indices = jax.vmap(_epoch_indices)(keys)
+    return indices.reshape(num_epochs*num_minibatches, minibatch_size)
+
+
+def gather_minibatch(sample_batch: SampleBatch, indices: jax.Array) -> SampleBatch:
+    """
+        Gather the rows `indices` of a flat [N, ...] sample_batch.
+    """
+    return jtu.tree_map(
+        # indices are in range and unique within a minibatch
+        lambda x: jnp.take(x, indices, axis=0, mode='clip', unique_indices=True),
+        sample_batch
+    )
+
+
 def soft_target_update(target_params, source_params, tau: float):
     """
     Perform soft update of target network
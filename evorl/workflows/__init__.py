@@ -2,4 +2,4 @@ from .workflow import Workflow
 
 from .ec_workflow import ECWorkflow
 
-from .rl_workflow import RLWorkflow, OnPolicyRLWorkflow, OffPolicyRLWorkflow
+from .rl_workflow import RLWorkflow, OnPolicyRLWorkflow, OffPolicyRLWorkflow, OfflineRLWorkflow
@@ -7,6 +7,9 @@ import jax.numpy as jnp
 import jax.tree_util as jtu
 
 from evorl.utils.jax_utils import jit_method
+from evorl.utils.profiler import PerfTimer
+from evorl.utils.recompilation import RecompilationMonitor, track_traces
+from evorl.recorders import Recorder
 
 from evox import Algorithm, Problem, State, Monitor
 from evox.utils import parse_opt_direction, algorithm_has_init_ask
@@ -15,6 +18,24 @@ from evox import Stateful
 from evox.workflows import StdWorkflow as Workflow
 
 
+def _add_uint64(counter: jax.Array, n: jax.Array) -> jax.Array:
+    """
+        Add a non-negative int32 to the uint64 counter stored as
+        [low, high] uint32 words, without jax_enable_x64.
+    """
+    low = counter[0] + n.astype(jnp.uint32)
+    high = counter[1] + (low < counter[0]).astype(jnp.uint32)
+    return jnp.stack([low, high])
+
+
+def uint64_value(counter: jax.Array) -> int:
+    """
+        The host int of a counter from `_add_uint64`.
+    """
+    low, high = jax.device_get(counter)
+    return int(high) << 32 | int(low)
+
+
 class ECWorkflow(Workflow):
     def __init__(
         self,
@@ -24,7 +45,20 @@ class ECWorkflow(Workflow):
         opt_direction: Union[str, List[str]] = "min",
         sol_transforms: List[Callable] = [],
         fit_transforms: List[Callable] = [],
+        recorder: Optional[Recorder] = None,
+        perf_sample_interval: int = 0,
+        recompile_monitor: Optional[RecompilationMonitor] = None,
     ):
+        """
+            recorder: records the `perf/` metrics. `perf/env_steps_per_sec`
+                is reported when the problem has `evaluate_with_env_steps`,
+                eg: `MultiObjectiveBraxProblem`.
+            perf_sample_interval: record the `perf/` metrics every k steps, 0 to disable.
+                Only the whole step is timed (`perf/step_time`): ask,
+                evaluate and tell are fused in one jitted `_step`, timing
+                them apart would need a host sync between them.
+            recompile_monitor: counts the traces & compilations of `_step`.
+        """
         self.algorithm = algorithm
         self.problem = problem
         self.monitors = monitors
@@ -53,6 +87,12 @@ class ECWorkflow(Workflow):
 
         self.fit_transforms = fit_transforms
 
+        self.recorder = recorder
+        self.perf_timer = PerfTimer(perf_sample_interval)
+        self.recompile_monitor = RecompilationMonitor() \
+            if recompile_monitor is None else recompile_monitor
+        self._num_steps = 0  # host-side counter for perf_timer
+        self._count_env_steps = hasattr(self.problem, 'evaluate_with_env_steps')
 
     def candidate_generation(self, state, is_init):
         if is_init:
@@ -85,7 +125,8 @@ class ECWorkflow(Workflow):
             monitor.pre_ask(state)
 
         # candidate solution
-        cands, state = self.candidate_generation(state, is_init)
+        with jax.named_scope("ask"):
+            cands, state = self.candidate_generation(state, is_init)
 
         for monitor in self.registered_hooks["post_ask"]:
             monitor.post_ask(state, cands)
@@ -98,8 +139,15 @@ class ECWorkflow(Workflow):
         for monitor in self.registered_hooks["pre_eval"]:
             monitor.pre_eval(state, cands, transformed_cands)
 
-        fitness, state = self.problem.evaluate(state, transformed_cands)
-        fitness = fitness * self.opt_direction
+        sampled_timesteps = state.sampled_timesteps
+        with jax.named_scope("evaluate"):
+            if self._count_env_steps:
+                fitness, num_env_steps, state = self.problem.evaluate_with_env_steps(
+                    state, transformed_cands)
+                sampled_timesteps = _add_uint64(sampled_timesteps, num_env_steps)
+            else:
+                fitness, state = self.problem.evaluate(state, transformed_cands)
+            fitness = fitness * self.opt_direction
 
         for monitor in self.registered_hooks["post_eval"]:
             monitor.post_eval(state, cands, transformed_cands, fitness)
@@ -115,16 +163,21 @@ class ECWorkflow(Workflow):
                 state, cands, transformed_cands, fitness, transformed_fitness
             )
 
-        state = self.learn_one_step(state, transformed_fitness, is_init)
+        with jax.named_scope("tell"):
+            state = self.learn_one_step(state, transformed_fitness, is_init)
 
         for monitor in self.registered_hooks["post_tell"]:
             monitor.post_tell(state)
 
-        return state.update(generation=state.generation + 1)
+        return state.update(
+            generation=state.generation + 1,
+            sampled_timesteps=sampled_timesteps
+        )
 
     # wrap around _proto_step
     # to handle init_ask and init_tell
     @jit_method(static_argnums=(0,))
+    @track_traces
     def _step(self, state):
         # probe if self.algorithm has override the init_ask function
         if algorithm_has_init_ask(self.algorithm, state):
@@ -138,15 +191,26 @@ class ECWorkflow(Workflow):
             return self._proto_step(False, state)
 
     def setup(self, key):
-        return State(generation=0)
+        # [low, high] uint32 words of the uint64 env steps counter
+        return State(generation=0, sampled_timesteps=jnp.zeros((2,), dtype=jnp.uint32))
 
     def step(self, state):
         for monitor in self.registered_hooks["pre_step"]:
             monitor.pre_step(state)
 
-        state = self._step(state)
+        self.perf_timer.begin(self._num_steps)
+        self.recompile_monitor.step(self._num_steps)
+        state = self.perf_timer.time('step', self._step, state)
 
         for monitor in self.registered_hooks["post_step"]:
             monitor.post_step(state)
 
+        counters = dict(generations=self._num_steps+1)
+        if self._count_env_steps and self.perf_timer.sampling:
+            counters['env_steps'] = uint64_value(state.sampled_timesteps)
+        perf_metrics = self.perf_timer.report(state, **counters)
+        if perf_metrics and self.recorder is not None:
+            self.recorder.write(perf_metrics, self._num_steps)
+        self._num_steps += 1
+
         return state
\ No newline at end of file
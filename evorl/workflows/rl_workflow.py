@@ -1,18 +1,33 @@
 import jax
 import jax.numpy as jnp
+import jax.tree_util as jtu
+from jax.sharding import PartitionSpec
+from jax.experimental.shard_map import shard_map
 import optax
 from omegaconf import DictConfig, OmegaConf
 import chex
 import copy
+import dataclasses
+import functools
 
 from .workflow import Workflow
 from evorl.recorders import Recorder, ChainRecorder, WandbRecorder, LogRecorder
 from evorl.agents import Agent
 from evorl.envs import Env
 from evorl.evaluator import Evaluator
-from evorl.distributed import PMAP_AXIS_NAME, split_key_to_devices
-from evorl.metrics import TrainMetric, EvaluateMetric, WorkflowMetric
+from evorl.distributed import PMAP_AXIS_NAME, split_key_to_devices, tree_unpmap
+from evorl.distributed.sharding import (
+    create_mesh, tree_device_put, replicated_spec, param_sharded_spec,
+    tree_all_gather, tree_local_shard, tree_local_replica
+)
+from evorl.metrics import TrainMetric, EvaluateMetric, WorkflowMetric, MetricAggregator
 from evorl.utils.cfg_utils import get_output_dir
+from evorl.utils.profiler import TraceWindow, PerfTimer
+from evorl.utils.recompilation import RecompilationMonitor, track_traces
+from evorl.utils.memory import device_memory_metrics
+from evorl.utils.checkpoint import Checkpointer, CHECKPOINT_ITEMS, restore_checkpoint
+from evorl.trajectory_dataset import TrajectoryWriter, TrajectoryDataset, DataLoader
+from evorl.sample_batch import SampleBatch
 from typing import Any, Callable, Sequence, Optional, Tuple
 from typing_extensions import (
     Self  # pytype: disable=not-supported-yet
@@ -28,24 +43,120 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+SEED_AXIS_NAME = 'seed'
+# multi-devices backend when `parallel.backend` is missing in the config
+DEFAULT_PARALLEL_BACKEND = 'shard_map'
+
+
+def get_parallel_backend(config: DictConfig) -> str:
+    return OmegaConf.select(
+        config, 'parallel.backend', default=DEFAULT_PARALLEL_BACKEND)
 
-def setup_checkpoint_manager(config: DictConfig) -> ocp.CheckpointManager:
+
+def setup_checkpoint_manager(config: DictConfig) -> Optional[ocp.CheckpointManager]:
     output_dir = get_output_dir()
+    ckpt_path = output_dir/'checkpoints'
+
+    if (jax.process_count() > 1 and
+            get_parallel_backend(config) == 'pmap'):
+        # pmap states are process-local, only saved by process 0.
+        if jax.process_index() != 0:
+            return None
+        logger.info(f'set checkpoint path: {ckpt_path}')
+        ckpt_path.mkdir(parents=True, exist_ok=True)
+        multiprocessing_options = ocp.checkpoint_manager.MultiprocessingOptions(
+            primary_host=0, active_processes={0})
+        create = False
+    else:
+        logger.info(f'set checkpoint path: {ckpt_path}')
+        multiprocessing_options = ocp.checkpoint_manager.MultiprocessingOptions()
+        create = True
+
     ckpt_options = ocp.CheckpointManagerOptions(
         save_interval_steps=config.checkpoint.save_interval_steps,
-        max_to_keep=config.checkpoint.max_to_keep
+        # old checkpoints are pruned by Checkpointer, which keeps the ones
+        # holding deduplicated leaves
+        max_to_keep=None,
+        multiprocessing_options=multiprocessing_options,
+        create=create
     )
-    ckpt_path = output_dir/'checkpoints'
-    logger.info(f'set checkpoint path: {ckpt_path}')
     checkpoint_manager = ocp.CheckpointManager(
         ckpt_path,
+        item_names=CHECKPOINT_ITEMS,
         options=ckpt_options,
         metadata=OmegaConf.to_container(config)  # rescaled real config
     )
     return checkpoint_manager
 
 
+def setup_checkpointer(config: DictConfig) -> Optional[Checkpointer]:
+    checkpoint_manager = setup_checkpoint_manager(config)
+    if checkpoint_manager is None:
+        return None
+    return Checkpointer.from_config(config, checkpoint_manager)
+
+
+def setup_trajectory_writers(config: DictConfig) -> Tuple[Optional[TrajectoryWriter], Optional[TrajectoryWriter]]:
+    """
+        Writers of the train rollouts and the eval episodes, saved under
+        <output_dir>/dataset/{train,eval}.
+    """
+    dataset_cfg = OmegaConf.select(config, 'trajectory_dataset', default=None)
+    if dataset_cfg is None:
+        return None, None
+
+    dataset_path = get_output_dir()/'dataset'
+    if jax.process_count() > 1:
+        # each process writes the trajectories of its local devices
+        dataset_path = dataset_path/f'process_{jax.process_index()}'
+
+    train_writer = TrajectoryWriter(
+        dataset_path/'train', shard_size=dataset_cfg.shard_size,
+        episodic=False) if dataset_cfg.train else None
+    eval_writer = TrajectoryWriter(
+        dataset_path/'eval', shard_size=dataset_cfg.shard_size,
+        episodic=True) if dataset_cfg.eval else None
+
+    return train_writer, eval_writer
+
+
+def mesh_method(method: Callable) -> Callable:
+    """
+        Run `method(self, state) -> (metrics, state)` as a jitted shard_map
+        over `self.mesh`. See `RLWorkflow._mesh_call`.
+    """
+    @functools.wraps(method)
+    def wrapper(self, state: State):
+        return self._mesh_call(method, state)
+
+    return wrapper
+
+
+def seed_vmap_method(method: Callable) -> Callable:
+    """
+        vmap `method(self, state)` over the leading seed axis of the state,
+        for the multi-seed mode (see `RLWorkflow.enable_multi_seeds`).
+    """
+    @functools.wraps(method)
+    def wrapper(self, state: State):
+        return jax.vmap(
+            functools.partial(method, self), axis_name=SEED_AXIS_NAME)(state)
+
+    return wrapper
+
+
 class RLWorkflow(Workflow):
+    # Layout of State fields under the shard_map backend. Fields not listed
+    # here are replicated over the data axis.
+    # params fields: replicated, or sharded when config.parallel.shard_params=True
+    _param_state_fields: Tuple[str] = ('agent_state', 'opt_state')
+    # batch fields: split along the leading (#envs) axis
+    _batch_state_fields: Tuple[str] = ('env_state',)
+    # stacked fields: per-device copies stacked along a new leading axis
+    _stacked_state_fields: Tuple[str] = ()
+    # whether `learn()` supports the multi-seed mode
+    _support_multi_seeds: bool = False
+
     def __init__(
         self,
         config: DictConfig
@@ -57,40 +168,113 @@ class RLWorkflow(Workflow):
         super(RLWorkflow, self).__init__()
         self.config = config
         self.pmap_axis_name = None
+        self.seed_axis_name = None
         self.devices = jax.local_devices()[:1]
-        self.checkpoint_manager = setup_checkpoint_manager(config)
+        self.mesh = None
+        self._mesh_fn_cache = {}
+        # name -> the jit/pmap/shard_map wrapped method bound by `_bind_methods`
+        self._wrapped_methods = {}
+        self.checkpointer = setup_checkpointer(config)
+        self.trace_window = TraceWindow.from_config(config)
+        self.perf_timer = PerfTimer.from_config(config)
+        self.recompile_monitor = RecompilationMonitor.from_config(config)
         self.recorder = ChainRecorder([])  # dummy recorder
+        self.metric_aggregator = MetricAggregator.from_config(
+            config, self.recorder)
+        self.train_trajectory_writer, self.eval_trajectory_writer = \
+            setup_trajectory_writers(config)
 
     @property
     def enable_multi_devices(self) -> bool:
         return self.pmap_axis_name is not None
 
+    @property
+    def enable_mesh(self) -> bool:
+        """
+            Whether the workflow runs with the shard_map backend.
+        """
+        return self.mesh is not None
+
+    @property
+    def multi_seeds(self) -> bool:
+        """
+            Whether the state stacks independent runs along a leading seed
+            axis, see `enable_multi_seeds()`.
+        """
+        return self.seed_axis_name is not None
+
+    @property
+    def num_grad_steps_per_iteration(self) -> int:
+        """
+            Number of gradient updates in one `step()`, used for `perf/grad_steps_per_sec`.
+        """
+        return 1
+
+    @property
+    def grad_comm_options(self) -> dict:
+        """
+            Options of gradient all-reduce, see `loss_and_pgrad`.
+        """
+        bucket_size = OmegaConf.select(
+            self.config, 'parallel.grad_bucket_size', default=None)
+        comm_dtype = OmegaConf.select(
+            self.config, 'parallel.grad_comm_dtype', default=None)
+        if comm_dtype is not None:
+            comm_dtype = jnp.dtype(comm_dtype)
+        return dict(bucket_size=bucket_size, comm_dtype=comm_dtype)
+
     @classmethod
-    def build_from_config(cls, config: DictConfig, enable_multi_devices: bool = False, devices: Optional[Sequence[jax.Device]] = None, enable_jit: bool = True):
+    def build_from_config(cls, config: DictConfig, enable_multi_devices: bool = False, devices: Optional[Sequence[jax.Device]] = None, enable_jit: bool = True, enable_multi_seeds: bool = False):
+        """
+            Args:
+                enable_multi_devices: pmap or shard_map over `devices`.
+                enable_jit: jit `step()` and `evaluate()` on a single device.
+                enable_multi_seeds: train independent seeds in one program,
+                    `init()` then takes a [#seeds, 2] key.
+        """
         config = copy.deepcopy(config)  # avoid in-place modification
         if devices is None:
             devices = jax.local_devices()
 
-        if enable_multi_devices:
-            cls.step = jax.pmap(
-                cls.step, axis_name=PMAP_AXIS_NAME,
-                static_broadcasted_argnums=(0,)
-            )
-            cls.evaluate = jax.pmap(
-                cls.evaluate, axis_name=PMAP_AXIS_NAME,
-                static_broadcasted_argnums=(0,)
-            )
+        parallel_backend = get_parallel_backend(config)
+
+        if enable_multi_seeds:
+            if not cls._support_multi_seeds:
+                raise ValueError(f'{cls.name()} does not support multi seeds')
+            if enable_multi_devices:
+                raise ValueError(
+                    'multi seeds are not supported with multi devices')
+            if OmegaConf.select(config, 'trajectory_dataset.train', default=False) or \
+                    OmegaConf.select(config, 'trajectory_dataset.eval', default=False):
+                raise ValueError(
+                    'trajectory_dataset is not supported with multi seeds')
+        elif enable_multi_devices:
+            if parallel_backend not in ('shard_map', 'pmap'):
+                raise ValueError(
+                    f'parallel backend {parallel_backend} not supported')
             OmegaConf.set_readonly(config, False)
             cls._rescale_config(config, devices)
-        elif enable_jit:
-            cls.enable_jit()
 
         OmegaConf.set_readonly(config, True)
 
         workflow = cls._build_from_config(config)
-        if enable_multi_devices:
+        if enable_multi_seeds:
+            workflow.seed_axis_name = SEED_AXIS_NAME
+            workflow.enable_multi_seeds()
+        elif enable_multi_devices:
             workflow.pmap_axis_name = PMAP_AXIS_NAME
-            workflow.devices = devices
+            if parallel_backend == 'shard_map':
+                # global devices over all processes
+                workflow.devices = devices
+                workflow.mesh = create_mesh(devices, PMAP_AXIS_NAME)
+                workflow.enable_shard_map()
+            else:
+                # pmap only places data on local devices
+                workflow.devices = [
+                    d for d in devices if d.process_index == jax.process_index()]
+                workflow.enable_pmap()
+        elif enable_jit:
+            workflow.enable_jit()
 
         return workflow
 
@@ -121,18 +305,347 @@ class RLWorkflow(Workflow):
     def evaluate(self, state: State) -> Tuple[EvaluateMetric, State]:
         raise NotImplementedError
 
-    @classmethod
-    def enable_jit(cls) -> None:
+    def _bind_methods(self, wrap: Callable[[Callable], Callable]) -> None:
+        """
+            Bind `wrap(method)` of the class `step()` and `evaluate()` onto
+            this instance only, other workflows of the class are unchanged.
+            The wrapped methods are kept in `_wrapped_methods`, eg: to
+            `.lower(self, state)` the jitted or pmapped ones.
+        """
+        for name in ('step', 'evaluate'):
+            method = wrap(track_traces(getattr(type(self), name)))
+            self._wrapped_methods[name] = method
+            setattr(self, name, functools.partial(method, self))
+
+    def enable_jit(self) -> None:
         # donate_argnums = (1,) if donate_buffer else None
-        cls.evaluate = jax.jit(cls.evaluate, static_argnums=(0,))
-        cls.step = jax.jit(cls.step, static_argnums=(0,))
+        self._bind_methods(lambda fn: jax.jit(fn, static_argnums=(0,)))
+
+    def enable_pmap(self) -> None:
+        self._bind_methods(lambda fn: jax.pmap(
+            fn, axis_name=PMAP_AXIS_NAME, static_broadcasted_argnums=(0,)))
+
+    def enable_multi_seeds(self) -> None:
+        """
+            jit `step()` and `evaluate()` vmapped over the seed axis: S
+            seeds are compiled once and run as one program with an S times
+            larger batch.
+        """
+        self._bind_methods(lambda fn: jax.jit(
+            seed_vmap_method(fn), static_argnums=(0,)))
+
+    def init(self, key: chex.PRNGKey) -> State:
+        """
+            Args:
+                key: a PRNGKey, or [#seeds, 2] keys in the multi-seed mode.
+        """
+        if self.multi_seeds:
+            return jax.vmap(self.setup, axis_name=self.seed_axis_name)(key)
+        return self.setup(key)
+
+    def enable_shard_map(self) -> None:
+        """
+            Run `step()` and `evaluate()` as shard_map over `self.mesh`.
+        """
+        self._bind_methods(mesh_method)
+
+    def _state_partition_specs(self, state: State) -> State:
+        """
+            PartitionSpecs of each State field under the shard_map backend.
+        """
+        axis_name = self.pmap_axis_name
+        specs = {}
+        for name in self._param_state_fields:
+            if OmegaConf.select(self.config, 'parallel.shard_params', default=False):
+                specs[name] = param_sharded_spec(
+                    getattr(state, name), axis_name, len(self.devices))
+            else:
+                specs[name] = PartitionSpec()
+        for name in self._batch_state_fields + self._stacked_state_fields:
+            specs[name] = PartitionSpec(axis_name)
+
+        return replicated_spec(state).update(**specs)
+
+    def _mesh_call(self, method: Callable, state: State):
+        """
+            Each device runs `method` on its local view of the state,
+            which has the same semantics as jax.pmap:
+            - key: the replicated key is folded with the device index.
+            - batch fields: the local slice of #envs.
+            - stacked fields: the local copy.
+            - sharded params: all-gathered before `method`, re-sharded after.
+        """
+        state_specs = self._state_partition_specs(state)
+        spec_leaves, spec_treedef = jtu.tree_flatten(state_specs)
+        cache_key = (method, spec_treedef, tuple(spec_leaves))
+
+        if cache_key not in self._mesh_fn_cache:
+            axis_name = self.pmap_axis_name
+            num_devices = len(self.devices)
+            param_fields = self._param_state_fields
+            stacked_fields = self._stacked_state_fields
+
+            def _local_fn(state):
+                key, local_key = jax.random.split(state.key)
+                local_key = jax.random.fold_in(
+                    local_key, jax.lax.axis_index(axis_name))
+                local_state = {
+                    name: tree_all_gather(
+                        getattr(state, name), getattr(state_specs, name), axis_name)
+                    for name in param_fields
+                }
+                for name in stacked_fields:
+                    local_state[name] = jtu.tree_map(
+                        lambda x: x[0], getattr(state, name))
+
+                metrics, state = method(
+                    self, state.update(key=local_key, **local_state))
+
+                global_state = {
+                    name: tree_local_shard(
+                        getattr(state, name), getattr(state_specs, name),
+                        axis_name, num_devices)
+                    for name in param_fields
+                }
+                for name in stacked_fields:
+                    global_state[name] = jtu.tree_map(
+                        lambda x: x[None], getattr(state, name))
+
+                return metrics, state.update(key=key, **global_state)
+
+            self._mesh_fn_cache[cache_key] = jax.jit(shard_map(
+                _local_fn, self.mesh,
+                in_specs=(state_specs,),
+                out_specs=(PartitionSpec(), state_specs),
+                check_rep=False
+            ))
+
+        return self._mesh_fn_cache[cache_key](state)
+
+    def _mesh_env_reset(self, key: chex.PRNGKey):
+        """
+            Reset the envs on each device and return the env_state
+            sharded along the #envs axis.
+        """
+        axis_name = self.pmap_axis_name
+
+        def _reset(key):
+            key = jax.random.fold_in(key, jax.lax.axis_index(axis_name))
+            return self.env.reset(key)
+
+        key = tree_device_put(key, self.mesh, PartitionSpec())
+
+        return jax.jit(shard_map(
+            _reset, self.mesh,
+            in_specs=PartitionSpec(),
+            out_specs=PartitionSpec(axis_name),
+            check_rep=False
+        ))(key)
+
+    def _mesh_device_put(self, state: State) -> State:
+        return tree_device_put(
+            state, self.mesh, self._state_partition_specs(state))
+
+    def _unpmap(self, tree: chex.ArrayTree) -> chex.ArrayTree:
+        """
+            Get the single-device view of the replicated outputs (eg: metrics)
+            of step() and evaluate().
+        """
+        if self.enable_mesh:
+            return tree_local_replica(tree)
+        return tree_unpmap(tree, self.pmap_axis_name)
+
+    def _get_iteration(self, state: State) -> int:
+        """
+            The current iteration of `learn()`, shared by all seeds.
+        """
+        iterations = self._unpmap(state.metrics.iterations)
+        if self.multi_seeds:
+            iterations = iterations[0]
+        return int(iterations)
+
+    def _record_perf_metrics(self, iteration: int, state: State, workflow_metrics: WorkflowMetric) -> None:
+        """
+            Record the `perf/` metrics and the device memory on the
+            iterations sampled by `perf.sample_interval`.
+        """
+        sampling = self.perf_timer.sampling
+        env_steps = workflow_metrics.sampled_timesteps
+        grad_steps = (iteration+1)*self.num_grad_steps_per_iteration
+        if self.multi_seeds:
+            # the throughput over all seeds
+            grad_steps *= jnp.shape(env_steps)[0]
+            env_steps = jnp.sum(env_steps)
+        perf_metrics = self.perf_timer.report(
+            state, env_steps=env_steps, grad_steps=grad_steps)
+        if sampling and OmegaConf.select(self.config, 'memory.record', default=False):
+            perf_metrics.update(device_memory_metrics(jax.local_devices()))
+        if perf_metrics:
+            self.recorder.write(perf_metrics, iteration)
+
+    def _local_workflow_metrics(self, state: State) -> WorkflowMetric:
+        """
+            The single-device view of `state.metrics`.
+        """
+        return self._unpmap(state.metrics)
+
+    def _on_iteration_begin(self, iteration: int) -> None:
+        self.perf_timer.begin(iteration)
+        self.recompile_monitor.step(iteration)
+
+    def _on_iteration_end(self, iteration: int, state: State, train_metrics: Any, *extra_metrics: Any) -> State:
+        """
+            Bookkeeping of `learn()` after the step of an iteration, inside
+            its `trace_window.step()`: aggregate the metrics, evaluate every
+            `eval_interval` iterations, save the checkpoint and record the
+            perf metrics.
+
+            Args:
+                train_metrics: the (pmapped) train metrics of step().
+                extra_metrics: other host metrics aggregated with them.
+        """
+        workflow_metrics = self._local_workflow_metrics(state)
+
+        self.metric_aggregator.add(
+            iteration, self._unpmap(train_metrics), *extra_metrics,
+            latest=workflow_metrics)
+
+        if (iteration+1) % self.config.eval_interval == 0:
+            with jax.profiler.TraceAnnotation("evaluate"):
+                eval_metrics, state = self.perf_timer.time(
+                    'evaluate', self.evaluate, state, force=True)
+            eval_metrics = self._unpmap(eval_metrics)
+            self.recorder.write({'eval': eval_metrics.to_local_dict()}, iteration)
+            logger.debug(eval_metrics)
+
+        with jax.profiler.TraceAnnotation("checkpoint"):
+            self.perf_timer.time(
+                'checkpoint', self._save_checkpoint, iteration, state)
+
+        self._record_perf_metrics(iteration, state, workflow_metrics)
+
+        return state
+
+    def _write_trajectory(self, trajectory: SampleBatch) -> None:
+        """
+            Stream the rollout trajectory [T, #envs, ...] to the dataset
+            inside step(), if `trajectory_dataset.train` is enabled.
+        """
+        if self.train_trajectory_writer is None:
+            return
+
+        env_extras = trajectory.extras.env_extras
+        if 'last_obs' in env_extras:
+            # next_obs is the reset obs at the end of episodes
+            trajectory = trajectory.replace(next_obs=env_extras['last_obs'])
+        stream_id = jax.lax.axis_index(self.pmap_axis_name) \
+            if self.enable_multi_devices else 0
+        self.train_trajectory_writer.write_async(trajectory, stream_id)
+
+    def _attach_eval_trajectory_writer(self, evaluator: Evaluator) -> Evaluator:
+        if self.eval_trajectory_writer is None:
+            return evaluator
+        return dataclasses.replace(
+            evaluator, trajectory_writer=self.eval_trajectory_writer)
+
+    def _checkpoint_fields(self, state: State) -> Tuple[str]:
+        """
+            State fields saved by `checkpoint.subset`:
+            - params: key, metrics and the params fields (agent_state & opt_state).
+            - full: all fields, including env_state and the replay buffer.
+        """
+        subset = OmegaConf.select(
+            self.config, 'checkpoint.subset', default='full')
+        if subset == 'params':
+            return ('key', 'metrics') + self._param_state_fields
+        elif subset == 'full':
+            return tuple(state.tree_flatten()[0][0].keys())
+        else:
+            raise ValueError(f'checkpoint subset {subset} not supported')
+
+    @property
+    def _device_local_fields(self) -> Tuple[str]:
+        """
+            Fields with different values over devices under pmap.
+        """
+        return ('key',) + self._batch_state_fields + self._stacked_state_fields
+
+    def _checkpoint_state(self, state: State, fields: Sequence[str]) -> dict:
+        """
+            Savable layout of the state fields. Under pmap, replicated fields
+            are unpmapped and device-local fields are fetched as stacked
+            host arrays.
+        """
+        tree = {name: getattr(state, name) for name in fields}
+        if self.enable_mesh:
+            # global arrays, each process writes its own shards
+            return tree
+        elif self.enable_multi_devices:
+            tree = {
+                name: jax.device_get(x) if name in self._device_local_fields
+                else self._unpmap(x)
+                for name, x in tree.items()
+            }
+        if jax.process_count() > 1:
+            # orbax can't serialize host-local arrays
+            tree = jax.device_get(tree)
+        return tree
+
+    def _restore_state(self, state: State, tree: dict) -> State:
+        """
+            Inverse of `_checkpoint_state`.
+        """
+        if self.enable_multi_devices and not self.enable_mesh:
+            tree = {
+                name: jtu.tree_map(
+                    lambda x: jax.device_put_sharded(list(x), self.devices), x)
+                if name in self._device_local_fields
+                else jax.device_put_replicated(x, self.devices)
+                for name, x in tree.items()
+            }
+        return state.update(**tree)
+
+    def _save_checkpoint(self, step: int, state: State) -> None:
+        # under pmap, only process 0 has the checkpointer
+        if self.checkpointer is None or not self.checkpointer.should_save(step):
+            return
+        self.checkpointer.save(
+            step, self._checkpoint_state(state, self._checkpoint_fields(state)))
+
+    def restore(self, state: State, path: str, step: Optional[int] = None) -> State:
+        """
+            Restore the fields saved in a checkpoint into `state`, eg: a
+            state from `init()`. Fields not saved (eg: env_state with
+            `checkpoint.subset=params`) keep their values in `state`.
+
+            Args:
+                path: checkpoints dir or the output dir of a run.
+                step: checkpoint step, None for the latest.
+        """
+        fields = state.tree_flatten()[0][0].keys()
+        restored, step = restore_checkpoint(
+            path, self._checkpoint_state(state, fields), step)
+        logger.info(
+            f'restore {list(restored.keys())} from checkpoint {step} of {path}')
+        return self._restore_state(state, restored)
 
     def close(self) -> None:
-        self.checkpoint_manager.close()
+        self.metric_aggregator.flush()
+        for writer in (self.train_trajectory_writer, self.eval_trajectory_writer):
+            if writer is not None:
+                writer.close()
+        self.trace_window.stop()
+        logger.info(f"traces & compilations: {self.recompile_monitor.summary()}")
+        if self.checkpointer is not None:
+            self.checkpointer.close()
         self.recorder.close()
 
 
 class OnPolicyRLWorkflow(RLWorkflow):
+    _support_multi_seeds = True
+    # info fields of the env saved in the rollout trajectory
+    _rollout_env_extra_fields: Tuple[str] = ('last_obs', 'episode_return')
+
     def __init__(
         self,
         env: Env,
@@ -146,7 +659,25 @@ class OnPolicyRLWorkflow(RLWorkflow):
         self.env = env
         self.agent = agent
         self.optimizer = optimizer
-        self.evaluator = evaluator
+        self.evaluator = self._attach_eval_trajectory_writer(evaluator)
+
+    @property
+    def rollout_unroll(self) -> int:
+        """
+            Unroll of the rollout scan, from config `rollout_unroll`.
+        """
+        return OmegaConf.select(self.config, 'rollout_unroll', default=1)
+
+    @property
+    def gae_scan_options(self) -> dict:
+        """
+            Scan options of `compute_gae`, from config `gae_unroll`: None to
+            choose by the rollout length, or a sequential scan unrolled by k.
+        """
+        unroll = OmegaConf.select(self.config, 'gae_unroll', default=None)
+        if unroll is None:
+            return dict(associative=None)
+        return dict(associative=False, unroll=unroll)
 
     def setup(self, key: chex.PRNGKey) -> State:
         key, agent_key, env_key = jax.random.split(key, 3)
@@ -156,7 +687,9 @@ class OnPolicyRLWorkflow(RLWorkflow):
         workflow_metrics = self._setup_workflow_metrics()
         opt_state = self.optimizer.init(agent_state.params)
 
-        if self.enable_multi_devices:
+        if self.enable_mesh:
+            env_state = self._mesh_env_reset(env_key)
+        elif self.enable_multi_devices:
             workflow_metrics, agent_state, opt_state = \
                 jax.device_put_replicated(
                     (workflow_metrics, agent_state, opt_state),
@@ -172,7 +705,7 @@ class OnPolicyRLWorkflow(RLWorkflow):
         else:
             env_state = self.env.reset(env_key)
 
-        return State(
+        state = State(
             key=key,
             metrics=workflow_metrics,
             agent_state=agent_state,
@@ -180,6 +713,11 @@ class OnPolicyRLWorkflow(RLWorkflow):
             opt_state=opt_state
         )
 
+        if self.enable_mesh:
+            state = self._mesh_device_put(state)
+
+        return state
+
     def evaluate(self, state: State) -> Tuple[EvaluateMetric, State]:
         key, eval_key = jax.random.split(state.key, num=2)
 
@@ -200,6 +738,8 @@ class OnPolicyRLWorkflow(RLWorkflow):
 
 
 class OffPolicyRLWorkflow(RLWorkflow):
+    _stacked_state_fields = ('replay_buffer_state',)
+
     def __init__(
         self,
         env: Env,
@@ -215,7 +755,7 @@ class OffPolicyRLWorkflow(RLWorkflow):
         self.env = env
         self.agent = agent
         self.optimizer = optimizer
-        self.evaluator = evaluator
+        self.evaluator = self._attach_eval_trajectory_writer(evaluator)
 
         self.replay_buffer = replay_buffer
         self._init_replay_buffer = replay_buffer_init_fn
@@ -231,7 +771,13 @@ class OffPolicyRLWorkflow(RLWorkflow):
         replay_buffer_state = self._init_replay_buffer(
             self.replay_buffer, buffer_key)
 
-        if self.enable_multi_devices:
+        if self.enable_mesh:
+            replay_buffer_state = jtu.tree_map(
+                lambda x: jnp.broadcast_to(x, (len(self.devices), *x.shape)),
+                replay_buffer_state
+            )
+            env_state = self._mesh_env_reset(env_key)
+        elif self.enable_multi_devices:
             workflow_metrics, agent_state, opt_state, replay_buffer_state = \
                 jax.device_put_replicated(
                     (workflow_metrics, agent_state,
@@ -249,7 +795,7 @@ class OffPolicyRLWorkflow(RLWorkflow):
         else:
             env_state = self.env.reset(env_key)
 
-        return State(
+        state = State(
             key=key,
             metrics=workflow_metrics,
             replay_buffer_state=replay_buffer_state,
@@ -258,6 +804,11 @@ class OffPolicyRLWorkflow(RLWorkflow):
             opt_state=opt_state
         )
 
+        if self.enable_mesh:
+            state = self._mesh_device_put(state)
+
+        return state
+
     def evaluate(self, state: State) -> Tuple[EvaluateMetric, State]:
         key, eval_key = jax.random.split(state.key, num=2)
 
@@ -278,3 +829,123 @@ class OffPolicyRLWorkflow(RLWorkflow):
 
         state = state.update(key=key)
         return eval_metrics, state
+
+
+class OfflineRLWorkflow(RLWorkflow):
+    """
+        Train from a `TrajectoryDataset` on disk without a live env; the env
+        is only used by the evaluator.
+
+        Minibatches are sampled by a prefetching `DataLoader` and fed to
+        `step()` as the `batch` field of the state, which is split along the
+        batch axis over devices.
+    """
+    _batch_state_fields = ('batch',)
+
+    def __init__(
+        self,
+        agent: Agent,
+        optimizer: optax.GradientTransformation,
+        evaluator: Evaluator,
+        dataset: TrajectoryDataset,
+        config: DictConfig,
+    ):
+        super(OfflineRLWorkflow, self).__init__(config)
+
+        self.agent = agent
+        self.optimizer = optimizer
+        self.evaluator = self._attach_eval_trajectory_writer(evaluator)
+        self.dataset = dataset
+        self.data_loader = None
+
+    @property
+    def env(self) -> Env:
+        return self.evaluator.env
+
+    def _device_put_batch(self, batch: SampleBatch) -> SampleBatch:
+        if self.enable_mesh:
+            return tree_device_put(
+                batch, self.mesh, PartitionSpec(self.pmap_axis_name))
+        elif self.enable_multi_devices:
+            num_devices = len(self.devices)
+            return jtu.tree_map(
+                lambda x: jax.device_put_sharded(
+                    list(x.reshape(num_devices, -1, *x.shape[1:])), self.devices),
+                batch
+            )
+        else:
+            return jax.device_put(batch, self.devices[0])
+
+    def _setup_data_loader(self, key: chex.PRNGKey) -> DataLoader:
+        loader_cfg = self.config.data_loader
+        seed = int(jax.random.randint(key, (), 0, jnp.iinfo(jnp.int32).max))
+        return DataLoader(
+            self.dataset,
+            batch_size=self.config.batch_size,
+            device_put_fn=self._device_put_batch,
+            num_workers=loader_cfg.num_workers,
+            prefetch=loader_cfg.prefetch,
+            seed=seed
+        )
+
+    def setup(self, key: chex.PRNGKey) -> State:
+        key, agent_key, loader_key = jax.random.split(key, 3)
+
+        agent_state = self.agent.init(agent_key)
+
+        workflow_metrics = self._setup_workflow_metrics()
+        opt_state = self.optimizer.init(agent_state.params)
+
+        if self.data_loader is None:
+            self.data_loader = self._setup_data_loader(loader_key)
+        batch = self.data_loader.next()
+
+        if self.enable_multi_devices and not self.enable_mesh:
+            workflow_metrics, agent_state, opt_state = \
+                jax.device_put_replicated(
+                    (workflow_metrics, agent_state, opt_state),
+                    self.devices
+                )
+            key = split_key_to_devices(key, self.devices)
+
+        state = State(
+            key=key,
+            metrics=workflow_metrics,
+            agent_state=agent_state,
+            opt_state=opt_state,
+            batch=batch
+        )
+
+        if self.enable_mesh:
+            state = self._mesh_device_put(state)
+
+        return state
+
+    def next_batch(self, state: State) -> State:
+        """
+            Replace the batch of the state by the next prefetched batch.
+        """
+        return state.update(batch=self.data_loader.next())
+
+    def evaluate(self, state: State) -> Tuple[EvaluateMetric, State]:
+        key, eval_key = jax.random.split(state.key, num=2)
+
+        # [#episodes]
+        raw_eval_metrics = self.evaluator.evaluate(
+            state.agent_state,
+            num_episodes=self.config.eval_episodes,
+            key=eval_key
+        )
+
+        eval_metrics = EvaluateMetric(
+            discount_returns=raw_eval_metrics.discount_returns.mean(),
+            episode_lengths=raw_eval_metrics.episode_lengths.mean()
+        ).all_reduce(pmap_axis_name=self.pmap_axis_name)
+
+        state = state.update(key=key)
+        return eval_metrics, state
+
+    def close(self) -> None:
+        if self.data_loader is not None:
+            self.data_loader.close()
+        super().close()
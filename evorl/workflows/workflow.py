@@ -4,7 +4,7 @@ from evox import Stateful, State
 
 from evox.core.module import MetaStatefulModule
 
-from typing import Any, Tuple, Union
+from typing import Any, Optional, Tuple, Union
 
 from abc import ABC, abstractmethod
 
@@ -33,6 +33,12 @@ class Workflow(ABC):
         """
         raise NotImplementedError
 
+    def restore(self, state: State, path: str, step: Optional[int] = None) -> State:
+        """
+            Restore the state from a checkpoint, see `RLWorkflow.restore`.
+        """
+        raise NotImplementedError
+
     def init(self, key: jax.Array) -> State:
         """
             Initialize the state of the module.
@@ -1,9 +1,13 @@
 import pytest
+import chex
 from .utils import disable_gpu_preallocation
 
+# expose multiple cpu devices for multi-devices tests
+chex.set_n_cpu_devices(4)
+
 @pytest.fixture(autouse=True, scope="session")
 def run_before_and_after_tests():
     print("turn off jax GPU preallocation")
     
     disable_gpu_preallocation()
-    yield
\ No newline at end of file
+    yield
@@ -0,0 +1,22 @@
+"""A fake training job for test_sweep.py, writing a metrics store like `evorl.train`."""
+import sys
+from pathlib import Path
+
+from evorl.recorders import ColumnarRecorder
+
+
+def main():
+    overrides = dict(arg.split('=', 1) for arg in sys.argv[1:])
+    recorder = ColumnarRecorder(Path(overrides['hydra.run.dir'])/'metrics')
+    total_timesteps = int(overrides['total_timesteps'])
+    for i in range(2):
+        recorder.write({
+            'sampled_timesteps': (i+1) * total_timesteps // 2,
+            'perf/env_steps_per_sec': 100.0
+        }, i)
+    recorder.close()
+    sys.exit(int(overrides.get('fail', 'false').lower() == 'true'))
+
+
+if __name__ == '__main__':
+    main()
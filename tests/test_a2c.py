@@ -12,7 +12,6 @@ def test_a2c():
     with initialize(config_path='../configs'):
         cfg = compose(config_name="config", overrides=["agent=a2c"])
     
-    A2CWorkflow.enable_jit()
     learner = A2CWorkflow.build_from_config(cfg)
     state = learner.init(jax.random.PRNGKey(42))
     train_metric, state = learner.step(state)
@@ -24,7 +23,6 @@ def test_a2c_learn():
     
     cfg.total_timesteps=1000
     cfg.eval_interval=1
-    A2CWorkflow.enable_jit()
     learner = A2CWorkflow.build_from_config(cfg)
     state = learner.init(jax.random.PRNGKey(42))
     state = learner.learn(state)
@@ -0,0 +1,44 @@
+import jax
+from hydra import compose, initialize
+from omegaconf import OmegaConf
+
+from evorl.autotune import Autotuner, candidate_grid
+
+
+def _config(overrides):
+    with initialize(config_path='../configs', version_base=None):
+        return compose(config_name="config", overrides=[
+            "agent=a2c", "env=brax/inverted_pendulum",
+            "num_eval_envs=2", "eval_episodes=2",
+            "agent_network.actor_hidden_layer_sizes=[16,16]",
+            "agent_network.critic_hidden_layer_sizes=[16,16]",
+            *overrides
+        ])
+
+
+def test_candidate_grid():
+    config = _config([])
+    tune_config = OmegaConf.create(dict(
+        num_envs=[4, 8, 48], rollout_unroll=[1, 4], batch_size=64))
+    candidates = candidate_grid(config, tune_config)
+
+    # num_envs=48 does not divide the batch, minibatch_size is not in A2C
+    assert len(candidates) == 4
+    for c in candidates:
+        assert c['num_envs'] * c['rollout_length'] == 64
+        assert 'minibatch_size' not in c
+
+
+def test_autotuner():
+    config = _config([
+        "autotune.num_envs=[4,8]", "autotune.batch_size=32",
+        "autotune.rollout_unroll=[1]", "autotune.search=halving",
+        "autotune.repeats=2"])
+    tuner = Autotuner(config, config.autotune, jax.random.PRNGKey(0))
+    best = tuner.run()
+    report = tuner.report(best)
+
+    assert best is not None and best.env_steps_per_sec > 0
+    assert sorted(t['status'] for t in report['trials']) == ['done', 'eliminated']
+    assert report['best']['memory'] > 0
+    assert f"num_envs={best.candidate['num_envs']}" in report['overrides']
@@ -0,0 +1,136 @@
+import jax
+import jax.experimental
+import jax.numpy as jnp
+import numpy as np
+import orbax.checkpoint as ocp
+import pytest
+from omegaconf import OmegaConf
+
+from evorl.utils import checkpoint
+from evorl.utils.checkpoint import (
+    Checkpointer, CHECKPOINT_ITEMS, fingerprint_leaves, restore_checkpoint
+)
+
+
+def _checkpointer(path, **kwargs):
+    checkpoint_manager = ocp.CheckpointManager(
+        path, item_names=CHECKPOINT_ITEMS,
+        options=ocp.CheckpointManagerOptions(enable_async_checkpointing=False))
+    return Checkpointer(checkpoint_manager, **kwargs)
+
+
+def _state(i):
+    return dict(
+        key=jax.random.PRNGKey(i),
+        agent_state=dict(
+            params=dict(w=jnp.full((3, 4), i, dtype=jnp.float32)),
+            frozen=dict(w=jnp.arange(8, dtype=jnp.float32))
+        ),
+        metrics=dict(iterations=jnp.int32(i), done=jnp.array([True, False]))
+    )
+
+
+def test_checkpoint_dedup(tmp_path):
+    checkpointer = _checkpointer(tmp_path, max_to_keep=2, dedup=True)
+    for step in range(4):
+        checkpointer.save(step, _state(step))
+    checkpointer.close()
+
+    # step 0 holds the frozen leaves of step 3
+    assert checkpointer.checkpoint_manager.all_steps() == [0, 2, 3]
+
+    restored, step = restore_checkpoint(tmp_path, _state(-1))
+    assert step == 3
+    jax.tree_util.tree_map(
+        np.testing.assert_array_equal, restored, _state(3))
+
+    # the compared copies are kept on the host
+    for _, _, host_value in checkpointer._stored.values():
+        assert isinstance(host_value, np.ndarray)
+
+    # only restore the fields of the target
+    target = dict(agent_state=_state(-1)['agent_state'])
+    restored, _ = restore_checkpoint(tmp_path, target, step=2)
+    assert restored.keys() == target.keys()
+    np.testing.assert_array_equal(restored['agent_state']['params']['w'], 2)
+
+
+def test_checkpoint_prune_after_resume(tmp_path):
+    checkpointer = _checkpointer(tmp_path, max_to_keep=2, dedup=True)
+    for step in range(3):
+        checkpointer.save(step, _state(step))
+    checkpointer.close()
+    assert checkpointer.checkpoint_manager.all_steps() == [0, 1, 2]
+
+    # a resumed run prunes the steps of the previous run
+    checkpointer = _checkpointer(tmp_path, max_to_keep=2, dedup=True)
+    for step in range(3, 5):
+        checkpointer.save(step, _state(step))
+    checkpointer.close()
+    assert checkpointer.checkpoint_manager.all_steps() == [3, 4]
+
+    restored, step = restore_checkpoint(tmp_path, _state(-1))
+    assert step == 4
+    jax.tree_util.tree_map(
+        np.testing.assert_array_equal, restored, _state(4))
+
+
+def test_checkpoint_dedup_fingerprint_collision(tmp_path, monkeypatch):
+    # every leaf collides with its previous value
+    monkeypatch.setattr(
+        checkpoint, 'fingerprint_leaves',
+        lambda flat: {n: ((), 'float32', (0, 0)) for n in flat})
+    checkpointer = _checkpointer(tmp_path, dedup=True)
+    for step in range(2):
+        checkpointer.save(step, _state(step))
+    checkpointer.close()
+
+    # the changed leaves are written again
+    restored, step = restore_checkpoint(tmp_path, _state(-1))
+    assert step == 1
+    jax.tree_util.tree_map(
+        np.testing.assert_array_equal, restored, _state(1))
+
+
+def test_checkpoint_dedup_from_config(tmp_path):
+    def _dedup(**ckpt_config):
+        config = OmegaConf.create(dict(checkpoint=dict(max_to_keep=None, **ckpt_config)))
+        checkpoint_manager = ocp.CheckpointManager(
+            tmp_path, item_names=CHECKPOINT_ITEMS)
+        return Checkpointer.from_config(config, checkpoint_manager).dedup
+
+    assert _dedup(subset='params', dedup=None)
+    assert not _dedup(subset='full', dedup=None)
+    assert _dedup(subset='full', dedup=True)
+    assert not _dedup(subset='params', dedup=False)
+
+
+def test_checkpoint_compression(tmp_path):
+    checkpointer = _checkpointer(tmp_path, compression='bfloat16')
+    state = _state(1)
+    state['agent_state']['params']['w'] = jnp.full((3, 4), 1/3)
+    checkpointer.save(0, state)
+    checkpointer.close()
+
+    restored, _ = restore_checkpoint(tmp_path, _state(-1))
+    w = restored['agent_state']['params']['w']
+    assert w.dtype == jnp.float32
+    np.testing.assert_allclose(w, 1/3, rtol=1e-2)
+    assert restored['metrics']['iterations'] == 1
+
+    with pytest.raises(ValueError):
+        _checkpointer(tmp_path/'int4', compression='int4')
+
+
+def test_fingerprint_64bit():
+    # the high 32 bits of 64-bit leaves are hashed too
+    with jax.experimental.enable_x64():
+        flat = {
+            'a': jnp.array([64.0], dtype=jnp.float64),
+            'b': jnp.array([128.0], dtype=jnp.float64),
+            'c': jnp.array([1 << 40], dtype=jnp.int64),
+            'd': jnp.array([1 << 41], dtype=jnp.int64),
+        }
+        fingerprints = fingerprint_leaves(flat)
+    assert fingerprints['a'] != fingerprints['b']
+    assert fingerprints['c'] != fingerprints['d']
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import jax.numpy as jnp
+
+from evorl.recorders import ColumnarRecorder, ColumnarReader
+
+
+def test_columnar_recorder(tmp_path):
+    for seed in range(3):
+        recorder = ColumnarRecorder(
+            tmp_path/f'seed={seed}'/'metrics', chunk_size=4, meta=dict(seed=seed))
+        for i in range(10):
+            recorder.write(dict(loss=jnp.float32(i+seed), name='a2c'), i)
+            if i % 2 == 0:
+                recorder.write(dict(num_updates=i), i)
+            if (i+1) % 3 == 0:
+                recorder.write(
+                    {'eval': dict(discount_returns=float(i*seed))}, i)
+        recorder.close()
+
+    reader = ColumnarReader(tmp_path)
+    assert reader.runs == [f'seed={seed}/metrics' for seed in range(3)]
+    assert reader.columns() == ['eval/discount_returns', 'loss', 'num_updates']
+    assert reader.meta('seed=1/metrics') == dict(seed=1)
+
+    for run, (steps, values) in reader.read('eval/discount_returns').items():
+        seed = reader.meta(run)['seed']
+        np.testing.assert_array_equal(steps, [2, 5, 8])
+        np.testing.assert_allclose(values, [2*seed, 5*seed, 8*seed])
+
+    steps, values = reader.read('loss', runs=['seed=2/metrics'])['seed=2/metrics']
+    np.testing.assert_array_equal(steps, np.arange(10))
+    np.testing.assert_allclose(values, np.arange(10)+2)
+
+    # chunks of 4, 4, 2 rows are indexed in chunks.jsonl, not in the schema
+    run_dir = tmp_path/'seed=2'/'metrics'
+    assert len((run_dir/'chunks.jsonl').read_text().splitlines()) == 3
+    assert 'chunks' not in json.loads((run_dir/'schema.json').read_text())
+
+    # native dtypes, lazy views over the memmapped chunks
+    loss = reader.column('seed=2/metrics', 'loss')
+    assert loss.dtype == np.float32 and loss.shape == (10,) and loss.num_chunks == 3
+    assert isinstance(loss[4:8], np.memmap)
+    assert loss[-1] == 11
+    np.testing.assert_array_equal(loss[[1, 5, 9]], [3, 7, 11])
+    np.testing.assert_array_equal(np.asarray(loss), np.arange(10)+2)
+
+    # int column with missing rows
+    steps, values = reader.read('num_updates', runs=['seed=2/metrics'])['seed=2/metrics']
+    assert values.dtype == np.int64
+    np.testing.assert_array_equal(steps, [0, 2, 4, 6, 8])
+    np.testing.assert_array_equal(values, [0, 2, 4, 6, 8])
+
+    # resume and append
+    recorder = ColumnarRecorder(tmp_path/'seed=0'/'metrics', chunk_size=4)
+    recorder.write(dict(loss=100.0), 10)
+    recorder.close()
+    reader.refresh()
+    steps, values = reader.read('loss', runs=['seed=0/metrics'])['seed=0/metrics']
+    np.testing.assert_array_equal(steps, np.arange(11))
+    assert values[-1] == 100.0
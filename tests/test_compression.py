@@ -0,0 +1,67 @@
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import chex
+
+from evorl.distributed import PMAP_AXIS_NAME
+from evorl.distributed.compression import tree_bucketed_psum, tree_bucketed_pmean
+from evorl.utils import running_statistics
+
+
+num_devices = 4
+
+
+def _make_tree(key):
+    k1, k2, k3 = jax.random.split(key, 3)
+    return dict(
+        kernel=jax.random.normal(k1, (num_devices, 7, 5)),
+        bias=jax.random.normal(k2, (num_devices, 5)),
+        log_std=jax.random.normal(k3, (num_devices, 3)),
+        count=jnp.ones((num_devices,), dtype=jnp.int32)
+    )
+
+
+def test_bucketed_psum():
+    tree = _make_tree(jax.random.PRNGKey(42))
+    expected = jtu.tree_map(lambda x: x.sum(0), tree)
+
+    out = jax.pmap(
+        lambda x: tree_bucketed_psum(x, PMAP_AXIS_NAME, bucket_size=8),
+        axis_name=PMAP_AXIS_NAME)(tree)
+    chex.assert_trees_all_close(
+        jtu.tree_map(lambda x: x[0], out), expected, rtol=1e-6)
+
+    # bf16 communication
+    out = jax.pmap(
+        lambda x: tree_bucketed_pmean(
+            x, PMAP_AXIS_NAME, bucket_size=8, comm_dtype=jnp.bfloat16),
+        axis_name=PMAP_AXIS_NAME)(tree)
+    out = jtu.tree_map(lambda x: x[0], out)
+    chex.assert_trees_all_equal_dtypes(
+        out['kernel'], out['bias'], tree['kernel'])
+    chex.assert_trees_all_close(
+        out, jtu.tree_map(lambda x: x/num_devices, expected), atol=2e-2, rtol=2e-2)
+
+
+def test_running_statistics_bucketed():
+    obs = dict(
+        a=jax.random.normal(jax.random.PRNGKey(1), (num_devices, 16, 3)),
+        b=jax.random.normal(jax.random.PRNGKey(2), (num_devices, 16, 2))
+    )
+    state = running_statistics.init_state(
+        jtu.tree_map(lambda x: x[0, 0], obs))
+
+    def _update(obs, bucket_size):
+        return running_statistics.update(
+            state, obs, pmap_axis_name=PMAP_AXIS_NAME, bucket_size=bucket_size)
+
+    out1 = jax.pmap(lambda x: _update(x, None),
+                    axis_name=PMAP_AXIS_NAME)(obs)
+    out2 = jax.pmap(lambda x: _update(x, 1024),
+                    axis_name=PMAP_AXIS_NAME)(obs)
+    chex.assert_trees_all_close(out1, out2, rtol=1e-6)
+
+    expected = running_statistics.update(
+        state, jtu.tree_map(lambda x: x.reshape(-1, x.shape[-1]), obs))
+    chex.assert_trees_all_close(
+        jtu.tree_map(lambda x: x[0], out2), expected, rtol=1e-5, atol=1e-6)
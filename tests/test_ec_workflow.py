@@ -1,9 +1,15 @@
 import jax
 import jax.numpy as jnp
 import chex
+from hydra import compose, initialize
 from evorl.workflows import ECWorkflow
+from evorl.workflows.ec_workflow import _add_uint64, uint64_value
+from evorl.ec.ec_train import build_workflow
+from evorl.cost_analysis import analyze_ec_workflow
 
-from evox import algorithms, problems, monitors
+from evox import Problem, State, algorithms, problems, monitors
+
+from .utils import ListRecorder
 
 
 def test_ec_workflow():
@@ -24,4 +30,103 @@ def test_ec_workflow():
     state = workflow.init(key)
 
     for i in range(100):
-        state = workflow.step(state)
\ No newline at end of file
+        state = workflow.step(state)
+
+def test_ec_workflow_perf_metrics():
+    pso = algorithms.PSO(
+        lb=jnp.full(shape=(2,), fill_value=-32),
+        ub=jnp.full(shape=(2,), fill_value=32),
+        pop_size=100,
+    )
+    recorder = ListRecorder()
+    workflow = ECWorkflow(
+        algorithm=pso,
+        problem=problems.numerical.Ackley(),
+        recorder=recorder,
+        perf_sample_interval=5
+    )
+
+    state = workflow.init(jax.random.PRNGKey(42))
+    for i in range(15):
+        state = workflow.step(state)
+
+    assert [step for step, _ in recorder.records] == [4, 9, 14]
+    assert 'perf/step_time' in recorder.records[0][1]
+    assert 'perf/generations_per_sec' not in recorder.records[0][1]
+    assert recorder.records[-1][1]['perf/generations_per_sec'] > 0
+    # no env steps for a numerical problem
+    assert 'perf/env_steps_per_sec' not in recorder.records[-1][1]
+
+
+
+class _EnvStepsSphere(Problem):
+    def setup(self, key):
+        return State()
+
+    def evaluate(self, state, pop):
+        return jnp.sum(pop**2, axis=1), state
+
+    def evaluate_with_env_steps(self, state, pop):
+        return jnp.sum(pop**2, axis=1), jnp.int32(pop.shape[0] * 8), state
+
+
+def test_ec_workflow_env_steps():
+    pso = algorithms.PSO(
+        lb=jnp.full(shape=(2,), fill_value=-32),
+        ub=jnp.full(shape=(2,), fill_value=32),
+        pop_size=100,
+    )
+    recorder = ListRecorder()
+    workflow = ECWorkflow(
+        algorithm=pso,
+        problem=_EnvStepsSphere(),
+        recorder=recorder,
+        perf_sample_interval=5
+    )
+
+    state = workflow.init(jax.random.PRNGKey(42))
+    for i in range(10):
+        state = workflow.step(state)
+
+    assert uint64_value(state.sampled_timesteps) == 10 * 100 * 8
+    assert recorder.records[-1][1]['perf/env_steps_per_sec'] > 0
+
+    # the counter doesn't overflow at 2**31
+    counter = jnp.array([2**32 - 10, 0], dtype=jnp.uint32)
+    counter = _add_uint64(counter, jnp.int32(2**31 - 1))
+    assert uint64_value(counter) == 2**32 - 10 + 2**31 - 1
+
+
+def test_ec_workflow_cost_analysis():
+    pso = algorithms.PSO(
+        lb=jnp.full(shape=(2,), fill_value=-32),
+        ub=jnp.full(shape=(2,), fill_value=32),
+        pop_size=100,
+    )
+    workflow = ECWorkflow(
+        algorithm=pso,
+        problem=problems.numerical.Ackley(),
+    )
+    state = workflow.init(jax.random.PRNGKey(42))
+
+    reports = analyze_ec_workflow(workflow, state, repeats=2)
+    assert reports['problem_evaluate']['flops'] > 0
+    assert reports['step']['flops'] >= reports['problem_evaluate']['flops']
+    assert reports['step']['time'] > 0
+
+
+def test_ec_config_cost_analysis():
+    with initialize(config_path='../configs', version_base=None):
+        cfg = compose(
+            config_name="config",
+            overrides=["agent=nsga2", "env=brax/inverted_pendulum",
+                       "pop_size=4", "num_envs=2", "num_episodes=2",
+                       "max_episode_steps=8", "metric_names=[reward]",
+                       "agent_network.actor_hidden_layer_sizes=[16]"]
+        )
+    workflow = build_workflow(cfg)
+    state = workflow.init(jax.random.PRNGKey(42))
+
+    reports = analyze_ec_workflow(workflow, state, repeats=1)
+    assert reports['problem_evaluate']['flops'] > 0
+    assert reports['problem_evaluate']['min_flops_per_sec'] > 0
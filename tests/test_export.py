@@ -0,0 +1,64 @@
+import jax
+import numpy as np
+import pytest
+
+pytest.importorskip("flatbuffers")
+
+from evorl.agents.a2c import A2CAgent
+from evorl.envs import create_env
+from evorl.export import ExportedPolicy, export_policy
+from evorl.networks import quantize_policy_network, quantize_policy_params
+from evorl.sample_batch import SampleBatch
+from evorl.utils import running_statistics
+
+
+@pytest.mark.parametrize(
+    "env_name,env_type,continuous_action",
+    [("inverted_pendulum", "brax", True), ("CartPole-v1", "gymnax", False)])
+def test_export_policy(tmp_path, env_name, env_type, continuous_action):
+    env = create_env(env_name, env_type, parallel=1, episode_length=100)
+    agent = A2CAgent(
+        action_space=env.action_space,
+        obs_space=env.obs_space,
+        normalize_obs=True,
+        continuous_action=continuous_action
+    )
+    agent_state = agent.init(jax.random.PRNGKey(42))
+    obs = jax.random.normal(
+        jax.random.PRNGKey(1), (9, *env.obs_space.shape))
+    agent_state = agent_state.replace(
+        obs_preprocessor_state=running_statistics.update(
+            agent_state.obs_preprocessor_state, obs))
+
+    export_policy(agent, agent_state, tmp_path, batch_sizes=[1, 4])
+    policy = ExportedPolicy.load(tmp_path)
+    assert policy.batch_sizes == [1, 4]
+
+    expected, _ = agent.evaluate_actions(
+        agent_state, SampleBatch(obs=obs), jax.random.PRNGKey(0))
+
+    # exact, padded and chunked batches, and a single obs
+    np.testing.assert_allclose(policy(obs[:4]), expected[:4], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(policy(obs[:3]), expected[:3], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(policy(obs), expected, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(policy(obs[0]), expected[0], rtol=1e-5, atol=1e-6)
+
+
+def test_export_quantized_policy(tmp_path):
+    env = create_env('inverted_pendulum', 'brax', parallel=1)
+    agent = A2CAgent(
+        action_space=env.action_space,
+        obs_space=env.obs_space,
+        continuous_action=True
+    )
+    agent_state = agent.init(jax.random.PRNGKey(42))
+    agent = quantize_policy_network(agent, 'bfloat16')
+    agent_state = quantize_policy_params(agent_state, 'bfloat16')
+
+    export_policy(agent, agent_state, tmp_path, batch_sizes=[4])
+    policy = ExportedPolicy.load(tmp_path)
+
+    obs = jax.random.normal(jax.random.PRNGKey(1), (4, *env.obs_space.shape))
+    expected, _ = jax.jit(agent.evaluate_actions)(
+        agent_state, SampleBatch(obs=obs), jax.random.PRNGKey(0))
+    np.testing.assert_allclose(policy(obs), expected, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,144 @@
+from functools import partial
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from evorl.agents.a2c import A2CAgent
+from evorl.agents.ec import DeterministicECAgent
+from evorl.ec import MultiObjectiveBraxProblem
+from evorl.envs import create_env, create_wrapped_brax_env
+from evorl.evaluator import Evaluator
+from evorl.networks import (
+    fold_policy_normalizer, fold_policy_normalizer_params, fold_safe_features,
+    is_fold_safe, quantize_policy_network, quantize_policy_params,
+    with_folded_policy
+)
+from evorl.sample_batch import SampleBatch
+from evorl.utils import running_statistics
+
+
+def _update_normalizer(agent_state, obs_shape):
+    obs = 3.0 + 2.0 * jax.random.normal(jax.random.PRNGKey(7), (64, *obs_shape))
+    return agent_state.replace(
+        obs_preprocessor_state=running_statistics.update(
+            agent_state.obs_preprocessor_state, obs))
+
+
+def test_fold_policy_normalizer():
+    env = create_env('inverted_pendulum', 'brax', parallel=2, episode_length=16, autoreset=False)
+    agent = A2CAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        normalize_obs=True, continuous_action=True)
+    agent_state = _update_normalizer(
+        agent.init(jax.random.PRNGKey(42)), env.obs_space.shape)
+
+    fagent = fold_policy_normalizer(agent)
+    fagent_state = fold_policy_normalizer_params(agent, agent_state)
+
+    sample_batch = SampleBatch(obs=3.0 + 2.0 * jax.random.normal(
+        jax.random.PRNGKey(1), (32, *env.obs_space.shape)))
+    key = jax.random.PRNGKey(0)
+    for method in ('evaluate_actions', 'compute_actions'):
+        actions, _ = getattr(agent, method)(agent_state, sample_batch, key)
+        factions, _ = getattr(fagent, method)(fagent_state, sample_batch, key)
+        np.testing.assert_allclose(factions, actions, rtol=1e-5, atol=1e-5)
+
+    # quantized policies are not folded
+    qagent = quantize_policy_network(agent, 'int8')
+    assert fold_policy_normalizer(qagent) is qagent
+    qagent_state = quantize_policy_params(agent_state, 'int8')
+    assert fold_policy_normalizer_params(qagent, qagent_state) is qagent_state
+
+    # the evaluator with and without folding
+    results = {}
+    for fold_normalizer in (True, False):
+        evaluator = Evaluator(
+            env=env, agent=agent, max_episode_steps=16, fold_normalizer=fold_normalizer)
+        results[fold_normalizer] = jax.jit(
+            lambda s: evaluator.evaluate(s, 2, key).discount_returns)(agent_state)
+    np.testing.assert_allclose(results[True], results[False], rtol=1e-4, atol=1e-4)
+
+
+def test_fold_constant_feature():
+    env = create_env('inverted_pendulum', 'brax', parallel=2, episode_length=16, autoreset=False)
+    agent = A2CAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        normalize_obs=True, continuous_action=True)
+    agent_state = agent.init(jax.random.PRNGKey(42))
+
+    # feature 0 is constant: its std is clipped to 1e-6
+    obs_shape = env.obs_space.shape
+    obs = 3.0 + 2.0 * jax.random.normal(jax.random.PRNGKey(7), (64, *obs_shape))
+    obs = obs.at[:, 0].set(5.0)
+    mean_std = running_statistics.update(agent_state.obs_preprocessor_state, obs)
+    agent_state = agent_state.replace(obs_preprocessor_state=mean_std)
+    np.testing.assert_array_equal(
+        fold_safe_features(mean_std.mean, mean_std.std),
+        jnp.arange(obs_shape[0]) != 0)
+    assert not is_fold_safe(mean_std.mean, mean_std.std)
+
+    # the original agent & normalizer are used
+    sample_batch = SampleBatch(obs=obs[:8])
+    key = jax.random.PRNGKey(0)
+    actions, _ = agent.evaluate_actions(agent_state, sample_batch, key)
+
+    def _actions(agent, agent_state):
+        return agent.evaluate_actions(agent_state, sample_batch, key)[0]
+
+    factions = jax.jit(partial(with_folded_policy, _actions, agent))(agent_state)
+    np.testing.assert_array_equal(factions, actions)
+
+
+def _objectives(agent, env, pop_agent_state, fold_normalizer):
+    problem = MultiObjectiveBraxProblem(
+        agent=agent, env=env, num_episodes=2, max_episode_steps=8,
+        metric_names=('reward',), fold_normalizer=fold_normalizer)
+    state = problem.init(jax.random.PRNGKey(0))
+    objectives, _ = jax.jit(problem.evaluate)(state, pop_agent_state)
+    return objectives
+
+
+def test_folded_ec_problem():
+    env = create_wrapped_brax_env(
+        'inverted_pendulum', episode_length=8, parallel=2, autoreset=False)
+    agent = DeterministicECAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        actor_hidden_layer_sizes=(16, 16), normalize_obs=True)
+    agent_state = _update_normalizer(
+        agent.init(jax.random.PRNGKey(42)), env.obs_space.shape)
+    pop_agent_state = jax.tree_util.tree_map(
+        lambda x: jnp.stack([x, 2 * x]), agent_state)
+
+    np.testing.assert_allclose(
+        _objectives(agent, env, pop_agent_state, True),
+        _objectives(agent, env, pop_agent_state, False),
+        rtol=1e-4, atol=1e-4)
+
+    # one individual with a near-constant feature: the population keeps
+    # the normalizer
+    obs = 3.0 + 2.0 * jax.random.normal(jax.random.PRNGKey(7), (64, *env.obs_space.shape))
+    mean_std = running_statistics.update(
+        agent.init(jax.random.PRNGKey(42)).obs_preprocessor_state,
+        obs.at[:, 0].set(5.0))
+    unsafe_pop_agent_state = pop_agent_state.replace(
+        obs_preprocessor_state=jax.tree_util.tree_map(
+            lambda x, y: jnp.stack([x[0], y]),
+            pop_agent_state.obs_preprocessor_state, mean_std))
+    np.testing.assert_array_equal(
+        _objectives(agent, env, unsafe_pop_agent_state, True),
+        _objectives(agent, env, unsafe_pop_agent_state, False))
+
+    # the folded population doesn't normalize the obs in the policy
+    fagent = fold_policy_normalizer(agent)
+    fpop_agent_state = jax.vmap(partial(
+        fold_policy_normalizer_params, agent))(pop_agent_state)
+    sample_batch = SampleBatch(obs=jnp.ones((2, 3, *env.obs_space.shape)))
+    keys = jax.random.split(jax.random.PRNGKey(0), 2)
+    jaxpr = jax.make_jaxpr(jax.vmap(fagent.evaluate_actions, axis_name='pop'))(
+        fpop_agent_state, sample_batch, keys)
+    primitives = set(eqn.primitive.name for eqn in jaxpr.jaxpr.eqns)
+    assert primitives.isdisjoint({'sub', 'div', 'select_n', 'cond'})
+
+    # folded by default
+    assert MultiObjectiveBraxProblem(agent=agent, env=env).fold_normalizer
@@ -0,0 +1,75 @@
+import jax
+import jax.numpy as jnp
+import chex
+import pytest
+from hydra import compose, initialize
+
+from evorl.agents.impala import IMPALAWorkflow, split_actor_learner_devices
+from evorl.utils.toolkits import compute_gae, compute_vtrace
+
+
+def test_vtrace_on_policy():
+    # V-trace reduces to lambda-returns when the data is on-policy
+    T, B = 11, 3
+    k1, k2, k3 = jax.random.split(jax.random.PRNGKey(42), 3)
+    rewards = jax.random.normal(k1, (T, B))
+    values = jax.random.normal(k2, (T+1, B))
+    dones = (jax.random.uniform(k3, (T, B)) < 0.2).astype(jnp.float32)
+
+    vs, pg_advantages = compute_vtrace(
+        log_rhos=jnp.zeros((T, B)), rewards=rewards, values=values, dones=dones,
+        vtrace_lambda=0.95, discount=0.99
+    )
+    v_targets, _ = compute_gae(
+        rewards=rewards, values=values, dones=dones,
+        gae_lambda=0.95, discount=0.99
+    )
+    chex.assert_trees_all_close(vs, v_targets, rtol=1e-5, atol=1e-5)
+
+    vs_t_plus_1 = jnp.concatenate([vs[1:], values[-1:]], axis=0)
+    chex.assert_trees_all_close(
+        pg_advantages,
+        rewards + 0.99*(1-dones)*vs_t_plus_1 - values[:-1],
+        rtol=1e-5, atol=1e-5
+    )
+
+
+def test_impala_workflow():
+    with initialize(config_path='../configs', version_base=None):
+        cfg = compose(
+            config_name="config",
+            overrides=["agent=impala", "env=brax/inverted_pendulum"]
+        )
+
+    cfg.num_envs = 4
+    cfg.rollout_length = 8
+    cfg.num_eval_envs = 4
+    cfg.eval_episodes = 4
+    cfg.total_timesteps = 4*8*6
+    cfg.eval_interval = 3
+
+    devices = jax.devices()[:3]
+    actor_devices, learner_devices = split_actor_learner_devices(devices, 1)
+    assert actor_devices == devices[:1] and learner_devices == devices[1:]
+
+    cfg.num_envs = 3
+    with pytest.raises(ValueError, match="num_envs"):
+        IMPALAWorkflow.build_from_config(cfg, devices=devices)
+    assert cfg.num_envs == 3
+
+    cfg.num_envs = 4
+    workflow = IMPALAWorkflow.build_from_config(cfg, devices=devices)
+    assert workflow.config.num_envs == 4
+
+    state = workflow.init(jax.random.PRNGKey(42))
+    train_metrics, state = workflow.step(state)
+    assert state.metrics.sampled_timesteps == 4*8
+
+    eval_metrics, state = workflow.evaluate(state)
+    chex.assert_shape(eval_metrics.discount_returns, (2,))
+
+    state = workflow.learn(state)
+    assert state.metrics.iterations == 6
+    assert len(state.env_state) == cfg.num_actors
+
+    workflow.close()
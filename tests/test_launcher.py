@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+
+from evorl.distributed.launcher import launch
+
+REPO_ROOT = Path(__file__).parent.parent
+
+
+def test_launch_two_processes(tmp_path, monkeypatch):
+    # each process joins the jax.distributed cluster with one cpu device
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('XLA_FLAGS', '--xla_force_host_platform_device_count=1')
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(
+        [str(REPO_ROOT), os.environ.get('PYTHONPATH', '')]))
+
+    return_code = launch(2, [
+        "agent=a2c", "env=brax/inverted_pendulum",
+        "num_envs=4", "rollout_length=8", "total_timesteps=128",
+        "num_eval_envs=2", "eval_episodes=2", "eval_interval=2",
+        "wandb.enable=false", "metrics_store.enable=true",
+        "agent_network.actor_hidden_layer_sizes=[16]",
+        "agent_network.critic_hidden_layer_sizes=[16]",
+    ])
+    assert return_code == 0
+
+    run_dirs = list((tmp_path/'outputs'/'train').iterdir())
+    assert len(run_dirs) == 1
+    run_dir = run_dirs[0]
+    assert (run_dir/'train_0.log').exists() and (run_dir/'train_1.log').exists()
+
+    # the metrics recorded by process 0
+    log_text = (run_dir/'A2C-inverted_pendulum-brax.log').read_text()
+    assert 'sampled_timesteps' in log_text
+    assert (run_dir/'metrics').is_dir()
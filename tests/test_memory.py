@@ -0,0 +1,41 @@
+import jax
+
+from evorl.rollout import rollout
+from evorl.agents.random_agent import RandomAgent
+from evorl.envs import create_env
+from evorl.utils.memory import (
+    tree_nbytes, estimate_env_state_nbytes, estimate_sample_batch_nbytes,
+    device_memory_metrics
+)
+
+
+def test_memory_estimate():
+    env = create_env(
+        'inverted_pendulum',
+        'brax',
+        parallel=5,
+        autoreset=True
+    )
+    agent = RandomAgent(
+        action_space=env.action_space,
+        obs_space=env.obs_space
+    )
+
+    key = jax.random.PRNGKey(42)
+    env_state = env.reset(key)
+    env_extra_fields = ('last_obs', 'episode_return')
+    env_state, trajectory = rollout(
+        env, agent, env_state, agent.init(key), key,
+        rollout_length=3, env_extra_fields=env_extra_fields
+    )
+    # the carry after steps, with the info fields set by autoreset
+    assert estimate_env_state_nbytes(env) == tree_nbytes(env_state)
+
+    # the extras are included: last_obs is obs-sized
+    assert 'last_obs' in trajectory.extras.env_extras
+    assert estimate_sample_batch_nbytes(
+        env, agent, rollout_length=3,
+        env_extra_fields=env_extra_fields) == tree_nbytes(trajectory)
+
+    assert device_memory_metrics(jax.devices())[
+        'memory/peak_bytes_in_use'] > 0
@@ -0,0 +1,58 @@
+import jax.numpy as jnp
+import pytest
+
+from evorl.metrics import MetricAggregator, TrainMetric, WorkflowMetric
+from evorl.types import MISSING_REWARD, PyTreeDict
+
+from .utils import ListRecorder
+
+
+def _train_metric(i, train_episode_return):
+    return TrainMetric(
+        train_episode_return=jnp.float32(train_episode_return),
+        loss=jnp.float32(i),
+        raw_loss_dict=PyTreeDict(actor_loss=jnp.float32(-i))
+    )
+
+
+def test_metric_aggregator():
+    recorder = ListRecorder()
+    aggregator = MetricAggregator(recorder, flush_interval=4)
+
+    returns = [MISSING_REWARD, 1.0, MISSING_REWARD, 3.0,
+               MISSING_REWARD, MISSING_REWARD]
+    for i, r in enumerate(returns):
+        aggregator.add(
+            i, _train_metric(i, r),
+            latest=WorkflowMetric(iterations=jnp.int32(i+1)))
+    assert len(recorder.records) == 1
+    aggregator.flush()
+    assert len(recorder.records) == 2
+
+    step, data = recorder.records[0]
+    assert step == 3
+    assert data['iterations'] == 4
+    assert data['loss'] == pytest.approx(1.5)
+    assert data['loss_min'] == 0 and data['loss_max'] == 3
+    assert data['raw_loss_dict']['actor_loss'] == pytest.approx(-1.5)
+    assert data['train_episode_return'] == pytest.approx(2.0)
+    assert data['train_episode_return_min'] == pytest.approx(1.0)
+    assert data['train_episode_return_count'] == 2
+
+    # no finished episodes in the window
+    step, data = recorder.records[1]
+    assert step == 5
+    assert data['iterations'] == 6
+    assert data['loss'] == pytest.approx(4.5)
+    assert 'train_episode_return' not in data
+
+
+def test_metric_aggregator_no_window():
+    recorder = ListRecorder()
+    aggregator = MetricAggregator(recorder, flush_interval=1)
+    aggregator.add(0, _train_metric(0, MISSING_REWARD))
+    aggregator.add(1, _train_metric(1, 2.0))
+
+    assert recorder.records[0] == (0, dict(loss=0.0, raw_loss_dict=dict(actor_loss=0.0)))
+    assert recorder.records[1][1]['train_episode_return'] == 2.0
+    assert 'loss_min' not in recorder.records[1][1]
@@ -0,0 +1,70 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+from hydra import compose, initialize
+
+from evorl.agents.a2c import A2CWorkflow
+
+from .utils import ListRecorder
+
+
+def test_multi_seeds():
+    with initialize(config_path='../configs', version_base=None):
+        config = compose(config_name="config", overrides=[
+            "agent=a2c", "env=brax/inverted_pendulum", "seeds=[1,2,1]",
+            "num_envs=4", "rollout_length=8", "total_timesteps=96",
+            "num_eval_envs=2", "eval_episodes=2", "eval_interval=1",
+            "checkpoint.save_interval_steps=1000",
+            "agent_network.actor_hidden_layer_sizes=[16,16]",
+            "agent_network.critic_hidden_layer_sizes=[16,16]",
+        ])
+
+    workflow = A2CWorkflow.build_from_config(
+        config, enable_jit=True, enable_multi_seeds=True)
+    # the seed vmap is bound to the instance: a later single-seed build
+    # of the class is not vmapped
+    single_workflow = A2CWorkflow.build_from_config(config, enable_jit=True)
+    single_metrics, _ = single_workflow.step(
+        single_workflow.init(jax.random.PRNGKey(1)))
+    single_workflow.close()
+    assert single_metrics.loss.shape == ()
+    recorder = ListRecorder()
+    workflow.add_recorders([recorder])
+
+    keys = jnp.stack([jax.random.PRNGKey(seed) for seed in config.seeds])
+    state = workflow.init(keys)
+
+    # the stacked state matches the single-seed init
+    single_state = workflow.setup(jax.random.PRNGKey(1))
+    jax.tree_util.tree_map(
+        lambda x, y: np.testing.assert_allclose(x[0], y, rtol=1e-6, atol=1e-6),
+        state.agent_state, single_state.agent_state)
+
+    state = workflow.learn(state)
+    workflow.close()
+
+    # 3 iterations compiled once
+    assert workflow.recompile_monitor.summary()['A2CWorkflow.step']['num_traces'] == 1
+    np.testing.assert_array_equal(state.metrics.sampled_timesteps, [96]*3)
+
+    # same seeds -> same runs, different seeds -> different runs
+    params = jax.tree_util.tree_leaves(state.agent_state.params)[0]
+    np.testing.assert_allclose(params[0], params[2], rtol=1e-5, atol=1e-6)
+    assert not np.allclose(params[0], params[1])
+
+    train_records = [data for _, data in recorder.records if 'loss' in data]
+    eval_records = [data['eval'] for _, data in recorder.records if 'eval' in data]
+    assert len(train_records) == 3 and len(eval_records) == 3
+    assert len(train_records[-1]['loss']) == 3
+    assert len(eval_records[-1]['discount_returns']) == 3
+
+
+def test_multi_seeds_unsupported():
+    with initialize(config_path='../configs', version_base=None):
+        config = compose(config_name="config", overrides=[
+            "agent=a2c", "env=brax/inverted_pendulum",
+            "trajectory_dataset.train=true"])
+    with pytest.raises(ValueError):
+        A2CWorkflow.build_from_config(
+            config, enable_jit=True, enable_multi_seeds=True)
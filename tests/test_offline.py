@@ -0,0 +1,115 @@
+import threading
+import time
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+from hydra import compose, initialize
+
+from evorl.agents.bc import BCWorkflow
+from evorl.sample_batch import SampleBatch
+from evorl.trajectory_dataset import TrajectoryWriter, TrajectoryDataset, DataLoader
+
+from .utils import ListRecorder
+
+
+def _write_expert_dataset(path, T=64, B=8):
+    # obs & actions of inverted_pendulum, actions = tanh(2*obs[0])
+    obs = jax.random.normal(jax.random.PRNGKey(42), (T, B, 4))
+    dones = jnp.zeros((T, B)).at[::16].set(1)
+    writer = TrajectoryWriter(path, shard_size=100)
+    writer.write(SampleBatch(
+        obs=obs,
+        actions=jnp.tanh(2*obs[..., :1]),
+        rewards=jnp.ones((T, B)),
+        next_obs=obs,
+        dones=dones
+    ))
+    writer.close()
+
+
+def test_data_loader(tmp_path):
+    _write_expert_dataset(tmp_path)
+    dataset = TrajectoryDataset(tmp_path)
+    loader = DataLoader(dataset, batch_size=32, num_workers=2)
+    batch = loader.next()
+    loader.close()
+
+    assert batch.obs.shape == (32, 4)
+    assert isinstance(batch.obs, jax.Array)
+    np.testing.assert_allclose(
+        batch.actions, np.tanh(2*batch.obs[:, :1]), rtol=1e-5, atol=1e-6)
+
+
+def test_data_loader_close_after_error(tmp_path):
+    _write_expert_dataset(tmp_path)
+    dataset = TrajectoryDataset(tmp_path)
+    calls = []
+
+    def _failing_device_put(batch):
+        calls.append(1)
+        if len(calls) > 1:
+            raise ValueError('device_put failed')
+        return batch
+
+    # the first batch fills the queue, the error can't be queued
+    loader = DataLoader(dataset, batch_size=8, num_workers=1, prefetch=1,
+                        device_put_fn=_failing_device_put)
+    while len(calls) < 2:
+        time.sleep(0.01)
+
+    closer = threading.Thread(target=loader.close)
+    closer.start()
+    closer.join(timeout=10)
+    assert not closer.is_alive()
+
+    with pytest.raises(RuntimeError, match='closed'):
+        loader.next()
+
+
+def test_data_loader_error(tmp_path):
+    _write_expert_dataset(tmp_path)
+    dataset = TrajectoryDataset(tmp_path)
+
+    def _failing_device_put(batch):
+        raise ValueError('device_put failed')
+
+    loader = DataLoader(dataset, batch_size=8, num_workers=1,
+                        device_put_fn=_failing_device_put)
+    # every call raises instead of waiting for a batch
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match='failed') as e:
+            loader.next()
+        assert isinstance(e.value.__cause__, ValueError)
+    loader.close()
+
+
+def test_bc_workflow(tmp_path):
+    _write_expert_dataset(tmp_path)
+
+    with initialize(config_path='../configs', version_base=None):
+        config = compose(config_name="config", overrides=[
+            "agent=bc", "env=brax/inverted_pendulum",
+            f"dataset_path={tmp_path}", "num_iters=200", "eval_interval=1000",
+            "batch_size=64", "metric_aggregator.flush_interval=50",
+            "perf.sample_interval=10", "memory.record=true",
+            "agent_network.actor_hidden_layer_sizes=[32,32]"
+        ])
+
+    workflow = BCWorkflow.build_from_config(config, enable_jit=True)
+    recorder = ListRecorder()
+    workflow.add_recorders([recorder])
+    state = workflow.init(jax.random.PRNGKey(42))
+    state = workflow.learn(state)
+    workflow.close()
+
+    train_records = [data for _, data in recorder.records if 'loss' in data]
+    assert len(train_records) == 4
+    assert train_records[-1]['loss'] < 0.2 * train_records[0]['loss']
+    assert train_records[-1]['sampled_timesteps'] == 200*64
+
+    # perf & memory metrics are only written on the sampled iterations
+    perf_steps = [step for step, data in recorder.records
+                  if any(k.startswith(('perf/', 'memory/')) for k in data)]
+    assert perf_steps == list(range(9, 200, 10))
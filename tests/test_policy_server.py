@@ -0,0 +1,109 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jax
+import numpy as np
+import pytest
+
+pytest.importorskip("flatbuffers")
+
+from evorl.agents.a2c import A2CAgent
+from evorl.envs import create_env
+from evorl.export import export_policy
+from evorl.policy_server import PolicyServer, SocketPolicyClient, serve_socket
+from evorl.sample_batch import SampleBatch
+
+
+def _agent():
+    env = create_env('inverted_pendulum', 'brax', parallel=1, episode_length=100)
+    agent = A2CAgent(
+        action_space=env.action_space,
+        obs_space=env.obs_space,
+        normalize_obs=False,
+        continuous_action=True
+    )
+    return agent, agent.init(jax.random.PRNGKey(42))
+
+
+def test_policy_server():
+    agent, agent_state = _agent()
+    obs = np.asarray(jax.random.normal(jax.random.PRNGKey(1), (64, 4)))
+    expected, _ = agent.evaluate_actions(
+        agent_state, SampleBatch(obs=obs), jax.random.PRNGKey(0))
+
+    with PolicyServer.from_agent(
+            agent, agent_state, batch_sizes=[1, 8, 32], max_latency_ms=20) as server:
+        with ThreadPoolExecutor(16) as pool:
+            actions = list(pool.map(server, obs))
+
+    np.testing.assert_allclose(np.stack(actions), expected, rtol=1e-5, atol=1e-6)
+
+    stats = server.stats()
+    assert stats['num_requests'] == 64
+    assert stats['mean_batch_size'] > 1
+    assert stats['latency_ms']['p50'] <= stats['latency_ms']['p99'] <= stats['latency_ms']['max']
+    assert sum(stats['padded_batch_sizes'].values()) == stats['num_batches']
+
+
+def test_policy_server_not_running():
+    agent, agent_state = _agent()
+    server = PolicyServer.from_agent(agent, agent_state, batch_sizes=[1])
+    obs = np.zeros((4,), dtype=np.float32)
+
+    # the request would never be served
+    with pytest.raises(RuntimeError):
+        server.submit(obs)
+
+    with server:
+        server(obs)
+
+    with pytest.raises(RuntimeError):
+        server.submit(obs)
+
+
+def test_policy_server_close_with_submits():
+    agent, agent_state = _agent()
+    server = PolicyServer.from_agent(
+        agent, agent_state, batch_sizes=[1, 8], max_latency_ms=1).start()
+    obs = np.zeros((4,), dtype=np.float32)
+    futures = []
+
+    def _submit():
+        while True:
+            try:
+                futures.append(server.submit(obs))
+            except RuntimeError:
+                return
+
+    with ThreadPoolExecutor(4) as pool:
+        submits = [pool.submit(_submit) for _ in range(4)]
+        while len(futures) < 16:
+            time.sleep(0.001)
+        server.close()
+        for f in submits:
+            f.result(timeout=10)
+
+    # every accepted request is served
+    for future in futures:
+        assert future.result(timeout=10).shape == (1,)
+
+
+def test_socket_policy_server(tmp_path):
+    agent, agent_state = _agent()
+    export_policy(agent, agent_state, tmp_path, batch_sizes=[1, 4])
+    obs = np.asarray(jax.random.normal(jax.random.PRNGKey(1), (8, 4)))
+    expected, _ = agent.evaluate_actions(
+        agent_state, SampleBatch(obs=obs), jax.random.PRNGKey(0))
+
+    with PolicyServer.from_exported(tmp_path) as server:
+        socket_server = serve_socket(server, port=0)
+
+        def _request(i):
+            with SocketPolicyClient(*socket_server.server_address) as client:
+                return client(obs[i])
+
+        with ThreadPoolExecutor(4) as pool:
+            actions = list(pool.map(_request, range(8)))
+        socket_server.shutdown()
+
+    np.testing.assert_allclose(np.stack(actions), expected, rtol=1e-5, atol=1e-6)
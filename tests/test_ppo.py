@@ -0,0 +1,30 @@
+import jax
+import jax.numpy as jnp
+from hydra import compose, initialize
+
+from evorl.agents.ppo import PPOWorkflow
+
+
+def test_ppo_num_epochs():
+    with initialize(config_path='../configs', version_base=None):
+        config = compose(config_name="config", overrides=[
+            "agent=ppo", "env=brax/inverted_pendulum",
+            "num_envs=4", "rollout_length=8", "minibatch_size=8", "num_epochs=2",
+            "checkpoint.save_interval_steps=1000",
+            "agent_network.actor_hidden_layer_sizes=[16,16]",
+            "agent_network.critic_hidden_layer_sizes=[16,16]",
+        ])
+
+    workflow = PPOWorkflow.build_from_config(config, enable_jit=False)
+    assert workflow.num_minibatches == 4
+    assert workflow.num_grad_steps_per_iteration == 8
+
+    state = workflow.init(jax.random.PRNGKey(42))
+    train_metrics, new_state = jax.jit(workflow.step)(state)
+    workflow.close()
+
+    assert jnp.isfinite(train_metrics.loss)
+    assert new_state.metrics.sampled_timesteps == 32
+    # params are updated
+    assert not jax.tree_util.tree_all(jax.tree_util.tree_map(
+        jnp.allclose, new_state.agent_state.params, state.agent_state.params))
@@ -0,0 +1,38 @@
+import jax
+import jax.numpy as jnp
+
+from evorl.utils.profiler import TraceWindow
+
+
+def test_trace_window(tmp_path):
+    log_dir = tmp_path / 'profile'
+    trace_window = TraceWindow(log_dir, start_iteration=1, num_iterations=2)
+    f = jax.jit(lambda x: x * 2)
+    x = jnp.ones((3,))
+
+    tracing = []
+    for i in range(4):
+        with trace_window.step(i):
+            x = f(x)
+            tracing.append(trace_window.tracing)
+        trace_window.maybe_stop(i, x)
+        if i == 1:
+            # stops at the end of the window, not after its first iteration
+            assert trace_window.tracing
+
+    assert tracing == [False, True, True, False]
+    assert not trace_window.tracing
+    assert log_dir.is_dir()
+    assert any(p.is_file() for p in log_dir.rglob('*'))
+
+
+def test_trace_window_disabled(tmp_path):
+    log_dir = tmp_path / 'profile'
+    trace_window = TraceWindow(log_dir, enable=False)
+
+    with trace_window.step(0):
+        pass
+    trace_window.maybe_stop(0)
+
+    assert not trace_window.tracing
+    assert not log_dir.exists()
@@ -0,0 +1,81 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from evorl.agents.a2c import A2CAgent
+from evorl.ec import MultiObjectiveBraxProblem
+from evorl.agents.ec import DeterministicECAgent
+from evorl.envs import create_env, create_wrapped_brax_env
+from evorl.networks import (
+    MLP, QuantizedMLP, quantize_mlp, quantize_mlp_params,
+    quantize_policy_network, quantize_policy_params
+)
+from evorl.sample_batch import SampleBatch
+
+
+@pytest.mark.parametrize("mode,atol", [("int8", 2e-2), ("bfloat16", 5e-2)])
+def test_quantized_mlp(mode, atol):
+    mlp = MLP(layer_sizes=[64, 64, 4])
+    x = jax.random.normal(jax.random.PRNGKey(1), (32, 17))
+    params = mlp.init(jax.random.PRNGKey(0), x)
+
+    qmlp = quantize_mlp(mlp, mode)
+    qparams = quantize_mlp_params(params, mode)
+    assert isinstance(qmlp, QuantizedMLP)
+    # same structure as the freshly initialized quantized module
+    assert jax.tree_util.tree_structure(qparams) == \
+        jax.tree_util.tree_structure(qmlp.init(jax.random.PRNGKey(0), x))
+    assert qparams['params']['hidden_0']['kernel'].dtype == jnp.dtype(mode)
+
+    y = mlp.apply(params, x)
+    qy = qmlp.apply(qparams, x)
+    assert qy.dtype == jnp.float32
+    np.testing.assert_allclose(qy, y, atol=atol * np.abs(y).max())
+
+    with pytest.raises(ValueError):
+        quantize_mlp(mlp, 'int4')
+
+
+def test_quantized_evaluate_actions():
+    env = create_env('inverted_pendulum', 'brax', parallel=1)
+    agent = A2CAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        normalize_obs=True, continuous_action=True)
+    agent_state = agent.init(jax.random.PRNGKey(42))
+    sample_batch = SampleBatch(
+        obs=jax.random.normal(jax.random.PRNGKey(1), (16, *env.obs_space.shape)))
+    key = jax.random.PRNGKey(0)
+
+    qagent = quantize_policy_network(agent, 'int8')
+    assert isinstance(agent.policy_network, MLP)
+    actions, _ = agent.evaluate_actions(agent_state, sample_batch, key)
+    qactions, _ = qagent.evaluate_actions(
+        quantize_policy_params(agent_state, 'int8'), sample_batch, key)
+    np.testing.assert_allclose(qactions, actions, atol=2e-2)
+
+
+def test_quantized_ec_problem():
+    env = create_wrapped_brax_env(
+        'inverted_pendulum', episode_length=8, parallel=2, autoreset=False)
+    agent = DeterministicECAgent(
+        action_space=env.action_space, obs_space=env.obs_space,
+        actor_hidden_layer_sizes=(16, 16), normalize_obs=False)
+    problems = {
+        quantization: MultiObjectiveBraxProblem(
+            agent=agent, env=env, num_episodes=2, max_episode_steps=8,
+            metric_names=('reward',), quantization=quantization)
+        for quantization in (None, 'int8')
+    }
+    agent_state = agent.init(jax.random.PRNGKey(42))
+    pop_agent_state = jax.tree_util.tree_map(
+        lambda x: jnp.stack([x, 2 * x]), agent_state)
+
+    objectives = {}
+    for quantization, problem in problems.items():
+        state = problem.init(jax.random.PRNGKey(0))
+        objectives[quantization], _ = jax.jit(problem.evaluate)(
+            state, pop_agent_state)
+    assert objectives['int8'].shape == (2, 1)
+    np.testing.assert_allclose(
+        objectives['int8'], objectives[None], rtol=0.1, atol=0.5)
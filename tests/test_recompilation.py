@@ -0,0 +1,40 @@
+import jax
+import jax.numpy as jnp
+import pytest
+
+from evorl.utils.jax_utils import jit_method
+from evorl.utils.recompilation import (
+    RecompilationMonitor, RecompilationError, track_traces
+)
+
+
+class _Model:
+    def __init__(self, recompile_monitor):
+        self.recompile_monitor = recompile_monitor
+
+    @jit_method(static_argnums=(0,))
+    @track_traces
+    def f(self, x):
+        return x * 2
+
+
+def test_recompilation_monitor():
+    monitor = RecompilationMonitor(raise_after_steps=3)
+    model = _Model(monitor)
+    name = _Model.f.__qualname__
+
+    x = jnp.ones((3,))
+    model.f(x)
+    model.f(x)
+    assert monitor.num_traces[name] == 1
+    assert monitor.num_compiles[name] == 1
+
+    # shape change before raise_after_steps: only logged
+    model.f(jnp.ones((4,)))
+    assert monitor.num_traces[name] == 2
+    assert monitor.num_compiles[name] == 2
+
+    monitor.step(3)
+    model.f(x)  # cached
+    with pytest.raises(RecompilationError, match=r"float32\[4\] -> float32\[5\]"):
+        model.f(jnp.ones((5,)))
@@ -0,0 +1,120 @@
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+import chex
+import pytest
+from jax.sharding import PartitionSpec
+from jax.experimental.shard_map import shard_map
+
+from hydra import compose, initialize
+import orbax.checkpoint as ocp
+
+from evorl.agents.a2c import A2CWorkflow
+from evorl.cost_analysis import analyze_rl_workflow
+from evorl.distributed import PMAP_AXIS_NAME
+from evorl.distributed.sharding import (
+    create_mesh, get_sharded_size, param_sharded_spec,
+    tree_device_put, tree_all_gather, tree_local_shard
+)
+from evorl.utils import orbax_utils
+
+
+def test_param_sharded_spec():
+    num_devices = 4
+    mesh = create_mesh(jax.devices()[:num_devices], PMAP_AXIS_NAME)
+    params = dict(
+        kernel=jnp.arange(8*3, dtype=jnp.float32).reshape(8, 3),
+        bias=jnp.arange(3, dtype=jnp.float32),
+        count=jnp.zeros(())
+    )
+    specs = param_sharded_spec(params, PMAP_AXIS_NAME, num_devices)
+    assert specs['kernel'] == PartitionSpec(PMAP_AXIS_NAME)
+    assert specs['bias'] == PartitionSpec()
+    assert specs['count'] == PartitionSpec()
+
+    sharded_params = tree_device_put(params, mesh, specs)
+
+    def _roundtrip(x):
+        full = tree_all_gather(x, specs, PMAP_AXIS_NAME)
+        chex.assert_shape(full['kernel'], (8, 3))
+        return tree_local_shard(full, specs, PMAP_AXIS_NAME, num_devices)
+
+    out = jax.jit(shard_map(
+        _roundtrip, mesh, in_specs=(specs,), out_specs=specs, check_rep=False
+    ))(sharded_params)
+
+    chex.assert_trees_all_close(out, params)
+    assert get_sharded_size(8, 4) == 2
+    with pytest.raises(ValueError, match="num_envs"):
+        get_sharded_size(6, 4, "num_envs")
+
+
+def test_a2c_shard_map(tmp_path):
+    with initialize(config_path='../configs', version_base=None):
+        cfg = compose(
+            config_name="config",
+            overrides=["agent=a2c", "env=brax/inverted_pendulum",
+                       "parallel.backend=shard_map", "parallel.shard_params=true"]
+        )
+
+    cfg.num_envs = 8
+    cfg.rollout_length = 8
+    cfg.num_eval_envs = 4
+    cfg.eval_episodes = 4
+
+    devices = jax.devices()[:4]
+    class_step = A2CWorkflow.step
+    learner = A2CWorkflow.build_from_config(
+        cfg, enable_multi_devices=True, devices=devices)
+    # shard_map is bound to the instance, not to the class
+    assert A2CWorkflow.step is class_step
+    state = learner.init(jax.random.PRNGKey(42))
+
+    # 8 envs -> 2 envs per device
+    chex.assert_shape(state.env_state.obs, (8, *learner.env.obs_space.shape))
+
+    train_metric, state = learner.step(state)
+    eval_metric, state = learner.evaluate(state)
+    assert state.metrics.sampled_timesteps == 8*8
+
+    # sharded params and sharded env_state
+    ckpt_state = dict(
+        agent_state=state.agent_state,
+        env_obs=state.env_state.obs
+    )
+    abstract_state = jtu.tree_map(ocp.utils.to_shape_dtype_struct, ckpt_state)
+    path = tmp_path/'sharded_ckpt'
+    orbax_utils.save(path, ckpt_state)
+    restored_state = orbax_utils.load(path, abstract_state)
+
+    chex.assert_trees_all_close(restored_state, ckpt_state)
+    for x, y in zip(jtu.tree_leaves(restored_state), jtu.tree_leaves(ckpt_state)):
+        assert x.sharding.is_equivalent_to(y.sharding, x.ndim)
+
+    learner.close()
+
+
+@pytest.mark.parametrize("backend", ["shard_map", "pmap"])
+def test_a2c_cost_analysis_multi_devices(backend):
+    with initialize(config_path='../configs', version_base=None):
+        cfg = compose(
+            config_name="config",
+            overrides=["agent=a2c", "env=brax/inverted_pendulum",
+                       f"parallel.backend={backend}",
+                       "num_envs=4", "rollout_length=8",
+                       "num_eval_envs=2", "eval_episodes=2",
+                       "agent_network.actor_hidden_layer_sizes=[16]",
+                       "agent_network.critic_hidden_layer_sizes=[16]"]
+        )
+
+    learner = A2CWorkflow.build_from_config(
+        cfg, enable_multi_devices=True, devices=jax.devices()[:2])
+    state = learner.init(jax.random.PRNGKey(42))
+
+    # lowered with the multi-devices wrapper of the instance
+    report = analyze_rl_workflow(learner, state, repeats=1)
+    for name in ('step', 'evaluate'):
+        assert report[name]['flops'] > 0
+        assert report[name]['time'] > 0
+
+    learner.close()
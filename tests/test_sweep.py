@@ -0,0 +1,37 @@
+import os
+
+from evorl.sweep import SweepScheduler, cpu_slots, expand_sweep, sweep_report
+
+
+def test_expand_sweep():
+    jobs = expand_sweep(['agent=a2c,ppo', 'env=brax/ant', 'seed=range(2)'])
+    assert jobs == [
+        ['agent=a2c', 'env=brax/ant', 'seed=0'],
+        ['agent=a2c', 'env=brax/ant', 'seed=1'],
+        ['agent=ppo', 'env=brax/ant', 'seed=0'],
+        ['agent=ppo', 'env=brax/ant', 'seed=1'],
+    ]
+
+
+def test_cpu_slots():
+    num_cpus = len(os.sched_getaffinity(0))
+    slots = cpu_slots(2, cpu_devices_per_slot=2)
+    assert len(slots) == 2
+    assert all(len(slot.cpus) == max(num_cpus // 2, 1) for slot in slots)
+    if num_cpus >= 2:
+        assert not set(slots[0].cpus) & set(slots[1].cpus)
+    assert '--xla_force_host_platform_device_count=2' in slots[0].env['XLA_FLAGS']
+
+
+def test_sweep_scheduler(tmp_path):
+    jobs = expand_sweep(['total_timesteps=100,200', 'fail=false,true'])
+    scheduler = SweepScheduler(
+        jobs, cpu_slots(2), tmp_path, module='tests.sweep_job')
+    makespan = scheduler.run(poll_interval=0.1)
+    report = sweep_report(scheduler, makespan)
+
+    assert report['num_jobs'] == 4
+    assert [job['return_code'] for job in report['jobs']] == [0, 1, 0, 1]
+    assert [job['sampled_timesteps'] for job in report['jobs']] == [100, 100, 200, 200]
+    assert all(job['steady_env_steps_per_sec'] == 100.0 for job in report['jobs'])
+    assert 0 < report['slot_utilization'] <= 1
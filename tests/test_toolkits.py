@@ -4,8 +4,11 @@ import chex
 
 import pytest
 
-from evorl.utils.toolkits import compute_gae, compute_discount_return
-from evorl.types import SampleBatch
+from evorl.utils.toolkits import (
+    compute_gae, compute_discount_return, compute_discount_return_mod,
+    reverse_discounted_cumsum, minibatch_indices, gather_minibatch
+)
+from evorl.sample_batch import SampleBatch
 
 
 
@@ -103,4 +106,77 @@ def test_discount_return_with_dones():
         discount
     )
     discount_return_real = _real_discount_return(rewards, discount, term_steps)
-    chex.assert_trees_all_close(discount_return, discount_return_real)
\ No newline at end of file
+    chex.assert_trees_all_close(discount_return, discount_return_real)
+
+
+@pytest.mark.parametrize('T,B', [(1, 3), (11, 7), (300, 5)])
+def test_reverse_discounted_cumsum(T, B):
+    keys = jax.random.split(jax.random.PRNGKey(42), 2)
+    x = jax.random.normal(keys[0], (T, B))
+    factors = 0.99*(jax.random.uniform(keys[1], (T, B)) > 0.1)
+
+    y_seq = reverse_discounted_cumsum(x, factors, associative=False)
+    y_assoc = reverse_discounted_cumsum(x, factors, associative=True)
+
+    chex.assert_trees_all_close(y_assoc, y_seq, atol=1e-5, rtol=1e-5)
+    chex.assert_trees_all_close(y_seq[-1], x[-1])
+    chex.assert_trees_all_close(
+        y_seq[:-1], x[:-1] + factors[:-1]*y_seq[1:], atol=1e-5, rtol=1e-5)
+
+
+def test_discount_return_mod():
+    T = 10
+    rewards = jnp.arange(1, T+1, dtype=jnp.float32)[:, None]
+    dones = jnp.zeros_like(rewards)
+    # episodes: [prev..2], [3..6], [7..9] (incomplete)
+    dones = dones.at[2, 0].set(1).at[6, 0].set(1)
+    discount = 0.9
+
+    def _real_discount_return(rewards):
+        return sum(r * discount**i for i, r in enumerate(rewards))
+
+    discount_return = compute_discount_return_mod(
+        rewards, dones, jnp.ones((1,)), discount)
+    expected = (_real_discount_return([1., 2., 3.]) +
+                _real_discount_return([4., 5., 6., 7.])) / 2
+    chex.assert_trees_all_close(discount_return, jnp.array([expected]))
+
+    # the first episode is incomplete
+    discount_return = compute_discount_return_mod(
+        rewards, dones, jnp.zeros((1,)), discount)
+    expected = _real_discount_return([4., 5., 6., 7.])
+    chex.assert_trees_all_close(discount_return, jnp.array([expected]))
+
+    # no complete episode in the window
+    discount_return = compute_discount_return_mod(
+        rewards, jnp.zeros_like(rewards), jnp.zeros((1,)), discount)
+    chex.assert_trees_all_close(discount_return, jnp.zeros((1,)))
+
+
+@pytest.mark.parametrize('num_epochs', [1, 3])
+def test_minibatch_indices(num_epochs):
+    key = jax.random.PRNGKey(42)
+    batch_size, minibatch_size = 50, 8
+    num_minibatches = batch_size // minibatch_size
+    batch = SampleBatch(
+        obs=jnp.arange(batch_size*3, dtype=jnp.float32).reshape(batch_size, 3),
+        rewards=jnp.arange(batch_size, dtype=jnp.float32))
+
+    indices = minibatch_indices(key, batch_size, minibatch_size, num_epochs)
+    assert indices.shape == (num_epochs*num_minibatches, minibatch_size)
+
+    epochs = indices.reshape(num_epochs, -1)
+    for epoch in epochs:
+        # no repeated row in an epoch
+        assert len(set(epoch.tolist())) == num_minibatches*minibatch_size
+    if num_epochs > 1:
+        assert not jnp.array_equal(epochs[0], epochs[1])
+
+    minibatches = jax.vmap(gather_minibatch, in_axes=(None, 0))(batch, indices)
+    chex.assert_trees_all_close(minibatches.rewards, indices.astype(jnp.float32))
+
+    if num_epochs == 1:
+        # same minibatches as shuffling every leaf with the key
+        shuffled = jax.random.permutation(key, batch.obs)[
+            :num_minibatches*minibatch_size].reshape(num_minibatches, minibatch_size, 3)
+        chex.assert_trees_all_close(minibatches.obs, shuffled)
@@ -0,0 +1,77 @@
+import jax
+import numpy as np
+
+from evorl.agents.random_agent import RandomAgent
+from evorl.envs import create_env
+from evorl.rollout import rollout, eval_rollout_episode
+from evorl.trajectory_dataset import TrajectoryWriter, TrajectoryDataset
+
+
+def test_trajectory_writer(tmp_path):
+    env = create_env('inverted_pendulum', 'brax', parallel=3,
+                     autoreset=True, episode_length=20)
+    agent = RandomAgent(action_space=env.action_space, obs_space=env.obs_space)
+    writer = TrajectoryWriter(tmp_path/'train', shard_size=50)
+
+    @jax.jit
+    def _step(env_state, key):
+        env_state, trajectory = rollout(
+            env, agent, env_state, agent.init(key), key, rollout_length=16)
+        writer.write_async(trajectory)
+        return env_state, trajectory
+
+    key = jax.random.PRNGKey(42)
+    env_state = env.reset(key)
+    trajectories = []
+    for _ in range(5):
+        key, rollout_key = jax.random.split(key)
+        env_state, trajectory = _step(env_state, rollout_key)
+        trajectories.append(jax.device_get(trajectory))
+    writer.close()
+
+    dataset = TrajectoryDataset(tmp_path/'train')
+    assert len(dataset) == 5*16*3
+    assert dataset.shard_rows == [50, 50, 50, 50, 40]
+
+    # each episode of env 0 is contiguous
+    obs = np.concatenate([t.obs for t in trajectories])[:, 0]
+    dones = np.concatenate([t.dones for t in trajectories])[:, 0]
+    first_len = int(np.flatnonzero(dones)[0]) + 1
+    episodes = [dataset.episode(i) for i in range(dataset.num_episodes)]
+    assert any(
+        len(ep['obs']) == first_len and np.allclose(ep['obs'], obs[:first_len])
+        for ep in episodes)
+    for i in dataset.complete_episodes():
+        assert episodes[i]['dones'][-1] == 1
+        assert episodes[i]['dones'][:-1].sum() == 0
+
+    rows = np.array([0, 49, 50, len(dataset)-1])
+    batch = dataset.gather(rows)
+    np.testing.assert_array_equal(
+        batch['rewards'], np.concatenate(
+            [dataset.read(r, r+1)['rewards'] for r in rows]))
+
+
+def test_trajectory_writer_episodic(tmp_path):
+    env = create_env('inverted_pendulum', 'brax', parallel=4,
+                     autoreset=False, episode_length=30)
+    agent = RandomAgent(action_space=env.action_space, obs_space=env.obs_space)
+    writer = TrajectoryWriter(tmp_path/'eval', shard_size=64, episodic=True)
+
+    @jax.jit
+    def _evaluate(key):
+        env_state = env.reset(key)
+        _, trajectory = eval_rollout_episode(
+            env, agent, env_state, agent.init(key), key, 30)
+        writer.write_async(trajectory)
+        return trajectory
+
+    trajectory = _evaluate(jax.random.PRNGKey(42))
+    writer.close()
+
+    dataset = TrajectoryDataset(tmp_path/'eval')
+    dones = np.asarray(trajectory.dones)
+    episode_lengths = ((np.cumsum(dones, axis=0) - dones) == 0).sum(axis=0)
+    assert dataset.num_episodes == 4
+    np.testing.assert_array_equal(dataset.episodes[:, 1], episode_lengths)
+    np.testing.assert_array_equal(dataset.episodes[:, 2], dones.max(axis=0))
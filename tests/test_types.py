@@ -0,0 +1,46 @@
+import pickle
+
+import jax
+import jax.numpy as jnp
+import jax.tree_util as jtu
+
+from evorl.types import PyTreeDict
+
+
+def test_pytree_dict():
+    d = PyTreeDict(a=1, b={'c': 2, 'd': [{'e': 3}, 4]})
+    assert isinstance(d.b, PyTreeDict) and isinstance(d.b.d[0], PyTreeDict)
+    assert d.b.c == d['b']['c'] == 2
+
+    # attributes and items stay in sync
+    d.x = 5
+    assert d['x'] == 5
+    del d['x']
+    assert not hasattr(d, 'x') and 'x' not in d
+    assert d.pop('a') == 1 and not hasattr(d, 'a')
+
+    # already converted children are kept
+    child = PyTreeDict(y=1)
+    assert PyTreeDict(child=child).child is child
+    clone = d.replace(z=6)
+    assert clone.b is d.b and clone.z == 6 and 'z' not in d
+
+    restored = pickle.loads(pickle.dumps(d))
+    assert restored == d and restored.b.d[0].e == 3
+
+
+def test_pytree_dict_pytree():
+    d = PyTreeDict(b=jnp.ones(2), a=PyTreeDict(c=jnp.zeros(())))
+    leaves, treedef = jtu.tree_flatten(d)
+
+    # insertion order, and the keys in the key paths
+    paths = [jtu.keystr(path) for path, _ in jtu.tree_flatten_with_path(d)[0]]
+    assert paths == ["['b']", "['a']['c']"]
+
+    restored = jtu.tree_unflatten(treedef, leaves)
+    assert isinstance(restored.a, PyTreeDict)
+    assert restored.a.c is leaves[1]
+
+    doubled = jax.jit(lambda t: jtu.tree_map(lambda x: x * 2, t))(d)
+    assert isinstance(doubled, PyTreeDict) and list(doubled.keys()) == ['b', 'a']
+    assert float(doubled.b[0]) == 2.0
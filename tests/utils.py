@@ -1,4 +1,22 @@
 import os
 
+from evorl.recorders import Recorder
+
+
 def disable_gpu_preallocation():
-    os.environ['XLA_PYTHON_CLIENT_PREALLOCATE'] = 'false'
\ No newline at end of file
+    os.environ['XLA_PYTHON_CLIENT_PREALLOCATE'] = 'false'
+
+
+class ListRecorder(Recorder):
+    """
+        Keep the written (step, data) records in memory.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def write(self, data, step=None):
+        self.records.append((step, data))
+
+    def close(self):
+        pass